@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from eventos_processo import ler_do_fim
+
+logger = logging.getLogger(__name__)
+
+CAMINHO_EVENTOS = os.environ.get('MONITORAMENTO_ALARMES', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados', 'alarmes', 'eventos.jsonl'))
+
+# Ao passar deste tamanho o arquivo de eventos é rotacionado (eventos.jsonl.1,
+# .2, ...); os arquivos além de ARQUIVOS_ROTACIONADOS são descartados
+TAMANHO_MAXIMO_EVENTOS = 10 * 1024 * 1024
+ARQUIVOS_ROTACIONADOS = 3
+
+# Valores padrão; cada sensor pode sobrescrever com as chaves 'histerese',
+# 'amostras_alarme' e 'taxa_maxima' (°C por minuto, desligada se ausente)
+HISTERESE_PADRAO = 0.5
+AMOSTRAS_PADRAO = 3
+
+# Estados de limite
+NORMAL = 0
+BAIXA = 1
+ALTA = 2
+NOMES_ESTADO = {BAIXA: 'baixa', ALTA: 'alta'}
+
+def _numero(valor):
+    if valor is None or valor == '':
+        return np.nan
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return np.nan
+
+# ===== REGISTRO DE EVENTOS =====
+
+class RegistroEventos:
+    # Arquivo JSON Lines só de acréscimo: uma linha por mudança de estado
+
+    def __init__(self, caminho=CAMINHO_EVENTOS, tamanho_maximo=TAMANHO_MAXIMO_EVENTOS, rotacionados=ARQUIVOS_ROTACIONADOS):
+        self.caminho = caminho
+        self.tamanho_maximo = tamanho_maximo
+        self.rotacionados = rotacionados
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+
+    def anexar(self, eventos):
+        if not eventos:
+            return
+        linhas = ''.join(json.dumps(evento, ensure_ascii=False) + '\n' for evento in eventos)
+        with self._lock:
+            with open(self.caminho, 'a', encoding='utf-8') as arquivo:
+                arquivo.write(linhas)
+                tamanho = arquivo.tell()
+            if tamanho > self.tamanho_maximo:
+                self._rotacionar()
+
+    def _arquivos(self):
+        # Do mais novo para o mais antigo
+        return [self.caminho] + [f'{self.caminho}.{indice}' for indice in range(1, self.rotacionados + 1)]
+
+    def _rotacionar(self):
+        arquivos = self._arquivos()
+        for origem, destino in reversed(list(zip(arquivos, arquivos[1:]))):
+            if os.path.exists(origem):
+                os.replace(origem, destino)
+
+    def ultimos(self, limite=100, sensor_id=None):
+        filtro = None if sensor_id is None else (lambda evento: evento['sensor_id'] == sensor_id)
+        eventos = []
+        for caminho in self._arquivos():
+            if len(eventos) >= limite:
+                break
+            eventos += ler_do_fim(caminho, limite - len(eventos), filtro)
+        return eventos
+
+# ===== MOTOR DE ALARMES =====
+
+class MotorAlarmes:
+    # Avalia cada lote de leituras da aquisição de uma vez, com arrays NumPy
+    # indexados pela posição do sensor. Regras:
+    #   - limite: abaixo de temp_min ou acima de temp_max; só volta ao normal
+    #     depois de recuar 'histerese' graus para dentro da faixa
+    #   - taxa: variação entre leituras consecutivas acima de taxa_maxima
+    #   - debounce: a mudança de estado só vale após N amostras seguidas
+    # Mudanças de estado vão para o registro de eventos e para os ouvintes.
+
+    def __init__(self, obter_sensores, obter_versao, registro=None):
+        self.obter_sensores = obter_sensores
+        self.obter_versao = obter_versao
+        self.registro = registro or RegistroEventos()
+        # Funções chamadas com a lista de eventos de cada lote
+        self.ouvintes = []
+        self.versao = 0
+        self._lock = threading.Lock()
+        self._versao_config = None
+        self._posicao = {}
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._configurar_arrays(0)
+
+    def _configurar_arrays(self, total):
+        self.minimo = np.full(total, np.nan)
+        self.maximo = np.full(total, np.nan)
+        self.ativo = np.zeros(total, dtype=bool)
+        self.histerese = np.full(total, HISTERESE_PADRAO)
+        self.amostras = np.full(total, AMOSTRAS_PADRAO, dtype=np.int32)
+        self.taxa_maxima = np.full(total, np.nan)
+        self.estado = np.zeros(total, dtype=np.int8)
+        self.contador = np.zeros(total, dtype=np.int32)
+        self.estado_taxa = np.zeros(total, dtype=bool)
+        self.contador_taxa = np.zeros(total, dtype=np.int32)
+        self.ultimo_valor = np.full(total, np.nan)
+        self.ultimo_tempo = np.full(total, np.nan)
+
+    def _recarregar(self):
+        # Refaz a configuração quando os sensores mudam, preservando o estado
+        # dos que continuam existindo
+        sensores = list(self.obter_sensores())
+        anteriores = {sid: pos for sid, pos in self._posicao.items()}
+        estado_antigo = (self.estado, self.contador, self.estado_taxa, self.contador_taxa, self.ultimo_valor, self.ultimo_tempo)
+
+        self._configurar_arrays(len(sensores))
+        self._posicao = {}
+        for pos, sensor in enumerate(sensores):
+            self._posicao[sensor['id']] = pos
+            self.minimo[pos] = _numero(sensor.get('temp_min'))
+            self.maximo[pos] = _numero(sensor.get('temp_max'))
+            self.ativo[pos] = bool(sensor.get('alerta_ativo'))
+            histerese = _numero(sensor.get('histerese'))
+            if not np.isnan(histerese):
+                self.histerese[pos] = histerese
+            if sensor.get('amostras_alarme'):
+                self.amostras[pos] = max(int(sensor['amostras_alarme']), 1)
+            self.taxa_maxima[pos] = _numero(sensor.get('taxa_maxima'))
+            antiga = anteriores.get(sensor['id'])
+            if antiga is not None:
+                for atual, antigo in zip(
+                    (self.estado, self.contador, self.estado_taxa, self.contador_taxa, self.ultimo_valor, self.ultimo_tempo),
+                    estado_antigo
+                ):
+                    atual[pos] = antigo[antiga]
+        self._ids = np.array([sensor['id'] for sensor in sensores], dtype=np.int64)
+
+    def avaliar(self, lote):
+        with self._lock:
+            versao_config = self.obter_versao()
+            if versao_config != self._versao_config:
+                self._recarregar()
+                self._versao_config = versao_config
+
+            validas = [l for l in lote if l['status'] == 'ok' and l['sensor_id'] in self._posicao]
+            if not validas:
+                return []
+            pos = np.fromiter((self._posicao[l['sensor_id']] for l in validas), dtype=np.int64, count=len(validas))
+            valor = np.fromiter((l['temperatura'] for l in validas), dtype=np.float64, count=len(validas))
+            tempo = np.fromiter((l['timestamp'] for l in validas), dtype=np.float64, count=len(validas))
+
+            eventos = self._avaliar_limites(pos, valor, tempo) + self._avaliar_taxa(pos, valor, tempo)
+            self.ultimo_valor[pos] = valor
+            self.ultimo_tempo[pos] = tempo
+
+            if eventos:
+                self.versao += 1
+
+        if eventos:
+            self.registro.anexar(eventos)
+            for ouvinte in self.ouvintes:
+                try:
+                    ouvinte(eventos)
+                except Exception:
+                    logger.exception('Erro ao processar eventos de alarme')
+        return eventos
+
+    def _avaliar_limites(self, pos, valor, tempo):
+        minimo = self.minimo[pos]
+        maximo = self.maximo[pos]
+        histerese = self.histerese[pos]
+        estado = self.estado[pos]
+
+        # Comparações com NaN (limite não configurado) são sempre falsas
+        with np.errstate(invalid='ignore'):
+            acima = valor > maximo
+            abaixo = valor < minimo
+            # Histerese: quem já está em alarme só sai ao recuar para dentro da faixa
+            acima |= (estado == ALTA) & (valor > maximo - histerese)
+            abaixo |= (estado == BAIXA) & (valor < minimo + histerese)
+        candidato = np.where(acima, ALTA, np.where(abaixo, BAIXA, NORMAL)).astype(np.int8)
+        candidato[~self.ativo[pos]] = NORMAL
+
+        mudou, contador = self._debounce(candidato != estado, self.contador[pos], self.amostras[pos])
+        self.contador[pos] = contador
+        novo = np.where(mudou, candidato, estado)
+        self.estado[pos] = novo
+
+        eventos = []
+        for i in np.flatnonzero(mudou):
+            p = pos[i]
+            anterior, atual = int(estado[i]), int(novo[i])
+            if anterior != NORMAL:
+                eventos.append(self._evento(p, NOMES_ESTADO[anterior], 'fim', valor[i], tempo[i]))
+            if atual != NORMAL:
+                eventos.append(self._evento(p, NOMES_ESTADO[atual], 'inicio', valor[i], tempo[i]))
+        return eventos
+
+    def _avaliar_taxa(self, pos, valor, tempo):
+        # °C por minuto entre a leitura atual e a anterior do mesmo sensor
+        with np.errstate(invalid='ignore', divide='ignore'):
+            intervalo = tempo - self.ultimo_tempo[pos]
+            taxa = np.abs(valor - self.ultimo_valor[pos]) / intervalo * 60
+            candidato = (taxa > self.taxa_maxima[pos]) & (intervalo > 0)
+        candidato &= self.ativo[pos]
+        estado = self.estado_taxa[pos]
+
+        mudou, contador = self._debounce(candidato != estado, self.contador_taxa[pos], self.amostras[pos])
+        self.contador_taxa[pos] = contador
+        self.estado_taxa[pos] = np.where(mudou, candidato, estado)
+
+        return [
+            self._evento(pos[i], 'taxa', 'inicio' if candidato[i] else 'fim', valor[i], tempo[i], taxa=taxa[i])
+            for i in np.flatnonzero(mudou)
+        ]
+
+    @staticmethod
+    def _debounce(diferente, contador, amostras):
+        contador = np.where(diferente, contador + 1, 0)
+        mudou = contador >= amostras
+        contador[mudou] = 0
+        return mudou, contador
+
+    def _evento(self, posicao, tipo, evento, valor, tempo, taxa=None):
+        registro = {
+            'sensor_id': int(self._ids[posicao]),
+            'tipo': tipo,
+            'evento': evento,
+            'valor': round(float(valor), 2),
+            'temp_min': None if np.isnan(self.minimo[posicao]) else float(self.minimo[posicao]),
+            'temp_max': None if np.isnan(self.maximo[posicao]) else float(self.maximo[posicao]),
+            'timestamp': float(tempo),
+            'data': datetime.fromtimestamp(float(tempo)).strftime('%Y-%m-%d %H:%M:%S')
+        }
+        if taxa is not None and not np.isnan(taxa):
+            registro['taxa'] = round(float(taxa), 2)
+        return registro
+
+    def espelhar(self, ativos):
+        # Worker que não avalia alarmes: copia o estado publicado pelo que
+        # avalia (mesmo formato de ativos())
+        codigos = {nome: codigo for codigo, nome in NOMES_ESTADO.items()}
+        with self._lock:
+            versao_config = self.obter_versao()
+            if versao_config != self._versao_config:
+                self._recarregar()
+                self._versao_config = versao_config
+            estado = np.full(len(self._ids), NORMAL, dtype=self.estado.dtype)
+            estado_taxa = np.zeros(len(self._ids), dtype=bool)
+            for sensor_id, alarme in ativos.items():
+                pos = self._posicao.get(sensor_id)
+                if pos is not None:
+                    estado[pos] = codigos.get(alarme.get('limite'), NORMAL)
+                    estado_taxa[pos] = bool(alarme.get('taxa'))
+            if not (np.array_equal(estado, self.estado) and np.array_equal(estado_taxa, self.estado_taxa)):
+                self.estado[:] = estado
+                self.estado_taxa[:] = estado_taxa
+                self.versao += 1
+
+    def em_alarme(self, sensor_id):
+        with self._lock:
+            pos = self._posicao.get(sensor_id)
+            if pos is None:
+                return False
+            return bool(self.estado[pos] != NORMAL or self.estado_taxa[pos])
+
+    def ativos(self):
+        with self._lock:
+            em_alarme = np.flatnonzero((self.estado != NORMAL) | self.estado_taxa)
+            return {
+                int(self._ids[p]): {
+                    'limite': NOMES_ESTADO.get(int(self.estado[p])),
+                    'taxa': bool(self.estado_taxa[p])
+                }
+                for p in em_alarme
+            }
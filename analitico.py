@@ -0,0 +1,272 @@
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+# Indicadores de uso dos equipamentos calculados a partir das transições do
+# log de eventos (eventos_processo.py): tempo em cada status, ciclos
+# (início → finalização do processo) e resultado da qualidade. Cada evento
+# soma em baldes diários por equipamento (e por produto), então uma consulta
+# de um ano junta no máximo 365 linhas por equipamento, com group-by em
+# NumPy, em vez de reprocessar o histórico.
+
+# Status com tempo acumulado, na ordem das colunas
+STATUS_MEDIDOS = ('livre', 'ocupada', 'manutencao', 'higienizacao', 'aguardando_qualidade', 'offline')
+COLUNAS = STATUS_MEDIDOS + ('ciclos', 'tempo_ciclos', 'aprovados', 'rejeitados')
+_COLUNA = {nome: posicao for posicao, nome in enumerate(COLUNAS)}
+COLUNAS_PRODUTO = ('ciclos', 'tempo_ciclos', 'aprovados', 'rejeitados')
+_COLUNA_PRODUTO = {nome: posicao for posicao, nome in enumerate(COLUNAS_PRODUTO)}
+
+AGRUPAMENTOS = ('equipamento', 'localizacao', 'dia')
+SEM_LOCALIZACAO = 'Sem localização'
+
+def _dia(instante):
+    return date.fromtimestamp(instante).toordinal()
+
+def _para_ordinal(valor):
+    # Aceita date, ordinal ou 'AAAA-MM-DD'
+    if isinstance(valor, int):
+        return valor
+    if isinstance(valor, str):
+        valor = datetime.strptime(valor, '%Y-%m-%d').date()
+    return valor.toordinal()
+
+def _razao(numerador, denominador):
+    return np.divide(numerador, denominador, out=np.full(len(numerador), np.nan), where=denominador > 0)
+
+def _numero(valor, casas):
+    return None if np.isnan(valor) else round(float(valor), casas)
+
+class AgregadosDiarios:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limpar()
+
+    def _limpar(self):
+        # (dia, equipamento) → valores na ordem de COLUNAS
+        self.linhas = {}
+        # (dia, equipamento, produto) → valores na ordem de COLUNAS_PRODUTO
+        self.produtos = {}
+        # equipamento → [status, desde]
+        self.atual = {}
+        # equipamento → [início, produto] do processo em andamento
+        self.abertos = {}
+        # processo → [equipamento, produto] aguardando a qualidade
+        self.processos = {}
+        self.versao = 0
+        self._matriz = None
+
+    # ----- snapshot -----
+
+    def exportar(self):
+        with self._lock:
+            return {
+                'linhas': [[dia, equip_id] + valores for (dia, equip_id), valores in self.linhas.items()],
+                'produtos': [[dia, equip_id, produto] + valores for (dia, equip_id, produto), valores in self.produtos.items()],
+                'atual': {str(equip_id): valor for equip_id, valor in self.atual.items()},
+                'abertos': {str(equip_id): valor for equip_id, valor in self.abertos.items()},
+                'processos': {str(processo_id): valor for processo_id, valor in self.processos.items()},
+            }
+
+    def importar(self, estado):
+        with self._lock:
+            self._limpar()
+            self.linhas = {(linha[0], linha[1]): linha[2:] for linha in estado['linhas']}
+            self.produtos = {(linha[0], linha[1], linha[2]): linha[3:] for linha in estado['produtos']}
+            self.atual = {int(chave): valor for chave, valor in estado['atual'].items()}
+            self.abertos = {int(chave): valor for chave, valor in estado['abertos'].items()}
+            self.processos = {int(chave): valor for chave, valor in estado['processos'].items()}
+
+    # ----- eventos -----
+
+    def _linha(self, dia, equip_id):
+        linha = self.linhas.get((dia, equip_id))
+        if linha is None:
+            linha = self.linhas[(dia, equip_id)] = [0.0] * len(COLUNAS)
+        return linha
+
+    def _somar_produto(self, dia, equip_id, produto, coluna, valor):
+        if not produto:
+            return
+        linha = self.produtos.get((dia, equip_id, produto))
+        if linha is None:
+            linha = self.produtos[(dia, equip_id, produto)] = [0.0] * len(COLUNAS_PRODUTO)
+        linha[_COLUNA_PRODUTO[coluna]] += valor
+
+    def _distribuir(self, linhas, equip_id, status, inicio, fim):
+        # Soma o intervalo no status, dividido entre os dias que ele atravessa
+        if status not in STATUS_MEDIDOS:
+            return
+        coluna = _COLUNA[status]
+        while inicio < fim:
+            dia = date.fromtimestamp(inicio)
+            meia_noite = datetime.combine(dia + timedelta(days=1), datetime.min.time()).timestamp()
+            parte = min(fim, meia_noite)
+            chave = (dia.toordinal(), equip_id)
+            if chave not in linhas:
+                linhas[chave] = [0.0] * len(COLUNAS)
+            linhas[chave][coluna] += parte - inicio
+            inicio = parte
+
+    def aplicar(self, evento):
+        equip_id = evento['equipamento_id']
+        instante = evento['ts']
+        tipo = evento['tipo']
+        dados = evento.get('dados') or {}
+        with self._lock:
+            atual = self.atual.get(equip_id)
+            if atual is not None:
+                self._distribuir(self.linhas, equip_id, atual[0], atual[1], instante)
+            if tipo == 'equipamento_excluido':
+                self.atual.pop(equip_id, None)
+                self.abertos.pop(equip_id, None)
+            elif evento.get('status'):
+                self.atual[equip_id] = [evento['status'], max(instante, atual[1]) if atual else instante]
+            elif atual is not None:
+                atual[1] = max(instante, atual[1])
+
+            dia = _dia(instante)
+            if tipo == 'processo_iniciado':
+                self.abertos[equip_id] = [instante, dados.get('produto')]
+            elif tipo == 'processo_finalizado':
+                inicio, produto = self.abertos.pop(equip_id, (None, None))
+                if inicio is not None:
+                    duracao = max(instante - inicio, 0)
+                    linha = self._linha(dia, equip_id)
+                    linha[_COLUNA['ciclos']] += 1
+                    linha[_COLUNA['tempo_ciclos']] += duracao
+                    self._somar_produto(dia, equip_id, produto, 'ciclos', 1)
+                    self._somar_produto(dia, equip_id, produto, 'tempo_ciclos', duracao)
+                if dados.get('processo_id') is not None:
+                    self.processos[dados['processo_id']] = [equip_id, produto]
+            elif tipo == 'higienizacao_finalizada':
+                if dados.get('processo_id') is not None:
+                    self.processos[dados['processo_id']] = [equip_id, None]
+            elif tipo in ('qualidade_aprovado', 'qualidade_rejeitado'):
+                coluna = 'aprovados' if tipo == 'qualidade_aprovado' else 'rejeitados'
+                self._linha(dia, equip_id)[_COLUNA[coluna]] += 1
+                _, produto = self.processos.pop(dados.get('processo_id'), (None, None))
+                self._somar_produto(dia, equip_id, produto, coluna, 1)
+            self.versao += 1
+
+    # ----- consultas -----
+
+    def _matrizes(self):
+        # Baldes em arrays, refeitos só quando chegou evento novo
+        if self._matriz is None or self._matriz[0] != self.versao:
+            chaves = list(self.linhas)
+            chaves_produto = list(self.produtos)
+            self._matriz = (
+                self.versao,
+                np.array([dia for dia, _ in chaves], dtype=np.int64),
+                np.array([equip_id for _, equip_id in chaves], dtype=np.int64),
+                np.array([self.linhas[chave] for chave in chaves], dtype=np.float64).reshape(len(chaves), len(COLUNAS)),
+                np.array([dia for dia, _, _ in chaves_produto], dtype=np.int64),
+                np.array([equip_id for _, equip_id, _ in chaves_produto], dtype=np.int64),
+                np.array([produto for _, _, produto in chaves_produto], dtype=object),
+                np.array([self.produtos[chave] for chave in chaves_produto], dtype=np.float64).reshape(len(chaves_produto), len(COLUNAS_PRODUTO)),
+            )
+        return self._matriz[1:]
+
+    def _em_aberto(self, inicio, fim, agora):
+        # Intervalo ainda aberto de cada equipamento (do último evento até agora)
+        linhas = {}
+        limite_inicio = datetime.combine(date.fromordinal(inicio), datetime.min.time()).timestamp()
+        limite_fim = datetime.combine(date.fromordinal(fim) + timedelta(days=1), datetime.min.time()).timestamp()
+        for equip_id, (status, desde) in self.atual.items():
+            self._distribuir(linhas, equip_id, status, max(desde, limite_inicio), min(agora, limite_fim))
+        return (
+            np.array([dia for dia, _ in linhas], dtype=np.int64),
+            np.array([equip_id for _, equip_id in linhas], dtype=np.int64),
+            np.array(list(linhas.values()), dtype=np.float64).reshape(len(linhas), len(COLUNAS)),
+        )
+
+    def consultar(self, inicio, fim, agrupar='equipamento', localizacoes=None, equipamentos=None, agora=None):
+        # Indicadores do período [inicio, fim] (datas inclusivas), por
+        # equipamento, localização ou dia, e por produto. 'localizacoes' mapeia
+        # id do equipamento → localização; 'equipamentos' restringe os ids.
+        if agrupar not in AGRUPAMENTOS:
+            raise ValueError(f'Agrupamento desconhecido: {agrupar}')
+        inicio, fim = _para_ordinal(inicio), _para_ordinal(fim)
+        agora = time.time() if agora is None else agora
+        with self._lock:
+            dias, equips, valores, dias_p, equips_p, produtos, valores_p = self._matrizes()
+            dias_a, equips_a, valores_a = self._em_aberto(inicio, fim, agora)
+        dias = np.concatenate([dias, dias_a])
+        equips = np.concatenate([equips, equips_a])
+        valores = np.concatenate([valores, valores_a])
+
+        selecao = (dias >= inicio) & (dias <= fim)
+        selecao_p = (dias_p >= inicio) & (dias_p <= fim)
+        if equipamentos is not None:
+            ids = np.fromiter(equipamentos, dtype=np.int64)
+            selecao &= np.isin(equips, ids)
+            selecao_p &= np.isin(equips_p, ids)
+        dias, equips, valores = dias[selecao], equips[selecao], valores[selecao]
+
+        if agrupar == 'equipamento':
+            chaves = equips
+        elif agrupar == 'dia':
+            chaves = dias
+        else:
+            localizacoes = localizacoes or {}
+            chaves = np.array([localizacoes.get(int(equip_id)) or SEM_LOCALIZACAO for equip_id in equips], dtype=object)
+        grupos, posicoes = np.unique(chaves, return_inverse=True)
+        somas = np.zeros((len(grupos), len(COLUNAS)))
+        np.add.at(somas, posicoes, valores)
+
+        produtos = produtos[selecao_p]
+        nomes_produto, posicoes_p = np.unique(produtos, return_inverse=True)
+        somas_p = np.zeros((len(nomes_produto), len(COLUNAS_PRODUTO)))
+        np.add.at(somas_p, posicoes_p, valores_p[selecao_p])
+
+        return {
+            'inicio': date.fromordinal(inicio).isoformat(),
+            'fim': date.fromordinal(fim).isoformat(),
+            'agrupar': agrupar,
+            'grupos': self._indicadores(grupos, somas, agrupar),
+            'produtos': self._indicadores_produto(nomes_produto, somas_p),
+        }
+
+    def _indicadores(self, grupos, somas, agrupar):
+        coluna = lambda nome: somas[:, _COLUNA[nome]]
+        observado = somas[:, :len(STATUS_MEDIDOS)].sum(axis=1)
+        ocupacao = _razao(coluna('ocupada'), observado)
+        ciclo_medio = _razao(coluna('tempo_ciclos'), coluna('ciclos'))
+        analisados = coluna('aprovados') + coluna('rejeitados')
+        rejeicao = _razao(coluna('rejeitados'), analisados)
+        resultado = []
+        for posicao, grupo in enumerate(grupos):
+            if agrupar == 'dia':
+                grupo = date.fromordinal(int(grupo)).isoformat()
+            elif agrupar == 'equipamento':
+                grupo = int(grupo)
+            resultado.append({
+                agrupar: grupo,
+                'horas': {status: round(float(coluna(status)[posicao]) / 3600, 2) for status in STATUS_MEDIDOS},
+                'ocupacao': _numero(ocupacao[posicao], 4),
+                'ciclos': int(coluna('ciclos')[posicao]),
+                'ciclo_medio_min': _numero(ciclo_medio[posicao] / 60, 1),
+                'aprovados': int(coluna('aprovados')[posicao]),
+                'rejeitados': int(coluna('rejeitados')[posicao]),
+                'taxa_rejeicao': _numero(rejeicao[posicao], 4),
+            })
+        return resultado
+
+    def _indicadores_produto(self, nomes, somas):
+        coluna = lambda nome: somas[:, _COLUNA_PRODUTO[nome]]
+        ciclo_medio = _razao(coluna('tempo_ciclos'), coluna('ciclos'))
+        rejeicao = _razao(coluna('rejeitados'), coluna('aprovados') + coluna('rejeitados'))
+        return [
+            {
+                'produto': nome,
+                'ciclos': int(coluna('ciclos')[posicao]),
+                'ciclo_medio_min': _numero(ciclo_medio[posicao] / 60, 1),
+                'aprovados': int(coluna('aprovados')[posicao]),
+                'rejeitados': int(coluna('rejeitados')[posicao]),
+                'taxa_rejeicao': _numero(rejeicao[posicao], 4),
+            }
+            for posicao, nome in enumerate(nomes)
+        ]
@@ -1,18 +1,35 @@
-from flask import Flask, render_template, redirect, url_for, flash, session, request, jsonify, send_file
+from flask import Flask, render_template, redirect, url_for, flash, session, request, jsonify, send_file, make_response, Response, g
 from functools import wraps
-from datetime import datetime
+from markupsafe import Markup
+from datetime import datetime, timedelta
+import time
 import json
-from io import BytesIO
-import pandas as pd
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
+import os
+from itertools import chain
+from aquisicao import CacheLeituras, ServicoAquisicao, testar_sensores
+from drivers import config_sensor
+from alarmes import MotorAlarmes
+from notificacoes import Notificador
+from tempo_real import Difusor, fluxo_sse
+from repositorio import RepositorioEquipamentos, RepositorioSensores, RepositorioProcessos
+from armazenamento import criar_armazenamento, sincronizar_lista, sincronizar_registros, ConflitoVersao
+from estado_compartilhado import SincronizadorEstado, ServicosExclusivos
+from eventos_processo import LogEventosProcesso
+from analitico import AgregadosDiarios, AGRUPAMENTOS
+from permissoes import ResolvedorPermissoes, permissoes_do_formulario
+from sessoes import InterfaceSessoes, criar_armazem_sessoes
+from senhas import ServicoSenhas, LimitadorTentativas, SobrecargaLogin, LIMITE_POR_USUARIO, LIMITE_POR_IP
+from serie_temporal import SerieTemporal, NOMES_RESOLUCAO, PONTOS_PADRAO, PONTOS_MAXIMO
+from relatorios import (FORMATOS, compilar_plano, gerar_csv, gravar_excel,
+                        gravar_pdf, arquivo_temporario, transmitir_arquivo, cabecalho_download,
+                        chave_relatorio, CacheRelatorios)
+from tarefas_relatorio import FilaRelatorios, LimiteExcedido
+from fragmentos import CacheFragmentos
 
 app = Flask(__name__)
 app.secret_key = 'sua_chave_secreta_aqui_mude_em_producao'
+# Sessões no servidor; o cookie leva só o id
+app.session_interface = InterfaceSessoes(criar_armazem_sessoes())
 
 # ===== FUNÇÕES AUXILIARES =====
 
@@ -28,10 +45,66 @@ def get_cor_status(status):
     return cores.get(status, 'secondary')
 
 def get_equipamento_por_id(equip_id):
-    return next((e for e in equipamentos if e['id'] == equip_id), None)
+    return repo_equipamentos.obter(equip_id)
 
 def get_sensor_por_id(sensor_id):
-    return next((s for s in sensores if s['id'] == sensor_id), None)
+    return repo_sensores.obter(sensor_id)
+
+def versao_equipamento(equip_id):
+    # Versão que o formulário devolve para o controle otimista
+    equip = get_equipamento_por_id(equip_id)
+    return equip.get('versao', 0) if equip else 0
+
+def persistir_registro(colecao, registros, chave):
+    armazenamento.salvar_registro(colecao, chave, registros[chave])
+
+def alterar_status_equipamento(equip, status, versao=None, novos=(), evento='status_alterado', dados_evento=None, **campos):
+    # Demais campos e itens novos (ex.: o processo finalizado) são gravados
+    # junto com o status, numa única escrita versionada. A transição só vai
+    # para o log de eventos depois de gravada.
+    anterior = equip['status']
+    repo_equipamentos.atualizar(equip, dict(campos, status=status), versao, novos)
+    eventos_processo.registrar(evento, equip['id'], status, anterior, session.get('usuario'), **(dados_evento or {}))
+    difusor.publicar(f'equipamento:{equip["id"]}', 'status', {'equipamento_id': equip['id'], 'status': status})
+
+def converter_instante(valor, padrao):
+    # Aceita timestamp Unix ou data/hora ISO (AAAA-MM-DD ou AAAA-MM-DDTHH:MM[:SS])
+    if not valor:
+        return padrao
+    try:
+        return float(valor)
+    except ValueError:
+        return datetime.fromisoformat(valor).timestamp()
+
+def converter_pontos(valor):
+    # Orçamento de pontos do gráfico, entre 1 e PONTOS_MAXIMO; ValueError se não for número
+    if not valor:
+        return PONTOS_PADRAO
+    return max(1, min(int(valor), PONTOS_MAXIMO))
+
+def janela_processo(processo):
+    # Início = data_inicio + carregado_as; fim = início + duracao (HH:MM), limitado a agora
+    inicio = datetime.fromisoformat(processo['data_inicio'])
+    if processo.get('carregado_as'):
+        horas, minutos = processo['carregado_as'].split(':')[:2]
+        inicio = inicio.replace(hour=int(horas), minute=int(minutos))
+    fim = datetime.now()
+    if processo.get('duracao'):
+        horas, minutos = processo['duracao'].split(':')[:2]
+        fim = min(inicio + timedelta(hours=int(horas), minutes=int(minutos)), fim)
+    return inicio.timestamp(), fim.timestamp()
+
+def montar_resposta_leitura(sensor, leitura):
+    if leitura is None:
+        return {'sensor_id': sensor['id'], 'erro': 'Aguardando primeira leitura'}
+    if leitura['status'] != 'ok':
+        return {'sensor_id': sensor['id'], 'erro': leitura['erro'], 'data_leitura': leitura['data_leitura']}
+    return {
+        'sensor_id': sensor['id'],
+        'temperatura': leitura['temperatura'],
+        'alerta': motor_alarmes.em_alarme(sensor['id']),
+        'data_leitura': leitura['data_leitura']
+    }
 
 # ===== DADOS MOCKADOS =====
 
@@ -152,41 +225,261 @@ relatorios_personalizados = {
 }
 
 processos_finalizados = []
-historico_processos = []
+
+# Armazenamento persistente: na primeira execução recebe os dados acima,
+# nas seguintes os substitui pelo que foi gravado
+armazenamento = criar_armazenamento()
+estado_compartilhado = SincronizadorEstado(armazenamento)
+sincronizar_lista(armazenamento, 'equipamentos', equipamentos)
+sincronizar_lista(armazenamento, 'sensores', sensores)
+sincronizar_lista(armazenamento, 'processos_finalizados', processos_finalizados)
+sincronizar_registros(armazenamento, 'usuarios', usuarios)
+sincronizar_registros(armazenamento, 'grupos_usuarios', grupos_usuarios)
+sincronizar_registros(armazenamento, 'layouts_relatorios', layouts_relatorios)
+sincronizar_registros(armazenamento, 'relatorios_personalizados', relatorios_personalizados)
+
+# Índices em memória sobre as listas acima
+repo_equipamentos = RepositorioEquipamentos(equipamentos, armazenamento)
+repo_sensores = RepositorioSensores(sensores, armazenamento)
+repo_processos = RepositorioProcessos(processos_finalizados, armazenamento)
+
+# Alterações gravadas por outros workers chegam antes de cada requisição
+for _repo in (repo_equipamentos, repo_sensores, repo_processos):
+    estado_compartilhado.registrar_repositorio(_repo)
+estado_compartilhado.registrar_registros('usuarios', usuarios)
+estado_compartilhado.registrar_registros('grupos_usuarios', grupos_usuarios)
+estado_compartilhado.registrar_registros('layouts_relatorios', layouts_relatorios)
+estado_compartilhado.registrar_registros('relatorios_personalizados', relatorios_personalizados)
+
+# Histórico de transições dos equipamentos, com as projeções derivadas dele
+# e os agregados diários dos indicadores de uso
+analitico = AgregadosDiarios()
+eventos_processo = LogEventosProcesso(extras={'analitico': analitico})
+for _equip in equipamentos:
+    # Equipamentos que o log ainda não conhece entram com o status atual
+    if eventos_processo.status_conhecido(_equip['id']) != _equip['status']:
+        eventos_processo.registrar('estado_inicial', _equip['id'], _equip['status'])
+
+# Permissões efetivas (usuário + grupo) compiladas em bits e guardadas na sessão
+resolvedor_permissoes = ResolvedorPermissoes(usuarios, grupos_usuarios, lambda: relatorios_personalizados)
+
+def atualizar_permissoes_externas(colecao, chave, dados):
+    if colecao == 'usuarios':
+        resolvedor_permissoes.indexar_usuario(chave)
+    elif colecao == 'relatorios_personalizados':
+        resolvedor_permissoes.atualizar_catalogo()
+
+estado_compartilhado.ouvintes.append(atualizar_permissoes_externas)
+
+# Hash de senhas num pool limitado e falhas de login contadas por usuário e por IP
+servico_senhas = ServicoSenhas(armazenamento=armazenamento)
+servico_senhas.iniciar()
+tentativas_usuario = LimitadorTentativas(LIMITE_POR_USUARIO)
+tentativas_ip = LimitadorTentativas(LIMITE_POR_IP)
+
+# Aquisição de sensores em segundo plano e difusão em tempo real
+cache_leituras = CacheLeituras()
+servico_aquisicao = ServicoAquisicao(lambda: sensores, cache_leituras)
+serie_temporal = SerieTemporal()
+servico_aquisicao.destinos.append(serie_temporal.registrar_lote)
+
+# Alarmes de limite e taxa avaliados a cada lote da aquisição
+motor_alarmes = MotorAlarmes(lambda: sensores, lambda: repo_sensores.versao)
+servico_aquisicao.destinos.append(motor_alarmes.avaliar)
+
+# HTML dos cards de equipamento, refeito só quando o equipamento muda
+cache_fragmentos = CacheFragmentos()
+
+# Relatórios pesados são renderizados em processos separados e os arquivos
+# prontos ficam em cache até os dados do período ou o layout mudarem
+cache_relatorios = CacheRelatorios()
+fila_relatorios = FilaRelatorios(cache=cache_relatorios, banco=getattr(armazenamento, 'caminho', None))
+
+difusor = Difusor()
+
+def publicar_leitura(sensor_id, leitura):
+    sensor = get_sensor_por_id(sensor_id)
+    if sensor:
+        difusor.publicar(f'sensor:{sensor_id}', 'temperatura', montar_resposta_leitura(sensor, leitura))
+
+cache_leituras.ouvintes.append(publicar_leitura)
+
+def publicar_alarmes(eventos):
+    # O alarme pode mudar com a temperatura estável (debounce); republica a
+    # leitura que provocou o evento para atualizar o indicador nos painéis
+    for evento in eventos:
+        publicar_leitura(evento['sensor_id'], {'status': 'ok', 'temperatura': evento['valor'], 'data_leitura': evento['data']})
+
+motor_alarmes.ouvintes.append(publicar_alarmes)
+
+# Quem recebe notificações de alarme: usuários ativos destes tipos ou grupos
+DESTINATARIOS_ALARME = {'tipos': ['ti', 'qualidade', 'manutencao'], 'grupos': []}
+
+def destinatarios_alarme():
+    return [
+        {'usuario': username, 'nome': user['nome'], 'email': user.get('email')}
+        # Cópia: as rotas de usuários alteram o dict enquanto a thread lê
+        for username, user in list(usuarios.items())
+        if user.get('ativo', True) and (user['tipo'] in DESTINATARIOS_ALARME['tipos'] or user.get('grupo') in DESTINATARIOS_ALARME['grupos'])
+    ]
+
+def equipamento_do_alarme(evento):
+    # Alarmes de sensores do mesmo equipamento são agrupados numa notificação
+    equips = repo_equipamentos.por_sensor(evento['sensor_id'])
+    if equips:
+        return f'equipamento:{equips[0]["id"]}', ', '.join(e['nome'] for e in equips)
+    sensor = get_sensor_por_id(evento['sensor_id'])
+    return f'sensor:{evento["sensor_id"]}', sensor['nome'] if sensor else f'Sensor {evento["sensor_id"]}'
+
+notificador = Notificador(equipamento_do_alarme, destinatarios_alarme)
+motor_alarmes.ouvintes.append(notificador.enfileirar)
+
+for _equip in equipamentos:
+    difusor.publicar(f'equipamento:{_equip["id"]}', 'status', {'equipamento_id': _equip['id'], 'status': _equip['status']})
+
+def publicar_alteracao_externa(colecao, chave, dados):
+    # Status alterado por outro worker também vai para os painéis deste
+    if colecao == 'equipamentos' and dados is not None:
+        difusor.publicar(f'equipamento:{dados["id"]}', 'status', {'equipamento_id': dados['id'], 'status': dados['status']})
+
+estado_compartilhado.ouvintes.append(publicar_alteracao_externa)
+
+# Com vários workers, só um lê os dispositivos, avalia alarmes e envia
+# notificações; ele publica a última leitura e o estado de alarme de cada
+# sensor no banco e os demais as copiam para o próprio cache (e painéis)
+def publicar_leituras_compartilhadas(lote):
+    ativos = motor_alarmes.ativos()
+    armazenamento.publicar_leituras([(l['sensor_id'], l, ativos.get(l['sensor_id'])) for l in lote])
+
+servico_aquisicao.destinos.append(publicar_leituras_compartilhadas)
+
+def iniciar_aquisicao():
+    servico_aquisicao.iniciar()
+    notificador.iniciar()
+
+def parar_aquisicao():
+    servico_aquisicao.parar()
+    notificador.parar()
+    serie_temporal.fechar()
+
+def acompanhar_leituras():
+    publicadas = armazenamento.carregar_leituras()
+    anteriores = motor_alarmes.ativos()
+    motor_alarmes.espelhar({sensor_id: alarme for sensor_id, _, alarme in publicadas if alarme})
+    atuais = motor_alarmes.ativos()
+    ids_ativos = {s['id'] for s in sensores if s.get('ativo', True)}
+    for sensor_id, leitura, _ in publicadas:
+        if sensor_id not in ids_ativos:
+            continue
+        if anteriores.get(sensor_id) != atuais.get(sensor_id):
+            # Só o alarme mudou: os painéis não seriam avisados pelo cache
+            publicar_leitura(sensor_id, leitura)
+        cache_leituras.gravar(sensor_id, leitura)
+    cache_leituras.manter_apenas(ids_ativos)
+
+servicos_exclusivos = ServicosExclusivos(armazenamento, iniciar_aquisicao, parar_aquisicao, acompanhar_leituras)
+# Disputa o arrendamento já ao carregar o app, sem esperar a primeira requisição
+servicos_exclusivos.iniciar()
+
+@app.before_request
+def iniciar_servicos():
+    # Também religa a thread do arrendamento se ela tiver parado
+    estado_compartilhado.sincronizar()
+    servicos_exclusivos.iniciar()
+
+@app.errorhandler(ConflitoVersao)
+def conflito_versao(erro):
+    estado_compartilhado.sincronizar()
+    flash('O equipamento foi alterado por outro usuário enquanto você editava. Confira a situação atual e tente novamente.', 'warning')
+    return redirect(request.referrer or url_for('index'))
+
+def carregar_perfil_sessao(username):
+    # Dados do usuário que as páginas usam, copiados para a sessão no login e
+    # sempre que as permissões dele mudam
+    user = usuarios[username]
+    session['tipo_usuario'] = user['tipo']
+    session['nome_usuario'] = user['nome']
+    session['perfil'] = {
+        'nome': user['nome'],
+        'email': user.get('email'),
+        'cargo': user.get('cargo', ''),
+        'tipo': user['tipo'],
+        'grupo': user.get('grupo')
+    }
+
+def permissoes_sessao():
+    # Bits do usuário logado, resolvidos uma vez por requisição
+    if 'permissoes_bits' not in g:
+        bits, recompilado = resolvedor_permissoes.resolver(session)
+        if recompilado and session.get('usuario') in usuarios:
+            carregar_perfil_sessao(session['usuario'])
+        g.permissoes_bits = bits
+    return g.permissoes_bits
+
+def salvar_usuario_permissoes(username):
+    # Depois de mudar permissões, grupo ou status de um usuário
+    resolvedor_permissoes.indexar_usuario(username)
+    resolvedor_permissoes.invalidar(username)
+    persistir_registro('usuarios', usuarios, username)
 
 # Context processor
+def tem_permissao(*permissoes):
+    # Alguma das permissões (quem tem 'ti' passa sempre)
+    return resolvedor_permissoes.permite(permissoes_sessao(), permissoes)
+
+# Só funções: os dados são consultados apenas pelos templates que as chamam.
+# Cada rota passa explicitamente as coleções que sua página usa.
 @app.context_processor
 def inject_globals():
     return {
-        'usuarios': usuarios,
-        'grupos_usuarios': grupos_usuarios,
-        'relatorios_personalizados': relatorios_personalizados,
-        'layouts_relatorios': layouts_relatorios,
-        'sensores': sensores,
-        'get_cor_status': get_cor_status
+        'tem_permissao': tem_permissao,
+        'get_cor_status': get_cor_status,
+        'versao_equipamento': versao_equipamento
     }
 
+def renderizar_cartoes(template, itens):
+    # Card de cada equipamento vem do cache enquanto o equipamento não mudar
+    return [
+        Markup(cache_fragmentos.obter(
+            (template, equip['id']),
+            repo_equipamentos.versao_item(equip['id']),
+            lambda equip=equip: render_template(template, equip=equip)
+        ))
+        for equip in itens
+    ]
+
 # ===== DECORADORES =====
 
+def sessao_valida():
+    # Sessões de usuários desativados são apagadas do armazém na hora (ver
+    # gerenciar_usuarios); a conferência aqui cobre a requisição que já
+    # estava em andamento e o usuário removido
+    if 'usuario' not in session:
+        return False
+    usuario = usuarios.get(session['usuario'])
+    if usuario is None or not usuario.get('ativo', True):
+        session.clear()
+        return False
+    return True
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'usuario' not in session:
+        if not sessao_valida():
             flash('Por favor, faça login.', 'warning')
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
 
 def tipo_usuario_required(*tipos_permitidos):
+    # Cada tipo corresponde à permissão de mesmo nome
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if 'usuario' not in session:
+            if not sessao_valida():
                 flash('Por favor, faça login.', 'warning')
                 return redirect(url_for('login'))
-            if session.get('tipo_usuario') == 'ti':
-                return f(*args, **kwargs)
-            if session.get('tipo_usuario') not in tipos_permitidos:
+            if not tem_permissao(*tipos_permitidos):
                 flash('Sem permissão.', 'danger')
                 return redirect(url_for('dashboard'))
             return f(*args, **kwargs)
@@ -206,18 +499,39 @@ def login():
     if request.method == 'POST':
         usuario = request.form.get('usuario')
         senha = request.form.get('senha')
+        ip = request.remote_addr
         
-        if usuario in usuarios and usuarios[usuario]['senha'] == senha:
+        if tentativas_usuario.bloqueado(usuario) or tentativas_ip.bloqueado(ip):
+            flash('Muitas tentativas de login. Aguarde alguns minutos e tente novamente.', 'danger')
+            return render_template('login.html'), 429
+        
+        try:
+            confere, novo_hash = servico_senhas.verificar(senha, usuarios[usuario]['senha'] if usuario in usuarios else None)
+        except SobrecargaLogin as e:
+            flash(str(e), 'warning')
+            return render_template('login.html'), 503
+        
+        if confere:
+            if novo_hash:
+                # Senha legada ou com parâmetros antigos: regrava no formato atual
+                usuarios[usuario]['senha'] = novo_hash
+                persistir_registro('usuarios', usuarios, usuario)
+            tentativas_usuario.limpar(usuario)
+            
             if not usuarios[usuario]['ativo']:
                 flash('Usuário inativo! Contate o administrador.', 'danger')
                 return render_template('login.html')
             
+            session.clear()
+            session.renovar_id()
             session['usuario'] = usuario
-            session['tipo_usuario'] = usuarios[usuario]['tipo']
-            session['nome_usuario'] = usuarios[usuario]['nome']
+            carregar_perfil_sessao(usuario)
+            permissoes_sessao()
             flash(f'Bem-vindo, {usuarios[usuario]["nome"]}!', 'success')
             return redirect(url_for('dashboard'))
         else:
+            tentativas_usuario.registrar_falha(usuario)
+            tentativas_ip.registrar_falha(ip)
             flash('Usuário ou senha incorretos!', 'danger')
     
     return render_template('login.html')
@@ -231,12 +545,15 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    return render_template('dashboard.html', equipamentos=equipamentos)
+    return render_template('dashboard.html',
+                         equipamentos=equipamentos,
+                         cartoes=renderizar_cartoes('dashboard_cartao.html', equipamentos),
+                         contagem_status=repo_equipamentos.contagem_status())
 
 @app.route('/operador')
 @login_required
 def operador():
-    return render_template('operador.html', equipamentos=equipamentos)
+    return render_template('operador.html', cartoes=renderizar_cartoes('operador_cartao.html', equipamentos))
 
 @app.route('/gerenciar/<int:equip_id>', methods=['GET', 'POST'])
 @login_required
@@ -246,26 +563,36 @@ def gerenciar(equip_id):
         flash('Equipamento não encontrado!', 'danger')
         return redirect(url_for('operador'))
     
-    if equipamento['status'] == 'aguardando_qualidade' and session.get('tipo_usuario') not in ['qualidade', 'ti']:
+    if equipamento['status'] == 'aguardando_qualidade' and not tem_permissao('qualidade'):
         flash('Este equipamento está aguardando validação da qualidade!', 'warning')
         return redirect(url_for('operador'))
     
     if request.method == 'POST':
         acao = request.form.get('acao')
+        # Versão do equipamento quando a página foi aberta
+        versao = request.form.get('versao', type=int)
         if acao == 'iniciar':
-            equipamento['processo'] = {
+            if equipamento['processo']:
+                flash('Já existe um processo em andamento neste equipamento!', 'warning')
+                return redirect(url_for('operador'))
+            alterar_status_equipamento(equipamento, 'ocupada', versao, evento='processo_iniciado', dados_evento={
+                'produto': request.form.get('produto'),
+                'ordem_producao': request.form.get('ordem_producao')
+            }, processo={
                 'produto': request.form.get('produto'),
                 'ordem_producao': request.form.get('ordem_producao'),
                 'duracao': request.form.get('duracao'),
                 'carregado_as': request.form.get('carregado_as'),
                 'responsavel': request.form.get('responsavel'),
                 'data_inicio': datetime.now().strftime('%Y-%m-%d')
-            }
-            equipamento['status'] = 'ocupada'
+            })
             flash('Processo iniciado!', 'success')
         elif acao == 'finalizar':
+            if not equipamento['processo']:
+                flash('Este processo já foi finalizado!', 'warning')
+                return redirect(url_for('operador'))
             processo_finalizado = {
-                'id': len(processos_finalizados) + 1,
+                'id': repo_processos.novo_id(),
                 'equipamento': equipamento['nome'],
                 'equipamento_id': equip_id,
                 'produto': equipamento['processo']['produto'],
@@ -274,10 +601,11 @@ def gerenciar(equip_id):
                 'data_finalizacao': datetime.now().strftime('%Y-%m-%d %H:%M'),
                 'status_qualidade': 'pendente'
             }
-            processos_finalizados.append(processo_finalizado)
-            
-            equipamento['processo'] = None
-            equipamento['status'] = 'aguardando_qualidade'
+            # O processo só é gravado se o equipamento ainda estiver na versão
+            # lida: duas finalizações simultâneas não geram dois registros
+            alterar_status_equipamento(equipamento, 'aguardando_qualidade', versao,
+                                       novos=[(repo_processos, processo_finalizado)], evento='processo_finalizado',
+                                       dados_evento={'processo_id': processo_finalizado['id']}, processo=None)
             flash('Processo finalizado! Aguardando validação da qualidade.', 'info')
         return redirect(url_for('operador'))
     
@@ -287,12 +615,7 @@ def gerenciar(equip_id):
 @login_required
 @tipo_usuario_required('ti')
 def ti():
-    return render_template('ti.html',
-                         equipamentos=equipamentos,
-                         usuarios=usuarios,
-                         grupos_usuarios=grupos_usuarios,
-                         relatorios_personalizados=relatorios_personalizados,
-                         sensores=sensores)
+    return render_template('ti.html', usuarios_online=app.session_interface.usuarios_ativos())
 
 @app.route('/ti/equipamentos', methods=['GET', 'POST'])
 @login_required
@@ -302,7 +625,7 @@ def ti_equipamentos():
         acao = request.form.get('acao')
         
         if acao == 'adicionar':
-            novo_id = max([e['id'] for e in equipamentos]) + 1 if equipamentos else 1
+            novo_id = repo_equipamentos.novo_id()
             sensor_id = request.form.get('sensor_id')
             
             novo = {
@@ -320,7 +643,10 @@ def ti_equipamentos():
                 'campos_personalizados': [],
                 'sensor_id': int(sensor_id) if sensor_id and sensor_id != '' else None
             }
-            equipamentos.append(novo)
+            repo_equipamentos.adicionar(novo)
+            # Já gravado com o status inicial: só registra o evento e avisa os painéis
+            eventos_processo.registrar('equipamento_criado', novo['id'], novo['status'], None, session.get('usuario'))
+            difusor.publicar(f'equipamento:{novo["id"]}', 'status', {'equipamento_id': novo['id'], 'status': novo['status']})
             flash(f'Equipamento {novo["nome"]} criado!', 'success')
             return redirect(url_for('ti_equipamentos'))
         
@@ -328,14 +654,15 @@ def ti_equipamentos():
             equip_id = int(request.form.get('equip_id'))
             equip = get_equipamento_por_id(equip_id)
             if equip:
-                equip['nome'] = request.form.get('nome')
-                equip['tipo'] = request.form.get('tipo')
-                equip['icone'] = request.form.get('icone')
-                equip['descricao'] = request.form.get('descricao', '')
-                equip['localizacao'] = request.form.get('localizacao', '')
-                
                 sensor_id = request.form.get('sensor_id')
-                equip['sensor_id'] = int(sensor_id) if sensor_id and sensor_id != '' else None
+                repo_equipamentos.atualizar(equip, {
+                    'nome': request.form.get('nome'),
+                    'tipo': request.form.get('tipo'),
+                    'icone': request.form.get('icone'),
+                    'descricao': request.form.get('descricao', ''),
+                    'localizacao': request.form.get('localizacao', ''),
+                    'sensor_id': int(sensor_id) if sensor_id and sensor_id != '' else None
+                }, request.form.get('versao', type=int))
                 
                 flash('Equipamento atualizado!', 'success')
             return redirect(url_for('ti_equipamentos'))
@@ -344,7 +671,9 @@ def ti_equipamentos():
             equip_id = int(request.form.get('equip_id'))
             equip = get_equipamento_por_id(equip_id)
             if equip and equip['status'] == 'livre':
-                equipamentos.remove(equip)
+                repo_equipamentos.remover(equip)
+                eventos_processo.registrar('equipamento_excluido', equip_id, None, equip['status'], session.get('usuario'))
+                difusor.descartar(f'equipamento:{equip_id}')
                 flash('Equipamento excluído!', 'success')
             else:
                 flash('Não é possível excluir! O equipamento está em uso.', 'danger')
@@ -354,12 +683,12 @@ def ti_equipamentos():
             equip_id = int(request.form.get('equip_id'))
             equip = get_equipamento_por_id(equip_id)
             if equip:
-                equip['ativo'] = not equip.get('ativo', True)
+                repo_equipamentos.atualizar(equip, {'ativo': not equip.get('ativo', True)})
                 status = 'ativado' if equip['ativo'] else 'desativado'
                 flash(f'Equipamento {status}!', 'success')
             return redirect(url_for('ti_equipamentos'))
     
-    return render_template('ti_equipamentos.html', equipamentos=equipamentos, icones_disponiveis=icones_disponiveis, sensores=sensores)
+    return render_template('ti_equipamentos.html', equipamentos=equipamentos, icones_disponiveis=icones_disponiveis, sensores=sensores, sensores_por_id={s['id']: s for s in sensores})
 
 @app.route('/ti/sensores', methods=['GET', 'POST'])
 @login_required
@@ -369,45 +698,10 @@ def ti_sensores():
         acao = request.form.get('acao')
         
         if acao == 'adicionar':
-            novo_id = max([s['id'] for s in sensores]) + 1 if sensores else 1
+            novo_id = repo_sensores.novo_id()
             tipo_com = request.form.get('tipo_comunicacao')
             
-            config = {}
-            if tipo_com == 'rede':
-                config = {
-                    'ip': request.form.get('ip'),
-                    'porta': request.form.get('porta'),
-                    'canal': request.form.get('canal')
-                }
-            elif tipo_com == 'usb_com':
-                config = {
-                    'porta_com': request.form.get('porta_com'),
-                    'baud_rate': request.form.get('baud_rate')
-                }
-            elif tipo_com == 'i2c':
-                config = {
-                    'endereco': request.form.get('endereco'),
-                    'barramento': request.form.get('barramento')
-                }
-            elif tipo_com == 'serial':
-                config = {
-                    'porta': request.form.get('porta_serial'),
-                    'baud_rate': request.form.get('baud_rate_serial')
-                }
-            elif tipo_com == 'rs232':
-                config = {
-                    'porta': request.form.get('porta_rs232'),
-                    'baud_rate': request.form.get('baud_rate_rs232'),
-                    'data_bits': request.form.get('data_bits'),
-                    'stop_bits': request.form.get('stop_bits'),
-                    'parity': request.form.get('parity')
-                }
-            elif tipo_com == 'modbus':
-                config = {
-                    'endereco_escravo': request.form.get('endereco_escravo'),
-                    'porta': request.form.get('porta_modbus'),
-                    'baud_rate': request.form.get('baud_rate_modbus')
-                }
+            config = config_sensor(tipo_com, request.form)
             
             novo_sensor = {
                 'id': novo_id,
@@ -420,7 +714,7 @@ def ti_sensores():
                 'status_teste': None,
                 'ativo': True
             }
-            sensores.append(novo_sensor)
+            repo_sensores.adicionar(novo_sensor)
             flash(f'Sensor {novo_sensor["nome"]} criado com sucesso!', 'success')
             return redirect(url_for('ti_sensores'))
         
@@ -432,47 +726,13 @@ def ti_sensores():
                 tipo_com = request.form.get('tipo_comunicacao')
                 sensor['tipo_comunicacao'] = tipo_com
                 
-                config = {}
-                if tipo_com == 'rede':
-                    config = {
-                        'ip': request.form.get('ip'),
-                        'porta': request.form.get('porta'),
-                        'canal': request.form.get('canal')
-                    }
-                elif tipo_com == 'usb_com':
-                    config = {
-                        'porta_com': request.form.get('porta_com'),
-                        'baud_rate': request.form.get('baud_rate')
-                    }
-                elif tipo_com == 'i2c':
-                    config = {
-                        'endereco': request.form.get('endereco'),
-                        'barramento': request.form.get('barramento')
-                    }
-                elif tipo_com == 'serial':
-                    config = {
-                        'porta': request.form.get('porta_serial'),
-                        'baud_rate': request.form.get('baud_rate_serial')
-                    }
-                elif tipo_com == 'rs232':
-                    config = {
-                        'porta': request.form.get('porta_rs232'),
-                        'baud_rate': request.form.get('baud_rate_rs232'),
-                        'data_bits': request.form.get('data_bits'),
-                        'stop_bits': request.form.get('stop_bits'),
-                        'parity': request.form.get('parity')
-                    }
-                elif tipo_com == 'modbus':
-                    config = {
-                        'endereco_escravo': request.form.get('endereco_escravo'),
-                        'porta': request.form.get('porta_modbus'),
-                        'baud_rate': request.form.get('baud_rate_modbus')
-                    }
+                config = config_sensor(tipo_com, request.form)
                 
                 sensor['config'] = config
                 sensor['temp_min'] = int(request.form.get('temp_min')) if request.form.get('temp_min') else None
                 sensor['temp_max'] = int(request.form.get('temp_max')) if request.form.get('temp_max') else None
                 sensor['alerta_ativo'] = request.form.get('alerta_ativo') == 'on'
+                repo_sensores.salvar(sensor)
                 
                 flash('Sensor atualizado!', 'success')
             return redirect(url_for('ti_sensores'))
@@ -482,11 +742,11 @@ def ti_sensores():
             sensor = get_sensor_por_id(sensor_id)
             if sensor:
                 # Verificar se algum equipamento usa este sensor
-                em_uso = any(e.get('sensor_id') == sensor_id for e in equipamentos)
-                if em_uso:
+                if repo_equipamentos.sensor_em_uso(sensor_id):
                     flash('Não é possível excluir! Este sensor está sendo usado por um equipamento.', 'danger')
                 else:
-                    sensores.remove(sensor)
+                    repo_sensores.remover(sensor)
+                    difusor.descartar(f'sensor:{sensor_id}')
                     flash('Sensor excluído!', 'success')
             return redirect(url_for('ti_sensores'))
         
@@ -495,6 +755,7 @@ def ti_sensores():
             sensor = get_sensor_por_id(sensor_id)
             if sensor:
                 sensor['ativo'] = not sensor.get('ativo', True)
+                repo_sensores.salvar(sensor)
                 status = 'ativado' if sensor['ativo'] else 'desativado'
                 flash(f'Sensor {status}!', 'success')
             return redirect(url_for('ti_sensores'))
@@ -509,17 +770,17 @@ def testar_sensor(sensor_id):
     if not sensor:
         return jsonify({'sucesso': False, 'mensagem': 'Sensor não encontrado'}), 404
     
-    # Simulação de teste de comunicação
-    import random
-    sucesso = random.choice([True, True, True, False])  # 75% de chance de sucesso
+    leitura = testar_sensores([sensor])[0]
     
-    if sucesso:
+    if leitura['status'] == 'ok':
         sensor['status_teste'] = {
             'status': 'sucesso',
             'mensagem': 'Comunicação estabelecida com sucesso!',
-            'temperatura_lida': round(random.uniform(20, 30), 2),
-            'data_teste': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'temperatura_lida': leitura['temperatura'],
+            'latencia_ms': leitura['latencia_ms'],
+            'data_teste': leitura['data_leitura']
         }
+        repo_sensores.salvar(sensor)
         return jsonify({
             'sucesso': True,
             'mensagem': 'Sensor testado com sucesso!',
@@ -528,14 +789,246 @@ def testar_sensor(sensor_id):
     else:
         sensor['status_teste'] = {
             'status': 'erro',
-            'mensagem': 'Falha na comunicação. Verifique as configurações.',
-            'data_teste': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'mensagem': leitura['erro'],
+            'latencia_ms': leitura['latencia_ms'],
+            'data_teste': leitura['data_leitura']
         }
+        repo_sensores.salvar(sensor)
         return jsonify({
             'sucesso': False,
-            'mensagem': 'Falha na comunicação. Verifique as configurações.'
+            'mensagem': leitura['erro']
         }), 400
 
+@app.route('/ti/sensores/testar', methods=['POST'])
+@login_required
+@tipo_usuario_required('ti')
+def testar_sensores_lote():
+    # Sem ids informados, testa todos os sensores ativos
+    ids = [int(sid) for sid in request.form.getlist('sensor_ids') if sid.isdigit()]
+    if ids:
+        alvos = [s for s in (get_sensor_por_id(sid) for sid in ids) if s]
+    else:
+        alvos = [s for s in sensores if s.get('ativo', True)]
+    
+    inicio = time.monotonic()
+    leituras = testar_sensores(alvos)
+    duracao_ms = round((time.monotonic() - inicio) * 1000, 1)
+    
+    resultados = []
+    for sensor, leitura in zip(alvos, leituras):
+        sucesso = leitura['status'] == 'ok'
+        sensor['status_teste'] = {
+            'status': 'sucesso' if sucesso else 'erro',
+            'mensagem': 'Comunicação estabelecida com sucesso!' if sucesso else leitura['erro'],
+            'latencia_ms': leitura['latencia_ms'],
+            'data_teste': leitura['data_leitura']
+        }
+        if sucesso:
+            sensor['status_teste']['temperatura_lida'] = leitura['temperatura']
+        repo_sensores.salvar(sensor)
+        resultados.append({
+            'sensor_id': sensor['id'],
+            'nome': sensor['nome'],
+            'tipo_comunicacao': sensor['tipo_comunicacao'],
+            'sucesso': sucesso,
+            'temperatura': leitura.get('temperatura'),
+            'latencia_ms': leitura['latencia_ms'],
+            'erro': leitura.get('erro')
+        })
+    
+    return jsonify({
+        'resultados': resultados,
+        'total': len(resultados),
+        'sucessos': sum(1 for r in resultados if r['sucesso']),
+        'falhas': sum(1 for r in resultados if not r['sucesso']),
+        'duracao_ms': duracao_ms
+    })
+
+# ===== API =====
+
+@app.route('/api/sensor/<int:sensor_id>/temperatura')
+@login_required
+def api_temperatura_sensor(sensor_id):
+    sensor = get_sensor_por_id(sensor_id)
+    if not sensor:
+        return jsonify({'erro': 'Sensor não encontrado'}), 404
+    return jsonify(montar_resposta_leitura(sensor, cache_leituras.obter(sensor_id)))
+
+@app.route('/api/equipamento/<int:equip_id>/temperatura')
+@login_required
+def api_temperatura_equipamento(equip_id):
+    equip = get_equipamento_por_id(equip_id)
+    if not equip:
+        return jsonify({'erro': 'Equipamento não encontrado'}), 404
+    sensor = get_sensor_por_id(equip['sensor_id']) if equip.get('sensor_id') else None
+    if not sensor:
+        return jsonify({'erro': 'Equipamento sem sensor'}), 404
+    resposta = montar_resposta_leitura(sensor, cache_leituras.obter(sensor['id']))
+    resposta['equipamento_id'] = equip_id
+    return jsonify(resposta)
+
+@app.route('/api/sensor/<int:sensor_id>/historico')
+@login_required
+def api_historico_sensor(sensor_id):
+    if not get_sensor_por_id(sensor_id):
+        return jsonify({'erro': 'Sensor não encontrado'}), 404
+    try:
+        fim = converter_instante(request.args.get('fim'), time.time())
+        inicio = converter_instante(request.args.get('inicio'), fim - 3600)
+        pontos = converter_pontos(request.args.get('pontos'))
+    except ValueError:
+        return jsonify({'erro': 'Parâmetros inválidos'}), 400
+    resolucao = request.args.get('resolucao', 'auto')
+    if resolucao != 'auto' and resolucao not in NOMES_RESOLUCAO:
+        return jsonify({'erro': f'Resolução inválida. Use auto ou {", ".join(NOMES_RESOLUCAO)}'}), 400
+    if inicio >= fim:
+        return jsonify({'erro': 'Início deve ser anterior ao fim'}), 400
+
+    resultado = serie_temporal.consultar(
+        sensor_id, inicio, fim,
+        resolucao=None if resolucao == 'auto' else NOMES_RESOLUCAO[resolucao],
+        pontos=pontos
+    )
+    resultado.update({'sensor_id': sensor_id, 'inicio': inicio, 'fim': fim})
+    return jsonify(resultado)
+
+@app.route('/api/equipamento/<int:equip_id>/historico_processo')
+@login_required
+def api_historico_processo(equip_id):
+    equip = get_equipamento_por_id(equip_id)
+    if not equip:
+        return jsonify({'erro': 'Equipamento não encontrado'}), 404
+    if not equip.get('sensor_id') or not equip.get('processo'):
+        return jsonify({'erro': 'Equipamento sem sensor ou sem processo em andamento'}), 404
+    try:
+        pontos = converter_pontos(request.args.get('pontos'))
+    except ValueError:
+        return jsonify({'erro': 'Parâmetros inválidos'}), 400
+    try:
+        inicio, fim = janela_processo(equip['processo'])
+    except ValueError:
+        return jsonify({'erro': 'Processo com data ou duração inválida'}), 400
+
+    resultado = serie_temporal.consultar(equip['sensor_id'], inicio, fim, pontos=pontos)
+    resultado.update({'equipamento_id': equip_id, 'sensor_id': equip['sensor_id'], 'inicio': inicio, 'fim': fim})
+    return jsonify(resultado)
+
+@app.route('/api/temperaturas')
+@login_required
+def api_temperaturas():
+    ids = request.args.get('ids', '')
+    if ids:
+        selecionados = [get_equipamento_por_id(int(i)) for i in ids.split(',') if i.strip().isdigit()]
+        selecionados = [e for e in selecionados if e]
+    else:
+        selecionados = [e for e in equipamentos if e.get('ativo', True)]
+
+    sensor_ids = [e['sensor_id'] for e in selecionados if e.get('sensor_id')]
+    etag = 'lote-{}-{}-{}-{}'.format(
+        repo_equipamentos.versao,
+        repo_sensores.versao,
+        motor_alarmes.versao,
+        hash((tuple(e['id'] for e in selecionados), cache_leituras.versoes(sensor_ids)))
+    )
+    if request.if_none_match.contains(etag):
+        resposta = make_response('', 304)
+        resposta.set_etag(etag)
+        return resposta
+
+    leituras = cache_leituras.obter_varios(sensor_ids)
+    dados = {}
+    for equip in selecionados:
+        item = {'status': equip['status'], 'sensor_id': equip.get('sensor_id')}
+        sensor = get_sensor_por_id(equip['sensor_id']) if equip.get('sensor_id') else None
+        if sensor:
+            leitura = leituras.get(sensor['id'])
+            if leitura is None:
+                item['erro'] = 'Aguardando primeira leitura'
+            elif leitura['status'] != 'ok':
+                item['erro'] = leitura['erro']
+            else:
+                item['temperatura'] = leitura['temperatura']
+                item['alerta'] = motor_alarmes.em_alarme(sensor['id'])
+        dados[equip['id']] = item
+
+    resposta = jsonify({'equipamentos': dados})
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta
+
+@app.route('/api/alarmes')
+@login_required
+def api_alarmes():
+    sensor_id = request.args.get('sensor_id', type=int)
+    limite = min(request.args.get('limite', 100, type=int), 1000)
+    return jsonify({
+        'ativos': motor_alarmes.ativos(),
+        'eventos': motor_alarmes.registro.ultimos(limite, sensor_id)
+    })
+
+@app.route('/api/equipamento/<int:equip_id>/eventos')
+@login_required
+def api_eventos_equipamento(equip_id):
+    limite = min(request.args.get('limite', 100, type=int), 1000)
+    return jsonify({'equipamento_id': equip_id, 'eventos': eventos_processo.ultimos(limite, equip_id)})
+
+@app.route('/api/indicadores')
+@login_required
+def api_indicadores():
+    # Status atual, tempo em cada status e pendências da qualidade, das projeções do log
+    return jsonify(eventos_processo.resumo())
+
+@app.route('/api/analitico')
+@login_required
+@tipo_usuario_required('relatorios')
+def api_analitico():
+    # Ocupação, tempo por status, ciclo médio e rejeição da qualidade no
+    # período (padrão: últimos 30 dias), por equipamento, localização ou dia
+    hoje = datetime.now().date()
+    try:
+        inicio = datetime.strptime(request.args.get('inicio', ''), '%Y-%m-%d').date() if request.args.get('inicio') else hoje - timedelta(days=29)
+        fim = datetime.strptime(request.args.get('fim', ''), '%Y-%m-%d').date() if request.args.get('fim') else hoje
+    except ValueError:
+        return jsonify({'erro': 'Datas no formato AAAA-MM-DD'}), 400
+    agrupar = request.args.get('agrupar', 'equipamento')
+    if agrupar not in AGRUPAMENTOS:
+        return jsonify({'erro': f'agrupar deve ser um de: {", ".join(AGRUPAMENTOS)}'}), 400
+    ids = [int(i) for i in request.args.get('equipamentos', '').split(',') if i.strip().isdigit()]
+    eventos_processo.atualizar()
+    return jsonify(analitico.consultar(
+        inicio, fim, agrupar,
+        localizacoes={e['id']: e.get('localizacao') for e in equipamentos},
+        equipamentos=ids or None
+    ))
+
+@app.route('/api/login/metricas')
+@login_required
+@tipo_usuario_required('ti')
+def api_metricas_login():
+    # Latência recente do login (p50/p99) contra a meta configurada
+    return jsonify(servico_senhas.percentis())
+
+@app.route('/api/stream')
+@login_required
+def api_stream():
+    # Filtros opcionais: ?sensores=1,2&equipamentos=3 (sem filtros recebe tudo)
+    filtro = None
+    if request.args.get('sensores') or request.args.get('equipamentos'):
+        filtro = set()
+        for i in request.args.get('sensores', '').split(','):
+            if i.strip().isdigit():
+                filtro.add(f'sensor:{int(i)}')
+        for i in request.args.get('equipamentos', '').split(','):
+            if i.strip().isdigit():
+                filtro.add(f'equipamento:{int(i)}')
+
+    assinante = difusor.assinar(filtro)
+    return Response(
+        fluxo_sse(difusor, assinante),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/manutencao', methods=['GET', 'POST'])
 @login_required
 def manutencao():
@@ -548,19 +1041,20 @@ def manutencao():
             flash('Equipamento não encontrado!', 'danger')
             return redirect(url_for('manutencao'))
         
+        versao = request.form.get('versao', type=int)
         if acao == 'iniciar':
-            equip['manutencao'] = {
+            alterar_status_equipamento(equip, 'manutencao', versao, evento='manutencao_iniciada', dados_evento={
+                'motivo': request.form.get('motivo')
+            }, manutencao={
                 'motivo': request.form.get('motivo'),
                 'previsao': request.form.get('previsao'),
                 'responsavel': session['nome_usuario'],
                 'data_inicio': datetime.now().strftime('%Y-%m-%d %H:%M')
-            }
-            equip['status'] = 'manutencao'
+            })
             flash(f'Manutenção iniciada em {equip["nome"]}!', 'success')
         
         elif acao == 'finalizar':
-            equip['manutencao'] = None
-            equip['status'] = 'livre'
+            alterar_status_equipamento(equip, 'livre', versao, evento='manutencao_finalizada', manutencao=None)
             flash(f'Manutenção finalizada em {equip["nome"]}!', 'success')
         
         return redirect(url_for('manutencao'))
@@ -579,18 +1073,21 @@ def higienizacao():
             flash('Equipamento não encontrado!', 'danger')
             return redirect(url_for('higienizacao'))
         
+        versao = request.form.get('versao', type=int)
         if acao == 'iniciar':
-            equip['higienizacao'] = {
+            alterar_status_equipamento(equip, 'higienizacao', versao, evento='higienizacao_iniciada', higienizacao={
                 'previsao': request.form.get('previsao'),
                 'responsavel': session['nome_usuario'],
                 'data_inicio': datetime.now().strftime('%Y-%m-%d %H:%M')
-            }
-            equip['status'] = 'higienizacao'
+            })
             flash(f'Higienização iniciada em {equip["nome"]}!', 'success')
         
         elif acao == 'finalizar':
+            if not equip['higienizacao']:
+                flash(f'A higienização de {equip["nome"]} já foi finalizada!', 'warning')
+                return redirect(url_for('higienizacao'))
             processo_finalizado = {
-                'id': len(processos_finalizados) + 1,
+                'id': repo_processos.novo_id(),
                 'equipamento': equip['nome'],
                 'equipamento_id': equip_id,
                 'produto': 'Higienização',
@@ -599,16 +1096,44 @@ def higienizacao():
                 'data_finalizacao': datetime.now().strftime('%Y-%m-%d %H:%M'),
                 'status_qualidade': 'pendente'
             }
-            processos_finalizados.append(processo_finalizado)
-            
-            equip['higienizacao'] = None
-            equip['status'] = 'aguardando_qualidade'
+            alterar_status_equipamento(equip, 'aguardando_qualidade', versao,
+                                       novos=[(repo_processos, processo_finalizado)], evento='higienizacao_finalizada',
+                                       dados_evento={'processo_id': processo_finalizado['id']}, higienizacao=None)
             flash(f'Higienização finalizada! {equip["nome"]} aguarda validação da qualidade.', 'info')
         
         return redirect(url_for('higienizacao'))
     
     return render_template('higienizacao.html', equipamentos=equipamentos)
 
+# Pendentes formam a fila (mais antigos primeiro); analisados, mais recentes primeiro
+STATUS_QUALIDADE = ('pendente', 'aprovado', 'rejeitado')
+QUALIDADE_POR_PAGINA = 20
+QUALIDADE_MAX_POR_PAGINA = 100
+
+def filtros_qualidade(args):
+    filtros = {}
+    if args.get('equipamento_id', type=int):
+        filtros['equipamento_id'] = args.get('equipamento_id', type=int)
+    if args.get('busca', '').strip():
+        filtros['busca'] = args.get('busca').strip()
+    return filtros
+
+def predicado_qualidade(filtros):
+    # O equipamento já é filtrado pelo índice do repositório; aqui só a busca
+    busca = filtros.get('busca', '').lower()
+    if not busca:
+        return None
+    
+    def filtro(processo):
+        return busca in f"{processo.get('produto', '')} {processo.get('ordem_producao', '')}".lower()
+    return filtro
+
+def pagina_qualidade(status, cursor, filtros, limite=QUALIDADE_POR_PAGINA):
+    return repo_processos.pagina_status_qualidade(
+        status, cursor=cursor, limite=limite, recentes_primeiro=(status != 'pendente'),
+        filtro=predicado_qualidade(filtros), equip_id=filtros.get('equipamento_id')
+    )
+
 @app.route('/qualidade', methods=['GET', 'POST'])
 @login_required
 def qualidade():
@@ -616,150 +1141,202 @@ def qualidade():
         processo_id = int(request.form.get('processo_id'))
         resultado = request.form.get('resultado')
         
-        processo = next((p for p in processos_finalizados if p['id'] == processo_id), None)
+        processo = repo_processos.obter(processo_id)
         
-        if processo:
-            processo['status_qualidade'] = resultado
-            processo['data_analise'] = datetime.now().strftime('%Y-%m-%d %H:%M')
-            processo['analisado_por'] = session['nome_usuario']
-            
+        if resultado not in ('aprovado', 'rejeitado'):
+            flash('Resultado inválido!', 'danger')
+        elif not processo or processo['status_qualidade'] != 'pendente':
+            # Formulário antigo ou enviado duas vezes: o processo já foi analisado
+            flash('Este processo já foi analisado!', 'warning')
+        else:
+            analisado = dict(processo,
+                             status_qualidade=resultado,
+                             data_analise=datetime.now().strftime('%Y-%m-%d %H:%M'),
+                             analisado_por=session['nome_usuario'])
+            evento = 'qualidade_aprovado' if resultado == 'aprovado' else 'qualidade_rejeitado'
             equip = get_equipamento_por_id(processo['equipamento_id'])
             if equip:
+                # Resultado e liberação numa única escrita versionada: se o
+                # equipamento mudou desde que a página foi aberta, nenhum dos dois é gravado
+                versao = request.form.get('versao', type=int, default=equip.get('versao', 0))
+                status = 'livre' if equip['status'] == 'aguardando_qualidade' else equip['status']
+                alterar_status_equipamento(equip, status, versao, novos=[(repo_processos, analisado)],
+                                           evento=evento, dados_evento={'processo_id': processo_id})
                 if resultado == 'aprovado':
-                    equip['status'] = 'livre'
                     flash(f'Processo aprovado! {equip["nome"]} liberado para uso.', 'success')
                 else:
-                    equip['status'] = 'livre'
                     flash(f'Processo rejeitado! {equip["nome"]} liberado para novo processo.', 'warning')
+            else:
+                # Equipamento já excluído: a análise ainda encerra a pendência
+                repo_processos.aplicar(analisado)
+                repo_processos.salvar(processo)
+                eventos_processo.registrar(evento, processo['equipamento_id'], None, None, session.get('usuario'), processo_id=processo_id)
         
-        return redirect(url_for('qualidade'))
+        return redirect(url_for('qualidade', **filtros_qualidade(request.args)))
+    
+    filtros = filtros_qualidade(request.args)
+    paginas = {}
+    for status in STATUS_QUALIDADE:
+        itens, cursor = pagina_qualidade(status, None, filtros)
+        paginas[status] = {
+            'itens': itens,
+            'cursor': cursor,
+            'total': repo_processos.contar_status_qualidade(status)
+        }
+    
+    return render_template('qualidade.html', paginas=paginas, filtros=filtros, equipamentos=equipamentos)
+
+@app.route('/api/qualidade/processos')
+@login_required
+def api_qualidade_processos():
+    status = request.args.get('status', 'pendente')
+    if status not in STATUS_QUALIDADE:
+        return jsonify({'erro': 'Status inválido'}), 400
     
-    return render_template('qualidade.html', processos=processos_finalizados)
+    cursor = request.args.get('cursor', type=int)
+    limite = min(request.args.get('limite', QUALIDADE_POR_PAGINA, type=int), QUALIDADE_MAX_POR_PAGINA)
+    itens, proximo = pagina_qualidade(status, cursor, filtros_qualidade(request.args), limite)
+    return jsonify({
+        'processos': itens,
+        'proximo_cursor': proximo,
+        'html': render_template('qualidade_cartoes.html', processos=itens)
+    })
 
 @app.route('/relatorios')
 @login_required
 def relatorios():
     return render_template('relatorios.html', relatorios=relatorios_personalizados, equipamentos=equipamentos, layouts=layouts_relatorios)
 
-@app.route('/gerar_relatorio', methods=['POST'])
-@login_required
-def gerar_relatorio():
-    id_relatorio = request.form.get('id_relatorio')
-    formato = request.form.get('formato')
-    
-    relatorio = relatorios_personalizados.get(id_relatorio)
+def preparar_relatorio(form):
+    # Valida o pedido e monta as linhas sob demanda. Retorna (erro, dados):
+    # erro é (mensagem, categoria) quando o relatório não pode ser gerado.
+    relatorio = relatorios_personalizados.get(form.get('id_relatorio'))
     if not relatorio:
-        flash('Relatório não encontrado!', 'danger')
-        return redirect(url_for('relatorios'))
+        return ('Relatório não encontrado!', 'danger'), None
     
-    dados = processos_finalizados.copy()
+    formato = form.get('formato')
+    if formato not in FORMATOS:
+        return ('Formato de relatório não suportado!', 'warning'), None
     
-    data_inicio = request.form.get('filtro_data_inicio')
-    data_fim = request.form.get('filtro_data_fim')
-    
-    if data_inicio:
-        dados = [d for d in dados if d.get('data_finalizacao', '')[:10] >= data_inicio]
-    if data_fim:
-        dados = [d for d in dados if d.get('data_finalizacao', '')[:10] <= data_fim]
+    equip_id = form.get('filtro_equipamento_id')
+    filtros = {
+        'data_inicio': form.get('filtro_data_inicio') or None,
+        'data_fim': form.get('filtro_data_fim') or None,
+        'equip_id': int(equip_id) if equip_id else None
+    }
+    plano = compilar_plano(relatorio['campos'], **filtros)
     
-    equip_id = request.form.get('filtro_equipamento_id')
-    if equip_id:
-        dados = [d for d in dados if d.get('equipamento_id') == int(equip_id)]
+    # Só a primeira linha é lida aqui para saber se há dados
+    linhas = plano.linhas(repo_processos)
+    primeira = next(linhas, None)
+    if primeira is None:
+        return ('Nenhum dado disponível para gerar relatório!', 'warning'), None
     
-    if not dados:
-        flash('Nenhum dado disponível para gerar relatório!', 'warning')
+    mimetype, extensao = FORMATOS[formato]
+    layout = layouts_relatorios.get(relatorio.get(f'layout_{formato}'), {}).get('config')
+    usuario_pdf = session.get('nome_usuario', 'N/A') if formato == 'pdf' else None
+    versao_dados = repo_processos.versao_periodo(filtros['data_inicio'], filtros['data_fim'])
+    return None, {
+        'relatorio': relatorio,
+        'formato': formato,
+        'extensao': extensao,
+        'mimetype': mimetype,
+        'plano': plano,
+        'cabecalho': plano.cabecalho,
+        'linhas': chain([primeira], linhas),
+        'nome_arquivo': f'{relatorio["nome"]}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extensao}',
+        'chave': chave_relatorio(relatorio, formato, layout, filtros, versao_dados, usuario_pdf)
+    }
+
+@app.route('/gerar_relatorio', methods=['POST'])
+@login_required
+def gerar_relatorio():
+    erro, pedido = preparar_relatorio(request.form)
+    if erro:
+        flash(*erro)
         return redirect(url_for('relatorios'))
     
-    dados_exportacao = []
-    for processo in dados:
-        linha = {}
-        for campo in relatorio['campos']:
-            if campo == 'equipamento':
-                linha['Equipamento'] = processo.get('equipamento', '')
-            elif campo == 'produto':
-                linha['Produto'] = processo.get('produto', '')
-            elif campo == 'ordem_producao':
-                linha['Ordem de Produção'] = processo.get('ordem_producao', '')
-            elif campo == 'responsavel':
-                linha['Responsável'] = processo.get('responsavel', '')
-            elif campo == 'data_finalizacao':
-                linha['Data Finalização'] = processo.get('data_finalizacao', '')
-            elif campo == 'status_qualidade':
-                linha['Status Qualidade'] = processo.get('status_qualidade', '').upper()
-        dados_exportacao.append(linha)
+    cabecalho = pedido['cabecalho']
+    linhas = pedido['linhas']
+    em_cache = cache_relatorios.obter(pedido['chave'], pedido['extensao'])
+    if em_cache:
+        corpo = transmitir_arquivo(em_cache, remover=False)
+    elif pedido['formato'] == 'csv':
+        corpo = gerar_csv(cabecalho, linhas)
+    else:
+        caminho = arquivo_temporario(pedido['extensao'])
+        if pedido['formato'] == 'excel':
+            gravar_excel(caminho, cabecalho, linhas)
+        else:
+            gravar_pdf(caminho, pedido['relatorio']['nome'], session.get('nome_usuario', 'N/A'), cabecalho, linhas)
+        caminho = cache_relatorios.guardar(pedido['chave'], pedido['extensao'], caminho)
+        corpo = transmitir_arquivo(caminho, remover=False)
     
-    if formato == 'excel':
-        df = pd.DataFrame(dados_exportacao)
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Relatório')
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'{relatorio["nome"]}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        )
+    return Response(corpo, mimetype=pedido['mimetype'], headers={'Content-Disposition': cabecalho_download(pedido['nome_arquivo'])})
+
+@app.route('/relatorios/jobs', methods=['POST'])
+@login_required
+def submeter_relatorio():
+    erro, pedido = preparar_relatorio(request.form)
+    if erro:
+        return jsonify({'erro': erro[0]}), 400
     
-    elif formato == 'pdf':
-        output = BytesIO()
-        doc = SimpleDocTemplate(output, pagesize=A4)
-        elements = []
-        
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            textColor=colors.HexColor('#4A90E2'),
-            spaceAfter=30,
-            alignment=TA_CENTER
-        )
-        
-        elements.append(Paragraph(relatorio['nome'], title_style))
-        elements.append(Spacer(1, 0.3*inch))
-        
-        info_style = ParagraphStyle('Info', parent=styles['Normal'], fontSize=9, textColor=colors.grey)
-        elements.append(Paragraph(f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", info_style))
-        elements.append(Paragraph(f"Usuário: {session.get('nome_usuario', 'N/A')}", info_style))
-        elements.append(Spacer(1, 0.3*inch))
-        
-        if dados_exportacao:
-            headers = list(dados_exportacao[0].keys())
-            table_data = [headers]
-            
-            for row in dados_exportacao:
-                table_data.append([str(row.get(h, '')) for h in headers])
-            
-            table = Table(table_data)
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4A90E2')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ]))
-            
-            elements.append(table)
-        
-        doc.build(elements)
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'{relatorio["nome"]}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+    try:
+        tarefa_id = fila_relatorios.submeter(
+            session['usuario'],
+            pedido['relatorio']['nome'],
+            pedido['nome_arquivo'],
+            pedido['formato'],
+            pedido['extensao'],
+            pedido['plano'],
+            repo_processos,
+            chave=pedido['chave'],
+            nome_usuario=session.get('nome_usuario', 'N/A')
         )
+    except LimiteExcedido as e:
+        return jsonify({'erro': str(e)}), 429
+    
+    return jsonify({
+        'job_id': tarefa_id,
+        'status_url': url_for('status_relatorio', tarefa_id=tarefa_id)
+    }), 202
+
+def obter_tarefa_usuario(tarefa_id):
+    tarefa = fila_relatorios.obter(tarefa_id)
+    if tarefa and (tarefa['usuario'] == session.get('usuario') or tem_permissao('ti')):
+        return tarefa
+    return None
+
+@app.route('/relatorios/jobs/<tarefa_id>')
+@login_required
+def status_relatorio(tarefa_id):
+    tarefa = obter_tarefa_usuario(tarefa_id)
+    if not tarefa:
+        return jsonify({'erro': 'Relatório não encontrado'}), 404
+    
+    resposta = {
+        'job_id': tarefa['id'],
+        'estado': tarefa['estado'],
+        'progresso': tarefa['progresso'],
+        'total_linhas': tarefa['total'],
+        'erro': tarefa['erro']
+    }
+    if tarefa['estado'] == 'concluido':
+        resposta['download_url'] = url_for('baixar_relatorio', tarefa_id=tarefa_id)
+    return jsonify(resposta)
+
+@app.route('/relatorios/jobs/<tarefa_id>/download')
+@login_required
+def baixar_relatorio(tarefa_id):
+    tarefa = obter_tarefa_usuario(tarefa_id)
+    if not tarefa or tarefa['estado'] != 'concluido':
+        flash('Relatório não disponível!', 'warning')
+        return redirect(url_for('relatorios'))
+    if not os.path.exists(tarefa['arquivo']):
+        flash('O arquivo do relatório expirou. Gere o relatório novamente.', 'warning')
+        return redirect(url_for('relatorios'))
     
-    flash('Formato de relatório não suportado!', 'warning')
-    return redirect(url_for('relatorios'))
+    return send_file(tarefa['arquivo'], as_attachment=True, download_name=tarefa['nome_arquivo'], conditional=True)
 
 @app.route('/gerenciar_usuarios', methods=['GET', 'POST'])
 @login_required
@@ -774,38 +1351,20 @@ def gerenciar_usuarios():
                 flash('Usuário já existe!', 'danger')
                 return redirect(url_for('gerenciar_usuarios'))
             
-            permissoes = {}
-            for key in request.form.keys():
-                if key.startswith('perm_'):
-                    perm_name = key.replace('perm_', '')
-                    permissoes[perm_name] = True
-            
+            # Só as permissões próprias: as do grupo entram na compilação e
+            # acompanham as alterações do grupo
             grupo_nome = request.form.get('grupo')
-            if grupo_nome and grupo_nome in grupos_usuarios:
-                grupo_perms = grupos_usuarios[grupo_nome]['permissoes']
-                permissoes.update(grupo_perms)
-            
-            # Determinar tipo baseado nas permissões
-            tipo = 'operador'  # padrão
-            if permissoes.get('ti'):
-                tipo = 'ti'
-            elif permissoes.get('qualidade'):
-                tipo = 'qualidade'
-            elif permissoes.get('manutencao'):
-                tipo = 'manutencao'
-            elif permissoes.get('higienizacao'):
-                tipo = 'higienizacao'
-            
             usuarios[username] = {
-                'senha': request.form.get('senha'),
+                'senha': servico_senhas.gerar_hash(request.form.get('senha')),
                 'nome': request.form.get('nome'),
                 'email': request.form.get('email'),
                 'cargo': request.form.get('cargo', ''),
-                'tipo': tipo,
                 'ativo': True,
-                'grupo': grupo_nome if grupo_nome else None,
-                'permissoes': permissoes
+                'grupo': grupo_nome if grupo_nome in grupos_usuarios else None,
+                'permissoes': permissoes_do_formulario(request.form)
             }
+            # Define também o tipo, a partir das permissões efetivas
+            salvar_usuario_permissoes(username)
             flash(f'Usuário {username} criado com sucesso!', 'success')
         
         elif acao == 'editar':
@@ -820,33 +1379,12 @@ def gerenciar_usuarios():
             
             senha = request.form.get('senha')
             if senha:
-                usuarios[username]['senha'] = senha
-            
-            permissoes = {}
-            for key in request.form.keys():
-                if key.startswith('perm_'):
-                    perm_name = key.replace('perm_', '')
-                    permissoes[perm_name] = True
+                usuarios[username]['senha'] = servico_senhas.gerar_hash(senha)
             
             grupo_nome = request.form.get('grupo')
-            if grupo_nome and grupo_nome in grupos_usuarios:
-                grupo_perms = grupos_usuarios[grupo_nome]['permissoes']
-                permissoes.update(grupo_perms)
-            
-            # Atualizar tipo baseado nas permissões
-            tipo = 'operador'  # padrão
-            if permissoes.get('ti'):
-                tipo = 'ti'
-            elif permissoes.get('qualidade'):
-                tipo = 'qualidade'
-            elif permissoes.get('manutencao'):
-                tipo = 'manutencao'
-            elif permissoes.get('higienizacao'):
-                tipo = 'higienizacao'
-            
-            usuarios[username]['tipo'] = tipo
-            usuarios[username]['grupo'] = grupo_nome if grupo_nome else None
-            usuarios[username]['permissoes'] = permissoes
+            usuarios[username]['grupo'] = grupo_nome if grupo_nome in grupos_usuarios else None
+            usuarios[username]['permissoes'] = permissoes_do_formulario(request.form)
+            salvar_usuario_permissoes(username)
             
             flash(f'Usuário {username} atualizado!', 'success')
         
@@ -854,18 +1392,25 @@ def gerenciar_usuarios():
             username = request.form.get('username')
             if username in usuarios:
                 usuarios[username]['ativo'] = not usuarios[username]['ativo']
+                salvar_usuario_permissoes(username)
+                if not usuarios[username]['ativo']:
+                    # Desconecta o usuário em todos os dispositivos
+                    app.session_interface.encerrar_usuario(username)
                 status = 'ativado' if usuarios[username]['ativo'] else 'desativado'
                 flash(f'Usuário {username} {status}!', 'success')
         
         elif acao == 'resetar_senha':
             username = request.form.get('username')
             if username in usuarios:
-                usuarios[username]['senha'] = '123'
+                usuarios[username]['senha'] = servico_senhas.gerar_hash('123')
+                persistir_registro('usuarios', usuarios, username)
                 flash(f'Senha de {username} resetada para "123"!', 'success')
         
         return redirect(url_for('gerenciar_usuarios'))
     
-    return render_template('usuarios.html', usuarios=usuarios, grupos=grupos_usuarios, relatorios_personalizados=relatorios_personalizados)
+    # O hash da senha não vai para a página (o template serializa o usuário)
+    usuarios_visiveis = {username: {k: v for k, v in user.items() if k != 'senha'} for username, user in usuarios.items()}
+    return render_template('usuarios.html', usuarios=usuarios_visiveis, grupos=grupos_usuarios, relatorios_personalizados=relatorios_personalizados)
 
 @app.route('/gerenciar_grupos', methods=['GET', 'POST'])
 @login_required
@@ -880,19 +1425,14 @@ def gerenciar_grupos():
                 flash('Grupo já existe!', 'danger')
                 return redirect(url_for('gerenciar_grupos'))
             
-            permissoes = {}
-            for key in request.form.keys():
-                if key.startswith('perm_'):
-                    perm_name = key.replace('perm_', '')
-                    permissoes[perm_name] = True
-            
             grupos_usuarios[nome] = {
                 'id': len(grupos_usuarios) + 1,
                 'nome': nome,
                 'descricao': request.form.get('descricao', ''),
                 'cor': request.form.get('cor', '#4A90E2'),
-                'permissoes': permissoes
+                'permissoes': permissoes_do_formulario(request.form)
             }
+            persistir_registro('grupos_usuarios', grupos_usuarios, nome)
             flash(f'Grupo {nome} criado!', 'success')
         
         elif acao == 'editar':
@@ -901,12 +1441,8 @@ def gerenciar_grupos():
             
             if nome_antigo in grupos_usuarios:
                 grupo = grupos_usuarios[nome_antigo]
-                
-                permissoes = {}
-                for key in request.form.keys():
-                    if key.startswith('perm_'):
-                        perm_name = key.replace('perm_', '')
-                        permissoes[perm_name] = True
+                permissoes = permissoes_do_formulario(request.form)
+                permissoes_mudaram = permissoes != grupo.get('permissoes')
                 
                 if nome_antigo != nome_novo:
                     grupos_usuarios[nome_novo] = {
@@ -917,15 +1453,21 @@ def gerenciar_grupos():
                         'permissoes': permissoes
                     }
                     del grupos_usuarios[nome_antigo]
+                    persistir_registro('grupos_usuarios', grupos_usuarios, nome_novo)
+                    armazenamento.excluir_registro('grupos_usuarios', nome_antigo)
                     
-                    # Atualizar usuários que usam este grupo
-                    for user in usuarios.values():
-                        if user.get('grupo') == nome_antigo:
-                            user['grupo'] = nome_novo
+                    # Atualizar só os usuários que usam este grupo
+                    for username in resolvedor_permissoes.membros(nome_antigo):
+                        usuarios[username]['grupo'] = nome_novo
+                        salvar_usuario_permissoes(username)
                 else:
                     grupos_usuarios[nome_antigo]['descricao'] = request.form.get('descricao', '')
                     grupos_usuarios[nome_antigo]['cor'] = request.form.get('cor', '#4A90E2')
                     grupos_usuarios[nome_antigo]['permissoes'] = permissoes
+                    persistir_registro('grupos_usuarios', grupos_usuarios, nome_antigo)
+                    if permissoes_mudaram:
+                        for username in resolvedor_permissoes.membros(nome_antigo):
+                            salvar_usuario_permissoes(username)
                 
                 flash(f'Grupo atualizado!', 'success')
         
@@ -933,10 +1475,11 @@ def gerenciar_grupos():
             nome = request.form.get('nome_grupo')
             if nome in grupos_usuarios:
                 del grupos_usuarios[nome]
+                armazenamento.excluir_registro('grupos_usuarios', nome)
                 # Remover grupo dos usuários
-                for user in usuarios.values():
-                    if user.get('grupo') == nome:
-                        user['grupo'] = None
+                for username in resolvedor_permissoes.membros(nome):
+                    usuarios[username]['grupo'] = None
+                    salvar_usuario_permissoes(username)
                 flash(f'Grupo {nome} excluído!', 'success')
         
         return redirect(url_for('gerenciar_grupos'))
@@ -977,6 +1520,8 @@ def gerenciar_relatorios():
                 'layout_pdf': request.form.get('layout_pdf'),
                 'ativo': True
             }
+            persistir_registro('relatorios_personalizados', relatorios_personalizados, id_rel)
+            resolvedor_permissoes.atualizar_catalogo()
             flash(f'Relatório {request.form.get("nome")} criado!', 'success')
         
         elif acao == 'editar':
@@ -994,12 +1539,14 @@ def gerenciar_relatorios():
                 relatorios_personalizados[id_rel]['formatos'] = request.form.getlist('formatos')
                 relatorios_personalizados[id_rel]['layout_excel'] = request.form.get('layout_excel')
                 relatorios_personalizados[id_rel]['layout_pdf'] = request.form.get('layout_pdf')
+                persistir_registro('relatorios_personalizados', relatorios_personalizados, id_rel)
                 flash('Relatório atualizado!', 'success')
         
         elif acao == 'ativar_desativar':
             id_rel = request.form.get('id_relatorio')
             if id_rel in relatorios_personalizados:
                 relatorios_personalizados[id_rel]['ativo'] = not relatorios_personalizados[id_rel].get('ativo', True)
+                persistir_registro('relatorios_personalizados', relatorios_personalizados, id_rel)
                 status = 'ativado' if relatorios_personalizados[id_rel]['ativo'] else 'desativado'
                 flash(f'Relatório {status}!', 'success')
         
@@ -1007,6 +1554,8 @@ def gerenciar_relatorios():
             id_rel = request.form.get('id_relatorio')
             if id_rel in relatorios_personalizados:
                 del relatorios_personalizados[id_rel]
+                armazenamento.excluir_registro('relatorios_personalizados', id_rel)
+                resolvedor_permissoes.atualizar_catalogo()
                 flash('Relatório excluído!', 'success')
         
         return redirect(url_for('gerenciar_relatorios'))
@@ -1061,6 +1610,7 @@ def gerenciar_layouts():
                 'tipo': tipo,
                 'config': config
             }
+            persistir_registro('layouts_relatorios', layouts_relatorios, id_layout)
             flash(f'Layout {request.form.get("nome")} criado!', 'success')
         
         elif acao == 'editar':
@@ -1098,6 +1648,7 @@ def gerenciar_layouts():
                 layouts_relatorios[id_layout]['nome'] = request.form.get('nome')
                 layouts_relatorios[id_layout]['tipo'] = tipo
                 layouts_relatorios[id_layout]['config'] = config
+                persistir_registro('layouts_relatorios', layouts_relatorios, id_layout)
                 flash('Layout atualizado!', 'success')
         
         elif acao == 'excluir':
@@ -1112,6 +1663,7 @@ def gerenciar_layouts():
                     flash('Não é possível excluir! Este layout está sendo usado por um relatório.', 'danger')
                 else:
                     del layouts_relatorios[id_layout]
+                    armazenamento.excluir_registro('layouts_relatorios', id_layout)
                     flash('Layout excluído!', 'success')
         
         return redirect(url_for('gerenciar_layouts'))
@@ -0,0 +1,363 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+from drivers import abrir_driver, chave_endpoint, driver_para, simulador_teste
+
+logger = logging.getLogger(__name__)
+
+# Intervalo padrão entre leituras de um mesmo sensor (segundos).
+# Cada sensor pode sobrescrever com a chave 'intervalo_leitura'.
+INTERVALO_PADRAO = 1.0
+# Endpoints lidos ao mesmo tempo em cada ciclo
+MAX_THREADS_LEITURA = 16
+
+# ===== CACHE DE LEITURAS =====
+
+class CacheLeituras:
+    # Guarda apenas a última leitura de cada sensor. As rotas da API leem
+    # daqui; somente o serviço de aquisição escreve.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._leituras = {}
+        self._versoes = {}
+        self.versao = 0
+        # Funções chamadas com (sensor_id, leitura) sempre que o valor muda
+        self.ouvintes = []
+
+    def gravar(self, sensor_id, leitura):
+        with self._lock:
+            anterior = self._leituras.get(sensor_id)
+            self._leituras[sensor_id] = leitura
+            # A versão só avança quando o valor visível muda, para que clientes
+            # que consultam com ETag recebam 304 enquanto nada mudou.
+            alterou = anterior is None or _valor_visivel(anterior) != _valor_visivel(leitura)
+            if alterou:
+                self.versao += 1
+                self._versoes[sensor_id] = self.versao
+        if alterou:
+            for ouvinte in self.ouvintes:
+                ouvinte(sensor_id, leitura)
+
+    def obter(self, sensor_id):
+        with self._lock:
+            return self._leituras.get(sensor_id)
+
+    def obter_varios(self, sensor_ids):
+        with self._lock:
+            return {sid: self._leituras.get(sid) for sid in sensor_ids}
+
+    def versoes(self, sensor_ids):
+        with self._lock:
+            return tuple(self._versoes.get(sid, 0) for sid in sensor_ids)
+
+    def manter_apenas(self, sensor_ids):
+        with self._lock:
+            removidos = [sid for sid in self._leituras if sid not in sensor_ids]
+            for sid in removidos:
+                del self._leituras[sid]
+                self._versoes.pop(sid, None)
+            if removidos:
+                self.versao += 1
+
+def _valor_visivel(leitura):
+    return (leitura['status'], leitura.get('temperatura'), leitura.get('erro'))
+
+# ===== LEITURA DOS DISPOSITIVOS =====
+
+def _leitura_ok(sensor_id, temperatura, agora):
+    return {
+        'sensor_id': sensor_id,
+        'status': 'ok',
+        'temperatura': temperatura,
+        'timestamp': agora,
+        'data_leitura': datetime.fromtimestamp(agora).strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def _leitura_erro(sensor_id, erro, agora):
+    return {
+        'sensor_id': sensor_id,
+        'status': 'erro',
+        'erro': erro,
+        'timestamp': agora,
+        'data_leitura': datetime.fromtimestamp(agora).strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def ler_sensor(sensor):
+    # Leitura avulsa com conexão própria (testes de comunicação); a aquisição
+    # contínua usa o pool de conexões
+    agora = time.time()
+    try:
+        driver = abrir_driver(chave_endpoint(sensor), simulador_teste)
+        try:
+            valor = driver.ler_lote([sensor]).get(sensor['id'])
+        finally:
+            driver.fechar()
+        if isinstance(valor, Exception):
+            raise valor
+        if valor is None:
+            raise IOError('Canal sem resposta')
+    except Exception as e:
+        return _leitura_erro(sensor['id'], str(e), agora)
+    return _leitura_ok(sensor['id'], valor, agora)
+
+# ===== CONEXÕES POR ENDPOINT =====
+
+# Conexões sem uso por mais que isso (segundos) são fechadas
+OCIOSIDADE_MAXIMA = 60
+
+class PoolConexoes:
+    # Mantém um driver conectado por endpoint entre os ciclos. Uma falha da
+    # transação inteira descarta a conexão; a próxima leitura reconecta.
+
+    def __init__(self, abrir=abrir_driver, ociosidade_maxima=OCIOSIDADE_MAXIMA):
+        self.abrir = abrir
+        self.ociosidade_maxima = ociosidade_maxima
+        self._lock = threading.Lock()
+        self._conexoes = {}
+        self._ultimo_uso = {}
+        # Um lock por endpoint só para a abertura da conexão
+        self._abrindo = {}
+
+    def _existente(self, endpoint):
+        with self._lock:
+            conexao = self._conexoes.get(endpoint)
+            if conexao is not None:
+                self._ultimo_uso[endpoint] = time.monotonic()
+            return conexao
+
+    def obter(self, endpoint):
+        conexao = self._existente(endpoint)
+        if conexao is not None:
+            return conexao
+        with self._lock:
+            trava = self._abrindo.setdefault(endpoint, threading.Lock())
+        # O connect acontece fora do lock geral: um endpoint que demora para
+        # conectar não segura a leitura dos demais
+        with trava:
+            conexao = self._existente(endpoint)
+            if conexao is None:
+                conexao = self.abrir(endpoint)
+                with self._lock:
+                    self._conexoes[endpoint] = conexao
+                    self._ultimo_uso[endpoint] = time.monotonic()
+            return conexao
+
+    def descartar(self, endpoint):
+        with self._lock:
+            conexao = self._conexoes.pop(endpoint, None)
+            self._ultimo_uso.pop(endpoint, None)
+        if conexao is not None:
+            try:
+                conexao.fechar()
+            except Exception:
+                pass
+
+    def ler(self, endpoint, sensores):
+        try:
+            return self.obter(endpoint).ler_lote(sensores)
+        except Exception as e:
+            self.descartar(endpoint)
+            return {sensor['id']: e for sensor in sensores}
+
+    def fechar_ociosas(self):
+        limite = time.monotonic() - self.ociosidade_maxima
+        for endpoint in [e for e, uso in list(self._ultimo_uso.items()) if uso < limite]:
+            self.descartar(endpoint)
+
+    def fechar_todas(self):
+        for endpoint in list(self._conexoes):
+            self.descartar(endpoint)
+
+    def __len__(self):
+        return len(self._conexoes)
+
+# ===== TESTE DE SENSORES =====
+
+MAX_THREADS_TESTE = 32
+
+def testar_sensores(sensores, max_threads=MAX_THREADS_TESTE):
+    # Testa vários sensores em paralelo: a varredura leva aproximadamente o
+    # tempo do sensor mais lento, não a soma. Cada resultado é uma leitura com
+    # 'latencia_ms'; quem estoura o timeout do driver do protocolo (contado a
+    # partir do início da sua leitura) volta como erro.
+    if not sensores:
+        return []
+
+    inicios = {}
+
+    def testar(sensor):
+        inicios[sensor['id']] = time.monotonic()
+        leitura = ler_sensor(sensor)
+        leitura['latencia_ms'] = round((time.monotonic() - inicios[sensor['id']]) * 1000, 1)
+        return leitura
+
+    executor = ThreadPoolExecutor(max_workers=min(max_threads, len(sensores)), thread_name_prefix='teste-sensor')
+    futuros = {executor.submit(testar, sensor): sensor for sensor in sensores}
+    resultados = {}
+    pendentes = set(futuros)
+    try:
+        while pendentes:
+            concluidos, pendentes = wait(pendentes, timeout=0.05, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                resultados[futuros[futuro]['id']] = futuro.result()
+            agora = time.monotonic()
+            for futuro in list(pendentes):
+                sensor = futuros[futuro]
+                timeout = driver_para(sensor.get('tipo_comunicacao')).timeout
+                inicio = inicios.get(sensor['id'])
+                if inicio is not None and agora - inicio > timeout:
+                    # A thread continua até o driver desistir; o resultado é descartado
+                    leitura = _leitura_erro(sensor['id'], f'Sem resposta em {timeout:.1f}s', time.time())
+                    leitura['latencia_ms'] = round(timeout * 1000, 1)
+                    resultados[sensor['id']] = leitura
+                    pendentes.discard(futuro)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return [resultados[sensor['id']] for sensor in sensores]
+
+# ===== SERVIÇO DE AQUISIÇÃO =====
+
+class ServicoAquisicao:
+    # Thread em segundo plano que percorre os sensores ativos, cada um na sua
+    # própria cadência, e publica o resultado no cache. Os endpoints de um
+    # ciclo são lidos em paralelo e cada um espera no máximo o timeout do seu
+    # driver: um gateway sem resposta não atrasa os demais sensores.
+
+    def __init__(self, obter_sensores, cache, pool=None):
+        self.obter_sensores = obter_sensores
+        self.cache = cache
+        self.pool = pool if pool is not None else PoolConexoes()
+        # Funções que recebem, a cada ciclo, a lista de leituras feitas nele
+        self.destinos = []
+        self._proxima = {}
+        # Endpoints cuja leitura estourou o timeout e ainda não retornou; não
+        # recebem outra leitura até a anterior terminar
+        self._travados = set()
+        self._leitores = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+
+    def iniciar(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name='aquisicao-sensores', daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._leitores is not None:
+            self._leitores.shutdown(wait=False, cancel_futures=True)
+            self._leitores = None
+        self.pool.fechar_todas()
+
+    def _executar(self):
+        while not self._parar.is_set():
+            try:
+                espera = self.ciclo()
+            except Exception:
+                # Um ciclo com erro não pode encerrar a aquisição
+                logger.exception('Erro no ciclo de aquisição')
+                espera = INTERVALO_PADRAO
+            self._parar.wait(espera)
+
+    def ciclo(self):
+        agora = time.monotonic()
+        ativos = [s for s in list(self.obter_sensores()) if s.get('ativo', True)]
+        ids_ativos = {s['id'] for s in ativos}
+        lote = []
+
+        # Sensores vencidos agrupados por endpoint: uma transação por grupo
+        grupos = {}
+        for sensor in ativos:
+            if self._proxima.get(sensor['id'], 0) > agora:
+                continue
+            endpoint = chave_endpoint(sensor)
+            if endpoint in self._travados:
+                continue
+            grupos.setdefault(endpoint, []).append(sensor)
+
+        for endpoint, (valores, instante) in self._ler_grupos(grupos).items():
+            for sensor in grupos[endpoint]:
+                valor = valores.get(sensor['id'])
+                if isinstance(valor, Exception):
+                    leitura = _leitura_erro(sensor['id'], str(valor), instante)
+                elif valor is None:
+                    leitura = _leitura_erro(sensor['id'], 'Canal sem resposta', instante)
+                else:
+                    leitura = _leitura_ok(sensor['id'], valor, instante)
+                lote.append(leitura)
+                intervalo = sensor.get('intervalo_leitura') or INTERVALO_PADRAO
+                self._proxima[sensor['id']] = agora + intervalo
+
+        # Destinos (série histórica, alarmes) antes do cache, para que quem é
+        # avisado pelo cache já encontre o estado de alarme atualizado
+        if lote:
+            for destino in self.destinos:
+                try:
+                    destino(lote)
+                except Exception:
+                    logger.exception('Erro ao gravar lote de leituras')
+            for leitura in lote:
+                self.cache.gravar(leitura['sensor_id'], leitura)
+
+        for sid in [sid for sid in self._proxima if sid not in ids_ativos]:
+            del self._proxima[sid]
+        self.cache.manter_apenas(ids_ativos)
+        self.pool.fechar_ociosas()
+
+        if not self._proxima:
+            return INTERVALO_PADRAO
+        return max(min(self._proxima.values()) - time.monotonic(), 0.05)
+
+    def _ler_grupos(self, grupos):
+        # {endpoint: (valores, instante)}. O timeout de cada endpoint conta a
+        # partir do início da sua leitura; quem estoura volta como erro e a
+        # thread fica com ele até o driver desistir.
+        if not grupos:
+            return {}
+        if self._leitores is None:
+            self._leitores = ThreadPoolExecutor(max_workers=MAX_THREADS_LEITURA, thread_name_prefix='aquisicao-endpoint')
+        inicios = {}
+
+        def ler(endpoint, grupo):
+            inicios[endpoint] = time.monotonic()
+            return self.pool.ler(endpoint, grupo), time.time()
+
+        futuros = {self._leitores.submit(ler, endpoint, grupo): endpoint for endpoint, grupo in grupos.items()}
+        resultados = {}
+        pendentes = set(futuros)
+        while pendentes:
+            concluidos, pendentes = wait(pendentes, timeout=0.05, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                resultados[futuros[futuro]] = futuro.result()
+            agora = time.monotonic()
+            for futuro in list(pendentes):
+                endpoint = futuros[futuro]
+                timeout = driver_para(endpoint[0]).timeout
+                inicio = inicios.get(endpoint)
+                if inicio is not None and agora - inicio > timeout:
+                    erro = TimeoutError(f'Sem resposta em {timeout:.1f}s')
+                    resultados[endpoint] = ({sensor['id']: erro for sensor in grupos[endpoint]}, time.time())
+                    pendentes.discard(futuro)
+                    self._travar(endpoint, futuro)
+        return resultados
+
+    def _travar(self, endpoint, futuro):
+        # A conexão é fechada (o que costuma destravar a leitura) e o
+        # endpoint só volta para o ciclo quando a leitura antiga terminar
+        self._travados.add(endpoint)
+        self.pool.descartar(endpoint)
+
+        futuro.add_done_callback(lambda _: self._travados.discard(endpoint))
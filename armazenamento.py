@@ -0,0 +1,384 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Backend padrão e caminho do banco podem ser trocados por variáveis de ambiente
+BACKEND_PADRAO = os.environ.get('MONITORAMENTO_ARMAZENAMENTO', 'sqlite')
+CAMINHO_PADRAO = os.environ.get('MONITORAMENTO_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'monitoramento.db'))
+
+# Alterações mais antigas que isso são descartadas do log; um processo que
+# ficar tão atrasado recarrega as coleções inteiras
+MAX_ALTERACOES = 10000
+
+class ConflitoVersao(Exception):
+    # O registro foi alterado por outra requisição (ou outro processo) depois
+    # de lido; nada foi gravado
+    pass
+
+# ===== MEMÓRIA =====
+
+class ArmazenamentoMemoria:
+    # Não persiste nada: os dados vivem apenas nas estruturas do processo.
+
+    def ja_semeado(self, colecao):
+        return False
+
+    def carregar_lista(self, colecao):
+        return []
+
+    def carregar_registros(self, colecao):
+        return {}
+
+    def salvar_item(self, colecao, item):
+        pass
+
+    def excluir_item(self, colecao, item_id):
+        pass
+
+    def salvar_registro(self, colecao, chave, dados):
+        pass
+
+    def excluir_registro(self, colecao, chave):
+        pass
+
+    def semear_lista(self, colecao, itens):
+        pass
+
+    def semear_registros(self, colecao, registros):
+        pass
+
+    # Com um único processo não há estado a compartilhar: ids e versões são
+    # controlados pelos repositórios em memória
+    def proximo_id(self, colecao, minimo):
+        return None
+
+    def salvar_versionado(self, colecao, item, versao, novos=()):
+        pass
+
+    def ultima_alteracao(self):
+        return 0
+
+    def alteracoes_desde(self, seq):
+        return seq, []
+
+    # O único processo é sempre o dono dos serviços exclusivos
+    def arrendar(self, nome, duracao):
+        return True
+
+    def publicar_leituras(self, leituras):
+        pass
+
+    def definir_se_ausente(self, colecao, chave, dados):
+        return dados
+
+    def carregar_leituras(self):
+        return []
+
+
+# ===== SQLITE =====
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS equipamentos (
+    id INTEGER PRIMARY KEY,
+    status TEXT,
+    sensor_id INTEGER,
+    versao INTEGER NOT NULL DEFAULT 0,
+    dados TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sensores (
+    id INTEGER PRIMARY KEY,
+    dados TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS processos_finalizados (
+    id INTEGER PRIMARY KEY,
+    equipamento_id INTEGER,
+    data_finalizacao TEXT,
+    status_qualidade TEXT,
+    dados TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_processos_data ON processos_finalizados (data_finalizacao);
+CREATE INDEX IF NOT EXISTS idx_processos_equipamento ON processos_finalizados (equipamento_id, data_finalizacao);
+CREATE INDEX IF NOT EXISTS idx_processos_status ON processos_finalizados (status_qualidade);
+CREATE TABLE IF NOT EXISTS historico_processos (
+    id INTEGER PRIMARY KEY,
+    dados TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS registros (
+    colecao TEXT NOT NULL,
+    chave TEXT NOT NULL,
+    dados TEXT NOT NULL,
+    PRIMARY KEY (colecao, chave)
+);
+CREATE TABLE IF NOT EXISTS colecoes_semeadas (
+    colecao TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS sequencias (
+    colecao TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS alteracoes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    colecao TEXT NOT NULL,
+    chave TEXT NOT NULL,
+    origem TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS arrendamentos (
+    nome TEXT PRIMARY KEY,
+    dono TEXT NOT NULL,
+    expira REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leituras_atuais (
+    sensor_id INTEGER PRIMARY KEY,
+    dados TEXT NOT NULL,
+    alarme TEXT
+);
+"""
+
+# Colunas acrescentadas depois da criação do esquema: (tabela, coluna, definição)
+MIGRACOES = (
+    ('equipamentos', 'versao', 'INTEGER NOT NULL DEFAULT 0'),
+)
+
+# Comandos fixos com parâmetros: o sqlite3 mantém o statement preparado em
+# cache por conexão, então cada execução reaproveita o plano já compilado.
+SQL_SALVAR = {
+    'equipamentos': 'INSERT OR REPLACE INTO equipamentos (id, status, sensor_id, versao, dados) VALUES (?, ?, ?, ?, ?)',
+    'sensores': 'INSERT OR REPLACE INTO sensores (id, dados) VALUES (?, ?)',
+    'processos_finalizados': 'INSERT OR REPLACE INTO processos_finalizados (id, equipamento_id, data_finalizacao, status_qualidade, dados) VALUES (?, ?, ?, ?, ?)',
+    'historico_processos': 'INSERT OR REPLACE INTO historico_processos (id, dados) VALUES (?, ?)',
+}
+SQL_SALVAR_REGISTRO = 'INSERT OR REPLACE INTO registros (colecao, chave, dados) VALUES (?, ?, ?)'
+SQL_EXCLUIR_REGISTRO = 'DELETE FROM registros WHERE colecao = ? AND chave = ?'
+SQL_CARREGAR_REGISTROS = 'SELECT chave, dados FROM registros WHERE colecao = ?'
+SQL_MARCAR_SEMEADO = 'INSERT OR IGNORE INTO colecoes_semeadas (colecao) VALUES (?)'
+# Atualização condicionada à versão lida: zero linhas afetadas = conflito
+SQL_SALVAR_VERSIONADO = {
+    'equipamentos': 'UPDATE equipamentos SET status = ?, sensor_id = ?, versao = ?, dados = ? WHERE id = ? AND versao = ?',
+}
+SQL_REGISTRAR_ALTERACAO = 'INSERT INTO alteracoes (colecao, chave, origem) VALUES (?, ?, ?)'
+SQL_ALTERACOES_DESDE = 'SELECT colecao, chave FROM alteracoes WHERE seq > ? AND seq <= ? AND origem != ? ORDER BY seq'
+# Assume (ou renova) o arrendamento se estiver livre, vencido ou já for nosso
+SQL_ARRENDAR = '''
+INSERT INTO arrendamentos (nome, dono, expira) VALUES (?, ?, ?)
+ON CONFLICT (nome) DO UPDATE SET dono = excluded.dono, expira = excluded.expira
+WHERE arrendamentos.dono = excluded.dono OR arrendamentos.expira < ?
+'''
+SQL_PUBLICAR_LEITURA = 'INSERT OR REPLACE INTO leituras_atuais (sensor_id, dados, alarme) VALUES (?, ?, ?)'
+
+def _parametros(colecao, item):
+    dados = json.dumps(item, ensure_ascii=False)
+    if colecao == 'equipamentos':
+        return (item['id'], item.get('status'), item.get('sensor_id'), item.get('versao', 0), dados)
+    if colecao == 'processos_finalizados':
+        return (item['id'], item.get('equipamento_id'), item.get('data_finalizacao'), item.get('status_qualidade'), dados)
+    return (item['id'], dados)
+
+class ArmazenamentoSQLite:
+    # Vários processos (workers) podem abrir o mesmo banco. Cada escrita
+    # entra no log de alterações com a origem de quem gravou, para que os
+    # outros processos atualizem suas coleções em memória (ver
+    # estado_compartilhado.py).
+
+    def __init__(self, caminho=CAMINHO_PADRAO):
+        self.caminho = caminho
+        self.origem = uuid.uuid4().hex
+        self._local = threading.local()
+        conexao = self._conexao()
+        conexao.execute('PRAGMA journal_mode=WAL')
+        conexao.executescript(ESQUEMA)
+        self._migrar(conexao)
+
+    def _migrar(self, conexao):
+        for tabela, coluna, definicao in MIGRACOES:
+            colunas = {linha[1] for linha in conexao.execute(f'PRAGMA table_info({tabela})')}
+            if coluna not in colunas:
+                with conexao:
+                    conexao.execute(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}')
+
+    def _conexao(self):
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=10, cached_statements=256)
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            conexao.execute('PRAGMA busy_timeout=10000')
+            self._local.conexao = conexao
+        return conexao
+
+    def ja_semeado(self, colecao):
+        linha = self._conexao().execute('SELECT 1 FROM colecoes_semeadas WHERE colecao = ?', (colecao,)).fetchone()
+        return linha is not None
+
+    def carregar_lista(self, colecao):
+        linhas = self._conexao().execute(f'SELECT dados FROM {colecao} ORDER BY id').fetchall()
+        return [json.loads(dados) for (dados,) in linhas]
+
+    def carregar_registros(self, colecao):
+        linhas = self._conexao().execute(SQL_CARREGAR_REGISTROS, (colecao,)).fetchall()
+        return {chave: json.loads(dados) for chave, dados in linhas}
+
+    def carregar_item(self, colecao, chave):
+        if colecao in SQL_SALVAR:
+            linha = self._conexao().execute(f'SELECT dados FROM {colecao} WHERE id = ?', (int(chave),)).fetchone()
+        else:
+            linha = self._conexao().execute('SELECT dados FROM registros WHERE colecao = ? AND chave = ?', (colecao, chave)).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    def _registrar_alteracao(self, conexao, colecao, chave):
+        seq = conexao.execute(SQL_REGISTRAR_ALTERACAO, (colecao, str(chave), self.origem)).lastrowid
+        if seq % 1000 == 0:
+            conexao.execute('DELETE FROM alteracoes WHERE seq <= ?', (seq - MAX_ALTERACOES,))
+
+    def salvar_item(self, colecao, item):
+        with self._conexao() as conexao:
+            conexao.execute(SQL_SALVAR[colecao], _parametros(colecao, item))
+            self._registrar_alteracao(conexao, colecao, item['id'])
+
+    def excluir_item(self, colecao, item_id):
+        with self._conexao() as conexao:
+            conexao.execute(f'DELETE FROM {colecao} WHERE id = ?', (item_id,))
+            self._registrar_alteracao(conexao, colecao, item_id)
+
+    def salvar_registro(self, colecao, chave, dados):
+        with self._conexao() as conexao:
+            conexao.execute(SQL_SALVAR_REGISTRO, (colecao, chave, json.dumps(dados, ensure_ascii=False)))
+            self._registrar_alteracao(conexao, colecao, chave)
+
+    def excluir_registro(self, colecao, chave):
+        with self._conexao() as conexao:
+            conexao.execute(SQL_EXCLUIR_REGISTRO, (colecao, chave))
+            self._registrar_alteracao(conexao, colecao, chave)
+
+    def proximo_id(self, colecao, minimo):
+        # Sequência no banco, incrementada dentro de uma transação de escrita:
+        # dois processos nunca recebem o mesmo id
+        with self._conexao() as conexao:
+            conexao.execute('INSERT OR IGNORE INTO sequencias (colecao, valor) VALUES (?, 0)', (colecao,))
+            conexao.execute(
+                f'UPDATE sequencias SET valor = MAX(valor + 1, ?, (SELECT COALESCE(MAX(id), 0) + 1 FROM {colecao})) WHERE colecao = ?',
+                (minimo, colecao)
+            )
+            return conexao.execute('SELECT valor FROM sequencias WHERE colecao = ?', (colecao,)).fetchone()[0]
+
+    def salvar_versionado(self, colecao, item, versao, novos=()):
+        # Grava o item (já com a versão nova) só se a versão no banco ainda for
+        # a lida; os itens de 'novos' ((coleção, item)) entram na mesma transação
+        parametros = _parametros(colecao, item)
+        with self._conexao() as conexao:
+            cursor = conexao.execute(SQL_SALVAR_VERSIONADO[colecao], parametros[1:] + (item['id'], versao))
+            if cursor.rowcount == 0:
+                raise ConflitoVersao(f'{colecao} {item["id"]} foi alterado por outro usuário')
+            self._registrar_alteracao(conexao, colecao, item['id'])
+            for colecao_novo, novo in novos:
+                conexao.execute(SQL_SALVAR[colecao_novo], _parametros(colecao_novo, novo))
+                self._registrar_alteracao(conexao, colecao_novo, novo['id'])
+
+    def ultima_alteracao(self):
+        return self._conexao().execute('SELECT COALESCE(MAX(seq), 0) FROM alteracoes').fetchone()[0]
+
+    def alteracoes_desde(self, seq):
+        # (última seq, [(coleção, chave, dados ou None se excluído)]) com o que
+        # outros processos gravaram depois de 'seq'. Se parte do intervalo já
+        # foi descartada do log, a lista vem como None: recarregar tudo.
+        conexao = self._conexao()
+        ultima = self.ultima_alteracao()
+        if ultima <= seq:
+            return seq, []
+        primeira = conexao.execute('SELECT MIN(seq) FROM alteracoes').fetchone()[0]
+        if primeira > seq + 1:
+            return ultima, None
+        linhas = conexao.execute(SQL_ALTERACOES_DESDE, (seq, ultima, self.origem)).fetchall()
+        chaves = list(dict.fromkeys((colecao, chave) for colecao, chave in linhas))
+        return ultima, [(colecao, chave, self.carregar_item(colecao, chave)) for colecao, chave in chaves]
+
+    def arrendar(self, nome, duracao):
+        # True se este processo é (ou passou a ser) o dono de 'nome' pelos
+        # próximos 'duracao' segundos
+        agora = time.time()
+        with self._conexao() as conexao:
+            conexao.execute(SQL_ARRENDAR, (nome, self.origem, agora + duracao, agora))
+            dono = conexao.execute('SELECT dono FROM arrendamentos WHERE nome = ?', (nome,)).fetchone()[0]
+        return dono == self.origem
+
+    def definir_se_ausente(self, colecao, chave, dados):
+        # Grava só se a chave ainda não existir; retorna o valor que ficou
+        with self._conexao() as conexao:
+            conexao.execute('INSERT OR IGNORE INTO registros (colecao, chave, dados) VALUES (?, ?, ?)', (colecao, chave, json.dumps(dados, ensure_ascii=False)))
+            linha = conexao.execute('SELECT dados FROM registros WHERE colecao = ? AND chave = ?', (colecao, chave)).fetchone()
+        return json.loads(linha[0])
+
+    def publicar_leituras(self, leituras):
+        # leituras: [(sensor_id, leitura, estado do alarme ou None)]
+        with self._conexao() as conexao:
+            conexao.executemany(SQL_PUBLICAR_LEITURA, [
+                (sensor_id, json.dumps(leitura, ensure_ascii=False), json.dumps(alarme) if alarme else None)
+                for sensor_id, leitura, alarme in leituras
+            ])
+
+    def carregar_leituras(self):
+        linhas = self._conexao().execute('SELECT sensor_id, dados, alarme FROM leituras_atuais').fetchall()
+        return [(sensor_id, json.loads(dados), json.loads(alarme) if alarme else None) for sensor_id, dados, alarme in linhas]
+
+    def semear_lista(self, colecao, itens):
+        with self._conexao() as conexao:
+            conexao.executemany(SQL_SALVAR[colecao], [_parametros(colecao, item) for item in itens])
+            conexao.execute(SQL_MARCAR_SEMEADO, (colecao,))
+
+    def semear_registros(self, colecao, registros):
+        with self._conexao() as conexao:
+            conexao.executemany(SQL_SALVAR_REGISTRO, [
+                (colecao, chave, json.dumps(dados, ensure_ascii=False)) for chave, dados in registros.items()
+            ])
+            conexao.execute(SQL_MARCAR_SEMEADO, (colecao,))
+
+def ler_processos(caminho, data_inicio=None, data_fim=None, equip_id=None):
+    # Processos finalizados do período lidos direto do banco, um a um e na
+    # mesma ordem de RepositorioProcessos.consultar. Usado pelos processos de
+    # relatório, que não carregam as coleções em memória.
+    condicoes, parametros = [], []
+    if data_inicio:
+        condicoes.append('data_finalizacao >= ?')
+        parametros.append(data_inicio)
+    if data_fim:
+        condicoes.append('data_finalizacao <= ?')
+        parametros.append(data_fim + '\uffff')
+    if equip_id is not None:
+        condicoes.append('equipamento_id = ?')
+        parametros.append(equip_id)
+    onde = f'WHERE {" AND ".join(condicoes)}' if condicoes else ''
+    conexao = sqlite3.connect(caminho, timeout=10)
+    try:
+        conexao.execute('PRAGMA query_only=ON')
+        for (dados,) in conexao.execute(f'SELECT dados FROM processos_finalizados {onde} ORDER BY data_finalizacao, id', parametros):
+            yield json.loads(dados)
+    finally:
+        conexao.close()
+
+# ===== FÁBRICA =====
+
+BACKENDS = {
+    'memoria': ArmazenamentoMemoria,
+    'sqlite': ArmazenamentoSQLite,
+}
+
+def criar_armazenamento(backend=BACKEND_PADRAO):
+    if backend not in BACKENDS:
+        raise ValueError(f'Backend de armazenamento desconhecido: {backend}')
+    return BACKENDS[backend]()
+
+def sincronizar_lista(armazenamento, colecao, itens):
+    # Carrega a coleção persistida sobre a lista (mantendo o mesmo objeto) ou,
+    # na primeira execução, grava os dados iniciais.
+    if armazenamento.ja_semeado(colecao):
+        itens[:] = armazenamento.carregar_lista(colecao)
+    else:
+        armazenamento.semear_lista(colecao, itens)
+
+def sincronizar_registros(armazenamento, colecao, registros):
+    if armazenamento.ja_semeado(colecao):
+        registros.clear()
+        registros.update(armazenamento.carregar_registros(colecao))
+    else:
+        armazenamento.semear_registros(colecao, registros)
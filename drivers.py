@@ -0,0 +1,208 @@
+import json
+import os
+import random
+import threading
+import time
+
+# Drivers de comunicação, um por protocolo. Cada driver é aberto para um
+# endpoint (ver chave_endpoint) e lê vários sensores por transação:
+#
+#   driver = abrir_driver(endpoint)   # conectar()
+#   driver.ler_lote(sensores)         # {sensor_id: temperatura ou exceção}
+#   driver.fechar()
+#
+# Enquanto o protocolo de cada dispositivo não é implementado, as leituras
+# vêm do simulador, que é determinístico e configurável por ambiente:
+#   MONITORAMENTO_SIMULACAO='{"latencia": 0.05, "taxa_falha": 0.1}'
+
+# ===== SIMULADOR =====
+
+SIMULACAO_PADRAO = {
+    'latencia': 0.0,        # segundos por transação
+    'latencia_canal': 0.0,  # segundos adicionais por sensor lido
+    'ruido': 0.15,          # desvio padrão da leitura (°C)
+    'deriva': 0.0,          # variação da base a cada leitura (°C)
+    'taxa_falha': 0.02,     # fração de leituras com falha de comunicação
+    'temp_min': 20.0,       # faixa da temperatura base de cada sensor
+    'temp_max': 30.0,
+    'semente': 42,
+}
+
+def _opcoes_ambiente():
+    opcoes = dict(SIMULACAO_PADRAO)
+    texto = os.environ.get('MONITORAMENTO_SIMULACAO')
+    if texto:
+        opcoes.update(json.loads(texto))
+    return opcoes
+
+class Simulador:
+    # Cada sensor tem seu próprio gerador, semeado por (semente, id): a
+    # sequência de leituras e falhas se repete a cada execução.
+
+    def __init__(self, **opcoes):
+        self.opcoes = dict(SIMULACAO_PADRAO, **opcoes)
+        self._lock = threading.Lock()
+        self._estado = {}
+
+    def configurar(self, **opcoes):
+        with self._lock:
+            self.opcoes.update(opcoes)
+            self._estado.clear()
+
+    def _estado_sensor(self, sensor_id):
+        estado = self._estado.get(sensor_id)
+        if estado is None:
+            gerador = random.Random(self.opcoes['semente'] * 1000003 + sensor_id)
+            base = gerador.uniform(self.opcoes['temp_min'], self.opcoes['temp_max'])
+            estado = self._estado[sensor_id] = {'gerador': gerador, 'base': base}
+        return estado
+
+    def ler(self, sensor_id):
+        with self._lock:
+            estado = self._estado_sensor(sensor_id)
+            gerador = estado['gerador']
+            estado['base'] += self.opcoes['deriva']
+            falhou = gerador.random() < self.opcoes['taxa_falha']
+            valor = estado['base'] + gerador.gauss(0, self.opcoes['ruido'])
+        if falhou:
+            raise IOError('Falha na comunicação. Verifique as configurações.')
+        return round(valor, 2)
+
+    def ler_lote(self, sensores):
+        espera = self.opcoes['latencia'] + self.opcoes['latencia_canal'] * len(sensores)
+        if espera:
+            time.sleep(espera)
+        valores = {}
+        for sensor in sensores:
+            try:
+                valores[sensor['id']] = self.ler(sensor['id'])
+            except Exception as e:
+                valores[sensor['id']] = e
+        return valores
+
+simulador = Simulador(**_opcoes_ambiente())
+# Os testes de comunicação têm o próprio simulador: testar um sensor não
+# consome a sequência de leituras que a aquisição contínua está usando
+simulador_teste = Simulador(**_opcoes_ambiente())
+
+# ===== DRIVERS =====
+
+DRIVERS = {}
+
+def registrar_driver(classe):
+    DRIVERS[classe.protocolo] = classe
+    return classe
+
+class Driver:
+    protocolo = None
+    # Pares (chave na config do sensor, campo do formulário)
+    campos = ()
+    # Tempo máximo de resposta de uma transação (segundos)
+    timeout = 3.0
+
+    def __init__(self, endpoint, fonte=None):
+        self.endpoint = endpoint
+        self.fonte = fonte or simulador
+        self.transacoes = 0
+
+    @classmethod
+    def config_do_formulario(cls, form):
+        return {chave: form.get(campo) for chave, campo in cls.campos}
+
+    @classmethod
+    def chave_endpoint(cls, sensor):
+        # Padrão: uma conexão por sensor
+        return (cls.protocolo, 'sensor', sensor['id'])
+
+    def conectar(self):
+        pass
+
+    def ler_lote(self, sensores):
+        self.transacoes += 1
+        return self.fonte.ler_lote(sensores)
+
+    def fechar(self):
+        pass
+
+@registrar_driver
+class DriverRede(Driver):
+    # Caixas de aquisição com vários canais no mesmo (ip, porta)
+    protocolo = 'rede'
+    campos = (('ip', 'ip'), ('porta', 'porta'), ('canal', 'canal'))
+    timeout = 2.0
+
+    @classmethod
+    def chave_endpoint(cls, sensor):
+        config = sensor.get('config') or {}
+        if not config.get('ip'):
+            return super().chave_endpoint(sensor)
+        return (cls.protocolo, config['ip'], str(config.get('porta') or ''))
+
+@registrar_driver
+class DriverUsbCom(Driver):
+    protocolo = 'usb_com'
+    campos = (('porta_com', 'porta_com'), ('baud_rate', 'baud_rate'))
+
+@registrar_driver
+class DriverI2C(Driver):
+    protocolo = 'i2c'
+    campos = (('endereco', 'endereco'), ('barramento', 'barramento'))
+    timeout = 0.5
+
+@registrar_driver
+class DriverSerial(Driver):
+    protocolo = 'serial'
+    campos = (('porta', 'porta_serial'), ('baud_rate', 'baud_rate_serial'))
+
+@registrar_driver
+class DriverRS232(Driver):
+    protocolo = 'rs232'
+    campos = (
+        ('porta', 'porta_rs232'),
+        ('baud_rate', 'baud_rate_rs232'),
+        ('data_bits', 'data_bits'),
+        ('stop_bits', 'stop_bits'),
+        ('parity', 'parity'),
+    )
+
+def _endereco_escravo(sensor):
+    try:
+        return int((sensor.get('config') or {}).get('endereco_escravo') or 0)
+    except ValueError:
+        return 0
+
+@registrar_driver
+class DriverModbus(Driver):
+    # Escravos no mesmo barramento, lidos em ordem de endereço
+    protocolo = 'modbus'
+    campos = (('endereco_escravo', 'endereco_escravo'), ('porta', 'porta_modbus'), ('baud_rate', 'baud_rate_modbus'))
+    timeout = 1.5
+
+    @classmethod
+    def chave_endpoint(cls, sensor):
+        config = sensor.get('config') or {}
+        if not config.get('porta'):
+            return super().chave_endpoint(sensor)
+        return (cls.protocolo, config['porta'], str(config.get('baud_rate') or ''))
+
+    def ler_lote(self, sensores):
+        return super().ler_lote(sorted(sensores, key=_endereco_escravo))
+
+# ===== REGISTRO =====
+
+def driver_para(protocolo):
+    # Protocolos sem driver próprio usam o genérico (simulado)
+    return DRIVERS.get(protocolo, Driver)
+
+def chave_endpoint(sensor):
+    return driver_para(sensor.get('tipo_comunicacao')).chave_endpoint(sensor)
+
+def config_sensor(protocolo, form):
+    if protocolo not in DRIVERS:
+        return {}
+    return DRIVERS[protocolo].config_do_formulario(form)
+
+def abrir_driver(endpoint, fonte=None):
+    driver = driver_para(endpoint[0])(endpoint, fonte)
+    driver.conectar()
+    return driver
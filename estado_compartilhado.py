@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Com vários workers (processos) servindo a aplicação, cada um mantém as
+# coleções em memória e o banco é a fonte comum. Antes de cada requisição o
+# worker aplica o que os outros gravaram desde a última sincronização, lendo
+# o log de alterações do armazenamento. Conflitos de escrita são resolvidos
+# pela versão dos equipamentos (ConflitoVersao) e os ids novos vêm de uma
+# sequência no banco.
+
+# Arrendamento dos serviços exclusivos: validade e intervalo de leitura das
+# leituras publicadas pelos demais workers (segundos)
+DURACAO_ARRENDAMENTO = 15
+INTERVALO_ACOMPANHAMENTO = 1.0
+
+class SincronizadorEstado:
+
+    def __init__(self, armazenamento):
+        self.armazenamento = armazenamento
+        self._repositorios = {}
+        self._registros = {}
+        self._lock = threading.Lock()
+        # Funções chamadas com (coleção, chave, dados ou None) a cada item recebido
+        self.ouvintes = []
+        # Tomada antes de carregar as coleções: nada gravado depois se perde
+        self._seq = armazenamento.ultima_alteracao()
+
+    def registrar_repositorio(self, repositorio):
+        self._repositorios[repositorio.colecao] = repositorio
+
+    def registrar_registros(self, colecao, registros):
+        self._registros[colecao] = registros
+
+    def sincronizar(self):
+        # Barato quando nada mudou: uma consulta pela última seq do log
+        with self._lock:
+            seq, alteracoes = self.armazenamento.alteracoes_desde(self._seq)
+            if alteracoes is None:
+                alteracoes = self._tudo()
+            for colecao, chave, dados in alteracoes:
+                self._aplicar(colecao, chave, dados)
+            self._seq = seq
+            return len(alteracoes)
+
+    def _tudo(self):
+        # O log não cobre mais o intervalo perdido: compara as coleções inteiras
+        alteracoes = []
+        for colecao, repositorio in self._repositorios.items():
+            atuais = {item['id']: item for item in self.armazenamento.carregar_lista(colecao)}
+            alteracoes += [(colecao, item['id'], None) for item in repositorio.todos() if item['id'] not in atuais]
+            alteracoes += [(colecao, item_id, item) for item_id, item in atuais.items()]
+        for colecao, registros in self._registros.items():
+            atuais = self.armazenamento.carregar_registros(colecao)
+            alteracoes += [(colecao, chave, None) for chave in list(registros) if chave not in atuais]
+            alteracoes += [(colecao, chave, dados) for chave, dados in atuais.items()]
+        return alteracoes
+
+    def _aplicar(self, colecao, chave, dados):
+        repositorio = self._repositorios.get(colecao)
+        if repositorio is not None:
+            if dados is None:
+                repositorio.descartar(int(chave))
+            else:
+                repositorio.aplicar(dados)
+        elif colecao in self._registros:
+            if dados is None:
+                self._registros[colecao].pop(chave, None)
+            else:
+                self._registros[colecao][chave] = dados
+        else:
+            return
+        for ouvinte in self.ouvintes:
+            try:
+                ouvinte(colecao, chave, dados)
+            except Exception:
+                logger.exception('Erro ao aplicar alteração de %s', colecao)
+
+class ServicosExclusivos:
+    # Serviços que só podem rodar em um worker por vez (aquisição, alarmes,
+    # notificações): quem detém o arrendamento no banco executa 'iniciar' e
+    # o renova a cada terço da validade; os demais chamam 'acompanhar' a
+    # cada segundo para ler o que o dono publicou. Se o dono parar de
+    # renovar, outro worker assume quando o arrendamento vence.
+
+    def __init__(self, armazenamento, iniciar, parar, acompanhar, nome='aquisicao', duracao=DURACAO_ARRENDAMENTO):
+        self.armazenamento = armazenamento
+        self.iniciar_servicos = iniciar
+        self.parar_servicos = parar
+        self.acompanhar = acompanhar
+        self.nome = nome
+        self.duracao = duracao
+        self.dono = False
+        self._valido_ate = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+
+    def iniciar(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name=f'arrendamento-{self.nome}', daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self.dono:
+            self.parar_servicos()
+            self.dono = False
+
+    def _executar(self):
+        while not self._parar.is_set():
+            self.renovar()
+            limite = time.monotonic() + self.duracao / 3
+            while not self._parar.is_set() and time.monotonic() < limite:
+                if not self.dono:
+                    try:
+                        self.acompanhar()
+                    except Exception:
+                        logger.exception('Erro ao ler o estado publicado por %s', self.nome)
+                self._parar.wait(INTERVALO_ACOMPANHAMENTO)
+
+    def renovar(self):
+        # O prazo local é medido a partir de antes da chamada, então vence
+        # no máximo junto com o registro no banco
+        inicio = time.monotonic()
+        try:
+            dono = self.armazenamento.arrendar(self.nome, self.duracao)
+        except Exception:
+            logger.exception('Erro ao renovar o arrendamento de %s', self.nome)
+            # Falha transitória do banco: o arrendamento já obtido continua
+            # valendo até vencer, e nenhum outro worker pode assumir antes
+            dono = self.dono and time.monotonic() < self._valido_ate
+        else:
+            if dono:
+                self._valido_ate = inicio + self.duracao
+        if dono and not self.dono:
+            self.iniciar_servicos()
+        elif self.dono and not dono:
+            self.parar_servicos()
+        self.dono = dono
+        return dono
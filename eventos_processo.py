@@ -0,0 +1,318 @@
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+CAMINHO_EVENTOS = os.environ.get('MONITORAMENTO_EVENTOS_PROCESSO', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados', 'eventos', 'processos.jsonl'))
+
+# Log só de acréscimo com cada transição de equipamento (uma linha JSON por
+# evento). A linha é escrita na hora, com O_APPEND e num único write, e fica
+# visível para os outros workers; o fsync é feito em lote por uma thread.
+# As projeções (status atual, tempo em cada status, pendências da qualidade)
+# são atualizadas lendo o log a partir da última posição aplicada, então
+# todos os workers chegam ao mesmo resultado. Na partida elas vêm do último
+# snapshot mais o trecho do log gravado depois dele. Outras projeções
+# (ex.: agregados do analitico.py) entram em 'extras' e vão no mesmo snapshot.
+
+# fsync depois de tantos eventos ou tantos segundos desde a primeira escrita pendente
+LOTE_FSYNC = 64
+INTERVALO_FSYNC = 0.2
+# Snapshot das projeções a cada tantos eventos aplicados
+SNAPSHOT_A_CADA = 1000
+VERSAO_SNAPSHOT = 2
+# Leitura do log de trás para frente, em blocos deste tamanho
+BLOCO_LEITURA = 65536
+
+# Eventos que deixam um processo esperando a qualidade e os que o resolvem
+EVENTOS_PENDENCIA = ('processo_finalizado', 'higienizacao_finalizada')
+EVENTOS_ANALISE = ('qualidade_aprovado', 'qualidade_rejeitado')
+
+# ===== PROJEÇÕES =====
+
+class ProjecoesProcesso:
+    # Estado derivado do log. Chaves por equipamento são strings, para o
+    # snapshot em JSON voltar igual.
+
+    def __init__(self, estado=None):
+        estado = estado or {}
+        # id → {'status', 'desde'}
+        self.status = estado.get('status', {})
+        # id → {status: segundos} dos intervalos já encerrados
+        self.tempos = estado.get('tempos', {})
+        # id → {tipo de evento: quantidade}
+        self.contadores = estado.get('contadores', {})
+        # id → processos aguardando a qualidade
+        self.pendentes = estado.get('pendentes', {})
+
+    def exportar(self):
+        return {'status': self.status, 'tempos': self.tempos, 'contadores': self.contadores, 'pendentes': self.pendentes}
+
+    def aplicar(self, evento):
+        chave = str(evento['equipamento_id'])
+        instante = evento['ts']
+        atual = self.status.get(chave)
+        if atual is not None:
+            # Fecha o intervalo no status anterior; relógios de workers
+            # diferentes podem divergir um pouco, então nunca negativo
+            tempos = self.tempos.setdefault(chave, {})
+            tempos[atual['status']] = tempos.get(atual['status'], 0) + max(instante - atual['desde'], 0)
+
+        if evento['tipo'] == 'equipamento_excluido':
+            self.status.pop(chave, None)
+        elif evento.get('status') and (atual is None or atual['status'] != evento['status']):
+            self.status[chave] = {'status': evento['status'], 'desde': instante}
+        elif atual is not None:
+            atual['desde'] = max(instante, atual['desde'])
+
+        contadores = self.contadores.setdefault(chave, {})
+        contadores[evento['tipo']] = contadores.get(evento['tipo'], 0) + 1
+        if evento['tipo'] in EVENTOS_PENDENCIA:
+            self.pendentes[chave] = self.pendentes.get(chave, 0) + 1
+        elif evento['tipo'] in EVENTOS_ANALISE and self.pendentes.get(chave):
+            self.pendentes[chave] -= 1
+            if not self.pendentes[chave]:
+                del self.pendentes[chave]
+
+    def ocupacao(self, equip_id, agora=None):
+        # Tempo em cada status, incluindo o intervalo em aberto, e as taxas
+        # no estilo OEE: ocupação (em processo) e disponibilidade (fora de manutenção)
+        chave = str(equip_id)
+        agora = time.time() if agora is None else agora
+        tempos = dict(self.tempos.get(chave, {}))
+        atual = self.status.get(chave)
+        if atual is not None:
+            tempos[atual['status']] = tempos.get(atual['status'], 0) + max(agora - atual['desde'], 0)
+        total = sum(tempos.values())
+        return {
+            'tempos': {status: round(segundos, 1) for status, segundos in tempos.items()},
+            'total': round(total, 1),
+            'ocupacao': round(tempos.get('ocupada', 0) / total, 4) if total else None,
+            'disponibilidade': round(1 - tempos.get('manutencao', 0) / total, 4) if total else None,
+        }
+
+    def resumo(self, agora=None):
+        agora = time.time() if agora is None else agora
+        por_status = {}
+        for atual in self.status.values():
+            por_status[atual['status']] = por_status.get(atual['status'], 0) + 1
+        return {
+            'por_status': por_status,
+            'pendentes_qualidade': sum(self.pendentes.values()),
+            'equipamentos': {
+                int(chave): dict(atual, ocupacao=self.ocupacao(chave, agora), contadores=self.contadores.get(chave, {}), pendentes_qualidade=self.pendentes.get(chave, 0))
+                for chave, atual in self.status.items()
+            },
+        }
+
+# ===== LOG =====
+
+class LogEventosProcesso:
+
+    def __init__(self, caminho=CAMINHO_EVENTOS, snapshot_a_cada=SNAPSHOT_A_CADA, extras=None):
+        # extras: nome → objeto com aplicar(evento), exportar() e importar(estado)
+        self.caminho = caminho
+        self.extras = extras or {}
+        self.caminho_snapshot = caminho + '.snapshot'
+        self.snapshot_a_cada = snapshot_a_cada
+        self._lock = threading.RLock()
+        self._condicao = threading.Condition(threading.Lock())
+        self._pendentes_fsync = 0
+        self._thread = None
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        self._fd = os.open(caminho, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._terminar_linha_cortada()
+        self.posicao = 0
+        self.aplicados_desde_snapshot = 0
+        self.ignorados = 0
+        self.projecoes = ProjecoesProcesso()
+        self.carga = self._carregar()
+        atexit.register(self.fechar)
+
+    def _terminar_linha_cortada(self):
+        # Queda no meio de uma escrita deixa a última linha sem '\n'; sem
+        # fechá-la, o próximo evento seria colado nela
+        tamanho = os.fstat(self._fd).st_size
+        if tamanho:
+            with open(self.caminho, 'rb') as arquivo:
+                arquivo.seek(tamanho - 1)
+                if arquivo.read(1) != b'\n':
+                    os.write(self._fd, b'\n')
+
+    # ----- partida -----
+
+    def _carregar(self):
+        inicio = time.perf_counter()
+        snapshot = self._ler_snapshot()
+        if snapshot is not None:
+            self.projecoes = ProjecoesProcesso(snapshot['estado'])
+            for nome, extra in self.extras.items():
+                extra.importar(snapshot['extras'][nome])
+            self.posicao = snapshot['posicao']
+        reaplicados = self.atualizar()
+        return {
+            'snapshot': snapshot is not None,
+            'posicao_snapshot': snapshot['posicao'] if snapshot else 0,
+            'eventos_reaplicados': reaplicados,
+            'ms': round((time.perf_counter() - inicio) * 1000, 1),
+        }
+
+    def _ler_snapshot(self):
+        try:
+            with open(self.caminho_snapshot, encoding='utf-8') as arquivo:
+                snapshot = json.load(arquivo)
+        except (OSError, ValueError):
+            return None
+        # Snapshot de outro log (apagado ou trocado) não serve, nem um sem
+        # alguma das projeções extras: ela precisa do log desde o começo
+        if snapshot.get('versao') != VERSAO_SNAPSHOT or snapshot.get('posicao', 0) > os.path.getsize(self.caminho):
+            return None
+        if not set(self.extras) <= set(snapshot.get('extras', {})):
+            return None
+        return snapshot
+
+    def salvar_snapshot(self):
+        with self._lock:
+            dados = json.dumps({
+                'versao': VERSAO_SNAPSHOT,
+                'posicao': self.posicao,
+                'estado': self.projecoes.exportar(),
+                'extras': {nome: extra.exportar() for nome, extra in self.extras.items()},
+            })
+            self.aplicados_desde_snapshot = 0
+        # Troca atômica: quem ler sempre encontra um snapshot inteiro
+        temporario = f'{self.caminho_snapshot}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(dados)
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        os.replace(temporario, self.caminho_snapshot)
+
+    # ----- escrita -----
+
+    def registrar(self, tipo, equipamento_id, status=None, anterior=None, usuario=None, **dados):
+        agora = time.time()
+        evento = {
+            'tipo': tipo,
+            'equipamento_id': equipamento_id,
+            'status': status,
+            'anterior': anterior,
+            'usuario': usuario,
+            'ts': round(agora, 3),
+            'data': datetime.fromtimestamp(agora).strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        if dados:
+            evento['dados'] = dados
+        with self._lock:
+            os.write(self._fd, (json.dumps(evento, ensure_ascii=False) + '\n').encode('utf-8'))
+            self.atualizar()
+        self._agendar_fsync()
+        return evento
+
+    def _agendar_fsync(self):
+        with self._condicao:
+            self._pendentes_fsync += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sincronizar_disco, name='fsync-eventos', daemon=True)
+                self._thread.start()
+            if self._pendentes_fsync >= LOTE_FSYNC:
+                self._condicao.notify()
+
+    def _sincronizar_disco(self):
+        while True:
+            with self._condicao:
+                while not self._pendentes_fsync:
+                    self._condicao.wait()
+                # Espera o lote encher ou o prazo vencer
+                self._condicao.wait_for(lambda: self._pendentes_fsync >= LOTE_FSYNC, timeout=INTERVALO_FSYNC)
+                self._pendentes_fsync = 0
+            os.fsync(self._fd)
+
+    def fechar(self):
+        with self._condicao:
+            self._pendentes_fsync = 0
+        os.fsync(self._fd)
+        if self.aplicados_desde_snapshot:
+            self.salvar_snapshot()
+
+    # ----- projeções -----
+
+    def atualizar(self):
+        # Aplica as linhas completas gravadas (por qualquer worker) depois da
+        # última posição aplicada. Barato quando nada mudou: um stat.
+        with self._lock:
+            if os.path.getsize(self.caminho) <= self.posicao:
+                return 0
+            with open(self.caminho, 'rb') as arquivo:
+                arquivo.seek(self.posicao)
+                bloco = arquivo.read()
+            fim = bloco.rfind(b'\n') + 1
+            aplicados = 0
+            for linha in bloco[:fim].splitlines():
+                if not linha.strip():
+                    continue
+                try:
+                    evento = json.loads(linha)
+                except ValueError:
+                    # Resto de uma escrita interrompida
+                    self.ignorados += 1
+                    continue
+                self.projecoes.aplicar(evento)
+                for extra in self.extras.values():
+                    extra.aplicar(evento)
+                aplicados += 1
+            self.posicao += fim
+            self.aplicados_desde_snapshot += aplicados
+            salvar = self.aplicados_desde_snapshot >= self.snapshot_a_cada
+        if salvar:
+            self.salvar_snapshot()
+        return aplicados
+
+    def resumo(self):
+        self.atualizar()
+        with self._lock:
+            return self.projecoes.resumo()
+
+    def status_conhecido(self, equip_id):
+        with self._lock:
+            atual = self.projecoes.status.get(str(equip_id))
+            return atual['status'] if atual else None
+
+    # ----- consultas -----
+
+    def ultimos(self, limite=100, equipamento_id=None):
+        filtro = None if equipamento_id is None else (lambda evento: evento['equipamento_id'] == equipamento_id)
+        return ler_do_fim(self.caminho, limite, filtro)
+
+# ===== LEITURA =====
+
+def ler_do_fim(caminho, limite, filtro=None):
+    # Lê um arquivo JSON Lines do fim para o começo, em blocos, até juntar
+    # 'limite' eventos (os mais novos primeiro). Linhas que não são JSON
+    # válido, como o resto de uma escrita interrompida, são puladas.
+    eventos = []
+    try:
+        arquivo = open(caminho, 'rb')
+    except OSError:
+        return eventos
+    with arquivo:
+        posicao = arquivo.seek(0, os.SEEK_END)
+        resto = b''
+        while posicao > 0 and len(eventos) < limite:
+            tamanho = min(BLOCO_LEITURA, posicao)
+            posicao -= tamanho
+            arquivo.seek(posicao)
+            linhas = (arquivo.read(tamanho) + resto).split(b'\n')
+            # A primeira linha do bloco pode estar pela metade
+            resto = linhas.pop(0) if posicao > 0 else b''
+            for linha in reversed(linhas):
+                if len(eventos) >= limite:
+                    break
+                try:
+                    evento = json.loads(linha)
+                except ValueError:
+                    continue
+                if filtro is None or filtro(evento):
+                    eventos.append(evento)
+    return eventos
@@ -0,0 +1,38 @@
+import threading
+from collections import OrderedDict
+
+# Trechos de HTML já renderizados (ex.: o card de um equipamento), guardados
+# junto com a versão do dado que os gerou. Enquanto a versão for a mesma o
+# trecho é reaproveitado; a primeira leitura após uma alteração o refaz.
+
+LIMITE_PADRAO = 2000
+
+class CacheFragmentos:
+
+    def __init__(self, limite=LIMITE_PADRAO):
+        self.limite = limite
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()
+
+    def obter(self, chave, versao, gerar):
+        with self._lock:
+            entrada = self._itens.get(chave)
+            if entrada is not None and entrada[0] == versao:
+                self._itens.move_to_end(chave)
+                return entrada[1]
+
+        html = gerar()
+        with self._lock:
+            self._itens[chave] = (versao, html)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.limite:
+                self._itens.popitem(last=False)
+        return html
+
+    def descartar(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
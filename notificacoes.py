@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+import urllib.request
+from collections import defaultdict, deque
+from datetime import datetime
+from email.message import EmailMessage
+
+logger = logging.getLogger(__name__)
+
+# Eventos de alarme do mesmo equipamento dentro da janela viram uma única
+# notificação; cada destinatário recebe no máximo LIMITE_POR_DESTINATARIO
+# notificações a cada PERIODO_LIMITE segundos.
+JANELA_AGRUPAMENTO = 30
+LIMITE_POR_DESTINATARIO = 5
+PERIODO_LIMITE = 600
+TAMANHO_FILA = 10000
+TIMEOUT_ENVIO = 5
+
+CAMINHO_LOG = os.environ.get('MONITORAMENTO_NOTIFICACOES_LOG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados', 'notificacoes.log'))
+# Ex.: 'localhost:1025' para um servidor SMTP local de testes
+SMTP = os.environ.get('MONITORAMENTO_NOTIFICACOES_SMTP')
+WEBHOOK = os.environ.get('MONITORAMENTO_NOTIFICACOES_WEBHOOK')
+REMETENTE = os.environ.get('MONITORAMENTO_NOTIFICACOES_REMETENTE', 'monitoramento@empresa.com')
+
+# ===== DESTINOS DE ENTREGA =====
+
+class SinkArquivo:
+
+    def __init__(self, caminho=CAMINHO_LOG):
+        self.caminho = caminho
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+
+    def enviar(self, notificacao, destinatarios):
+        registro = dict(notificacao, destinatarios=[d['usuario'] for d in destinatarios])
+        with open(self.caminho, 'a', encoding='utf-8') as arquivo:
+            arquivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+
+class SinkSMTP:
+    # Um e-mail por destinatário com endereço cadastrado
+
+    def __init__(self, endereco, remetente=REMETENTE):
+        host, _, porta = endereco.partition(':')
+        self.host = host
+        self.porta = int(porta or 25)
+        self.remetente = remetente
+
+    def enviar(self, notificacao, destinatarios):
+        enderecos = [d['email'] for d in destinatarios if d.get('email')]
+        if not enderecos:
+            return
+        with smtplib.SMTP(self.host, self.porta, timeout=TIMEOUT_ENVIO) as servidor:
+            for endereco in enderecos:
+                mensagem = EmailMessage()
+                mensagem['From'] = self.remetente
+                mensagem['To'] = endereco
+                mensagem['Subject'] = notificacao['titulo']
+                mensagem.set_content(notificacao['texto'])
+                servidor.send_message(mensagem)
+
+class SinkWebhook:
+
+    def __init__(self, url):
+        self.url = url
+
+    def enviar(self, notificacao, destinatarios):
+        corpo = json.dumps(dict(notificacao, destinatarios=[d['usuario'] for d in destinatarios]), ensure_ascii=False)
+        requisicao = urllib.request.Request(self.url, data=corpo.encode('utf-8'), headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(requisicao, timeout=TIMEOUT_ENVIO):
+            pass
+
+def sinks_configurados():
+    sinks = [SinkArquivo()]
+    if SMTP:
+        sinks.append(SinkSMTP(SMTP))
+    if WEBHOOK:
+        sinks.append(SinkWebhook(WEBHOOK))
+    return sinks
+
+# ===== LIMITE POR DESTINATÁRIO =====
+
+class LimiteEnvio:
+    # Janela deslizante com os instantes dos últimos envios de cada destinatário
+
+    def __init__(self, limite=LIMITE_POR_DESTINATARIO, periodo=PERIODO_LIMITE):
+        self.limite = limite
+        self.periodo = periodo
+        self._envios = defaultdict(deque)
+
+    def permitir(self, chave, agora):
+        envios = self._envios[chave]
+        while envios and envios[0] <= agora - self.periodo:
+            envios.popleft()
+        if len(envios) >= self.limite:
+            return False
+        envios.append(agora)
+        return True
+
+# ===== DESPACHANTE =====
+
+class Notificador:
+    # Recebe eventos de alarme sem bloquear quem os produz (a aquisição) e
+    # faz o agrupamento, o limite e a entrega numa thread própria.
+    #   agrupar(evento) -> (chave, descrição) do equipamento afetado
+    #   obter_destinatarios() -> [{'usuario', 'nome', 'email'}, ...]
+
+    def __init__(self, agrupar, obter_destinatarios, sinks=None, janela=JANELA_AGRUPAMENTO, limite=None):
+        self.agrupar = agrupar
+        self.obter_destinatarios = obter_destinatarios
+        self.sinks = sinks if sinks is not None else sinks_configurados()
+        self.janela = janela
+        self.limite = limite or LimiteEnvio()
+        self.descartados = 0
+        self.suprimidos = 0
+        self.enviados = 0
+        self._fila = queue.Queue(maxsize=TAMANHO_FILA)
+        self._pendentes = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+
+    def enfileirar(self, eventos):
+        for evento in eventos:
+            try:
+                self._fila.put_nowait(evento)
+            except queue.Full:
+                self.descartados += 1
+
+    def iniciar(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name='notificacoes', daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.descarregar(forcar=True)
+
+    def _executar(self):
+        # Nenhum erro pode encerrar a thread: os alarmes ficariam parados na fila
+        while not self._parar.is_set():
+            try:
+                try:
+                    self._receber(self._fila.get(timeout=self._espera()))
+                except queue.Empty:
+                    pass
+                self.descarregar()
+            except Exception:
+                logger.exception('Erro no despacho de notificações')
+                self._parar.wait(1.0)
+
+    def _espera(self):
+        if not self._pendentes:
+            return 1.0
+        proximo = min(grupo['inicio'] for grupo in self._pendentes.values()) + self.janela
+        return min(max(proximo - time.monotonic(), 0.01), 1.0)
+
+    def _receber(self, evento):
+        try:
+            chave, descricao = self.agrupar(evento)
+        except Exception:
+            logger.exception('Erro ao agrupar evento de alarme')
+            self.descartados += 1
+            return
+        grupo = self._pendentes.get(chave)
+        if grupo is None:
+            grupo = self._pendentes[chave] = {'inicio': time.monotonic(), 'descricao': descricao, 'eventos': []}
+        grupo['eventos'].append(evento)
+
+    def descarregar(self, forcar=False):
+        # Processa o que já está na fila e entrega os grupos com janela vencida
+        while True:
+            try:
+                self._receber(self._fila.get_nowait())
+            except queue.Empty:
+                break
+        agora = time.monotonic()
+        vencidos = [c for c, g in self._pendentes.items() if forcar or agora - g['inicio'] >= self.janela]
+        for chave in vencidos:
+            grupo = self._pendentes.pop(chave)
+            try:
+                self._entregar(grupo)
+            except Exception:
+                logger.exception('Erro ao entregar notificação de %s', grupo['descricao'])
+
+    def _entregar(self, grupo):
+        notificacao = montar_notificacao(grupo['descricao'], grupo['eventos'])
+        agora = time.monotonic()
+        todos = self.obter_destinatarios()
+        destinatarios = [d for d in todos if self.limite.permitir(d['usuario'], agora)]
+        self.suprimidos += len(todos) - len(destinatarios)
+        # Todos já atingiram o limite: nenhum canal recebe uma lista vazia
+        if not destinatarios:
+            return
+        for sink in self.sinks:
+            try:
+                sink.enviar(notificacao, destinatarios)
+            except Exception:
+                logger.exception('Erro ao enviar notificação por %s', type(sink).__name__)
+        self.enviados += 1
+
+ROTULOS_EVENTO = {
+    ('alta', 'inicio'): 'acima do limite',
+    ('alta', 'fim'): 'voltou abaixo do limite máximo',
+    ('baixa', 'inicio'): 'abaixo do limite',
+    ('baixa', 'fim'): 'voltou acima do limite mínimo',
+    ('taxa', 'inicio'): 'variação rápida de temperatura',
+    ('taxa', 'fim'): 'variação de temperatura normalizada',
+}
+
+def montar_notificacao(descricao, eventos):
+    inicios = [e for e in eventos if e['evento'] == 'inicio']
+    titulo = f'[Alarme] {descricao}: ' + (f'{len(inicios)} alarme(s) ativado(s)' if inicios else 'alarmes normalizados')
+    linhas = [
+        f"{e['data']} - sensor {e['sensor_id']}: {ROTULOS_EVENTO.get((e['tipo'], e['evento']), e['tipo'])} ({e['valor']}°C)"
+        for e in eventos
+    ]
+    return {
+        'titulo': titulo,
+        'texto': '\n'.join(linhas),
+        'equipamento': descricao,
+        'eventos': eventos,
+        'data': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
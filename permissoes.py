@@ -0,0 +1,121 @@
+import hashlib
+import threading
+from collections import defaultdict
+
+# Permissões efetivas de cada usuário = as próprias + as do seu grupo,
+# compiladas num inteiro (um bit por permissão). A sessão guarda o inteiro
+# junto com o carimbo de versão do usuário; enquanto o carimbo bater, a
+# checagem de cada requisição é um AND de bits, sem consultar usuário nem
+# grupo. Alterar um grupo incrementa 'versao_permissoes' só dos membros
+# (índice grupo → usuários), o que invalida as sessões deles na hora.
+
+PERMISSOES_BASE = ('dashboard', 'operador', 'ti', 'manutencao', 'higienizacao', 'qualidade', 'relatorios')
+
+# Tipo do usuário derivado das permissões, na ordem de precedência
+TIPOS_POR_PERMISSAO = ('ti', 'qualidade', 'manutencao', 'higienizacao')
+TIPO_PADRAO = 'operador'
+
+# Quem tem esta permissão passa em qualquer checagem
+PERMISSAO_TOTAL = 'ti'
+
+def tipo_por_permissoes(permissoes):
+    for tipo in TIPOS_POR_PERMISSAO:
+        if permissoes.get(tipo):
+            return tipo
+    return TIPO_PADRAO
+
+def permissoes_do_formulario(form):
+    return {chave[len('perm_'):]: True for chave in form.keys() if chave.startswith('perm_')}
+
+class ResolvedorPermissoes:
+
+    def __init__(self, usuarios, grupos, obter_relatorios):
+        self.usuarios = usuarios
+        self.grupos = grupos
+        self.obter_relatorios = obter_relatorios
+        self._lock = threading.Lock()
+        self._membros = defaultdict(set)
+        self._grupo_de = {}
+        self._mascaras = {}
+        for username in list(usuarios):
+            self.indexar_usuario(username)
+        self.atualizar_catalogo()
+
+    def atualizar_catalogo(self):
+        # Permissões base com bits fixos, depois as de cada relatório em ordem
+        # de id: todos os processos chegam ao mesmo catálogo e à mesma versão
+        nomes = PERMISSOES_BASE + tuple(f'relatorio_{rid}' for rid in sorted(self.obter_relatorios()))
+        with self._lock:
+            self._bits = {nome: 1 << posicao for posicao, nome in enumerate(nomes)}
+            self.versao_catalogo = hashlib.sha1('|'.join(nomes).encode('utf-8')).hexdigest()[:8]
+            self._mascaras = {}
+
+    def mascara(self, nomes):
+        mascara = self._mascaras.get(nomes)
+        if mascara is None:
+            mascara = 0
+            for nome in nomes:
+                mascara |= self._bits.get(nome, 0)
+            self._mascaras[nomes] = mascara
+        return mascara
+
+    def _combinar(self, usuario):
+        grupo = self.grupos.get(usuario.get('grupo')) or {}
+        bits = 0
+        for permissoes in (usuario.get('permissoes') or {}, grupo.get('permissoes') or {}):
+            for nome, valor in permissoes.items():
+                if valor:
+                    bits |= self._bits.get(nome, 0)
+        return bits
+
+    def compilar(self, username):
+        # Usuário inativo não tem permissão nenhuma
+        usuario = self.usuarios.get(username)
+        if not usuario or not usuario.get('ativo', True):
+            return 0
+        return self._combinar(usuario)
+
+    def efetivas(self, username):
+        bits = self._combinar(self.usuarios[username])
+        return {nome: True for nome, bit in self._bits.items() if bits & bit}
+
+    def carimbo(self, username):
+        usuario = self.usuarios.get(username) or {}
+        return f'{username}.{self.versao_catalogo}.{usuario.get("versao_permissoes", 0)}'
+
+    def resolver(self, sessao):
+        # Bits do usuário logado; recompila só quando o carimbo muda.
+        # Retorna (bits, recompilado).
+        username = sessao.get('usuario')
+        if username is None:
+            return 0, False
+        carimbo = self.carimbo(username)
+        guardado = sessao.get('permissoes')
+        if guardado and guardado[0] == carimbo:
+            return guardado[1], False
+        bits = self.compilar(username)
+        sessao['permissoes'] = [carimbo, bits]
+        return bits, True
+
+    def permite(self, bits, nomes):
+        return bool(bits & self.mascara(tuple(nomes) + (PERMISSAO_TOTAL,)))
+
+    def indexar_usuario(self, username):
+        with self._lock:
+            anterior = self._grupo_de.pop(username, None)
+            if anterior is not None:
+                self._membros[anterior].discard(username)
+            usuario = self.usuarios.get(username)
+            if usuario and usuario.get('grupo'):
+                self._grupo_de[username] = usuario['grupo']
+                self._membros[usuario['grupo']].add(username)
+
+    def membros(self, grupo):
+        with self._lock:
+            return sorted(self._membros.get(grupo, ()))
+
+    def invalidar(self, username):
+        # Força a recompilação nas sessões do usuário e recalcula o tipo
+        usuario = self.usuarios[username]
+        usuario['versao_permissoes'] = usuario.get('versao_permissoes', 0) + 1
+        usuario['tipo'] = tipo_por_permissoes(self.efetivas(username))
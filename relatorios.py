@@ -0,0 +1,299 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import tempfile
+import unicodedata
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+from urllib.parse import quote
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_CENTER
+
+# Tamanho dos blocos enviados ao cliente e linhas por bloco CSV / tabela PDF
+TAMANHO_BLOCO = 64 * 1024
+LINHAS_POR_BLOCO_CSV = 500
+LINHAS_POR_TABELA_PDF = 500
+
+DIRETORIO_CACHE = os.environ.get('MONITORAMENTO_CACHE_RELATORIOS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados', 'cache_relatorios'))
+CACHE_MAX_ARQUIVOS = 50
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+FORMATOS = {
+    'excel': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'pdf': ('application/pdf', 'pdf'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+
+def _texto(valor):
+    return '' if valor is None else str(valor)
+
+def _maiusculas(valor):
+    return _texto(valor).upper()
+
+# Rótulo e formatador de cada campo disponível nos relatórios
+CAMPOS_RELATORIO = {
+    'equipamento': ('Equipamento', _texto),
+    'produto': ('Produto', _texto),
+    'ordem_producao': ('Ordem de Produção', _texto),
+    'responsavel': ('Responsável', _texto),
+    'data_finalizacao': ('Data Finalização', _texto),
+    'status_qualidade': ('Status Qualidade', _maiusculas),
+}
+
+# Processos projetados por vez; cada lote é montado coluna a coluna
+TAMANHO_LOTE = 1000
+
+# ===== PLANO DE PROJEÇÃO =====
+
+def _compilar_filtro(data_inicio, data_fim, equip_id):
+    # Só as condições realmente informadas entram no predicado
+    condicoes = []
+    if data_inicio:
+        condicoes.append(lambda p: p.get('data_finalizacao', '')[:10] >= data_inicio)
+    if data_fim:
+        condicoes.append(lambda p: p.get('data_finalizacao', '')[:10] <= data_fim)
+    if equip_id is not None:
+        condicoes.append(lambda p: p.get('equipamento_id') == equip_id)
+    if not condicoes:
+        return None
+    if len(condicoes) == 1:
+        return condicoes[0]
+    return lambda p: all(condicao(p) for condicao in condicoes)
+
+class PlanoRelatorio:
+    # Definição do relatório já resolvida: colunas, cabeçalho e filtro são
+    # decididos uma vez, e a execução só aplica getters e formatadores por
+    # coluna sobre lotes de processos. Todos os formatos consomem as mesmas
+    # linhas (tuplas de texto) produzidas aqui.
+
+    def __init__(self, campos, data_inicio=None, data_fim=None, equip_id=None):
+        self.colunas = [(campo, CAMPOS_RELATORIO[campo][1]) for campo in campos if campo in CAMPOS_RELATORIO]
+        self.campos = [campo for campo, _ in self.colunas]
+        self.cabecalho = [CAMPOS_RELATORIO[campo][0] for campo, _ in self.colunas]
+        self.filtros = {'data_inicio': data_inicio, 'data_fim': data_fim, 'equip_id': equip_id}
+        self.predicado = _compilar_filtro(data_inicio, data_fim, equip_id)
+
+    def selecionar(self, processos):
+        # Com o repositório, a seleção usa os índices por data e equipamento;
+        # com uma lista simples, o predicado é aplicado em uma passada
+        if hasattr(processos, 'consultar'):
+            return iter(processos.consultar(**self.filtros))
+        if self.predicado is None:
+            return iter(processos)
+        return filter(self.predicado, processos)
+
+    def projetar(self, bloco):
+        return [list(map(formatar, [p.get(campo) for p in bloco])) for campo, formatar in self.colunas]
+
+    def lotes(self, processos, tamanho=TAMANHO_LOTE):
+        selecionados = self.selecionar(processos)
+        while True:
+            bloco = list(islice(selecionados, tamanho))
+            if not bloco:
+                return
+            yield self.projetar(bloco)
+
+    def linhas(self, processos):
+        for colunas in self.lotes(processos):
+            yield from zip(*colunas)
+
+@lru_cache(maxsize=64)
+def _compilar_plano(campos, data_inicio, data_fim, equip_id):
+    return PlanoRelatorio(campos, data_inicio, data_fim, equip_id)
+
+def compilar_plano(campos, data_inicio=None, data_fim=None, equip_id=None):
+    return _compilar_plano(tuple(campos), data_inicio, data_fim, equip_id)
+
+# ===== SAÍDAS =====
+
+def gerar_csv(cabecalho, linhas):
+    # BOM e ';' para o Excel em pt-BR abrir o arquivo corretamente
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    escritor.writerow(cabecalho)
+    pendentes = 0
+    for linha in linhas:
+        escritor.writerow(linha)
+        pendentes += 1
+        if pendentes >= LINHAS_POR_BLOCO_CSV:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pendentes = 0
+    yield buffer.getvalue().encode('utf-8')
+
+def gravar_excel(caminho, cabecalho, linhas):
+    # Modo write-only: as linhas vão direto para o arquivo, sem manter a
+    # planilha inteira em memória
+    livro = Workbook(write_only=True)
+    planilha = livro.create_sheet('Relatório')
+    fonte_cabecalho = Font(bold=True)
+    celulas = []
+    for titulo in cabecalho:
+        celula = WriteOnlyCell(planilha, value=titulo)
+        celula.font = fonte_cabecalho
+        celulas.append(celula)
+    planilha.append(celulas)
+    for linha in linhas:
+        planilha.append(linha)
+    livro.save(caminho)
+
+def gravar_pdf(caminho, titulo, usuario, cabecalho, linhas):
+    doc = SimpleDocTemplate(caminho, pagesize=A4)
+    elements = []
+
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        textColor=colors.HexColor('#4A90E2'),
+        spaceAfter=30,
+        alignment=TA_CENTER
+    )
+
+    elements.append(Paragraph(titulo, title_style))
+    elements.append(Spacer(1, 0.3*inch))
+
+    info_style = ParagraphStyle('Info', parent=styles['Normal'], fontSize=9, textColor=colors.grey)
+    elements.append(Paragraph(f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", info_style))
+    elements.append(Paragraph(f"Usuário: {usuario}", info_style))
+    elements.append(Spacer(1, 0.3*inch))
+
+    estilo_tabela = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4A90E2')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+    ])
+
+    # Tabelas em blocos: o layout de uma tabela única cresce de forma
+    # não linear com o número de linhas
+    bloco = []
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) >= LINHAS_POR_TABELA_PDF:
+            elements.append(_tabela_pdf(cabecalho, bloco, estilo_tabela))
+            bloco = []
+    if bloco:
+        elements.append(_tabela_pdf(cabecalho, bloco, estilo_tabela))
+
+    doc.build(elements)
+
+def _tabela_pdf(cabecalho, bloco, estilo):
+    tabela = Table([cabecalho] + bloco, repeatRows=1)
+    tabela.setStyle(estilo)
+    return tabela
+
+# ===== ENVIO =====
+
+def arquivo_temporario(extensao):
+    descritor, caminho = tempfile.mkstemp(suffix=f'.{extensao}', prefix='relatorio_')
+    os.close(descritor)
+    return caminho
+
+def transmitir_arquivo(caminho, remover=True):
+    try:
+        with open(caminho, 'rb') as arquivo:
+            while True:
+                bloco = arquivo.read(TAMANHO_BLOCO)
+                if not bloco:
+                    break
+                yield bloco
+    finally:
+        if remover:
+            os.remove(caminho)
+
+def cabecalho_download(nome_arquivo):
+    ascii_nome = unicodedata.normalize('NFKD', nome_arquivo).encode('ascii', 'ignore').decode('ascii') or 'relatorio'
+    return f"attachment; filename=\"{ascii_nome}\"; filename*=UTF-8''{quote(nome_arquivo)}"
+
+# ===== CACHE =====
+
+def chave_relatorio(relatorio, formato, layout, filtros, versao_dados, usuario=None):
+    # Tudo que altera o arquivo gerado entra na chave; assim editar o layout
+    # ou os dados do período simplesmente deixa de encontrar a versão antiga
+    partes = {
+        'relatorio': relatorio['id'],
+        'nome': relatorio['nome'],
+        'campos': relatorio['campos'],
+        'formato': formato,
+        'layout': layout,
+        'filtros': filtros,
+        'versao': versao_dados,
+        'usuario': usuario,
+    }
+    texto = json.dumps(partes, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+class CacheRelatorios:
+    # Arquivos prontos em disco, nomeados pela chave. O mtime marca o último
+    # uso e orienta a remoção (LRU) quando o limite de arquivos ou de bytes é
+    # ultrapassado. Por ser só o diretório, vale para todos os workers.
+
+    def __init__(self, diretorio=DIRETORIO_CACHE, max_arquivos=CACHE_MAX_ARQUIVOS, max_bytes=CACHE_MAX_BYTES):
+        self.diretorio = diretorio
+        self.max_arquivos = max_arquivos
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, chave, extensao):
+        return os.path.join(self.diretorio, f'{chave}.{extensao}')
+
+    def obter(self, chave, extensao):
+        caminho = self._caminho(chave, extensao)
+        try:
+            os.utime(caminho)
+        except OSError:
+            return None
+        return caminho
+
+    def guardar(self, chave, extensao, caminho_origem):
+        caminho = self._caminho(chave, extensao)
+        temporario = caminho + '.tmp'
+        shutil.move(caminho_origem, temporario)
+        os.replace(temporario, caminho)
+        self._remover_excedentes()
+        return caminho
+
+    def _remover_excedentes(self):
+        with self._lock:
+            arquivos = []
+            for nome in os.listdir(self.diretorio):
+                if nome.endswith('.tmp'):
+                    continue
+                try:
+                    info = os.stat(os.path.join(self.diretorio, nome))
+                except OSError:
+                    continue
+                arquivos.append((info.st_mtime, info.st_size, nome))
+            arquivos.sort()
+            total = sum(tamanho for _, tamanho, _ in arquivos)
+            while arquivos and (len(arquivos) > self.max_arquivos or total > self.max_bytes):
+                _, tamanho, nome = arquivos.pop(0)
+                total -= tamanho
+                try:
+                    os.remove(os.path.join(self.diretorio, nome))
+                except OSError:
+                    pass
@@ -0,0 +1,309 @@
+import bisect
+import hashlib
+import json
+import threading
+from collections import defaultdict
+
+from armazenamento import ConflitoVersao
+
+# Repositórios em memória com índices. A lista original continua sendo a
+# fonte de dados (os templates iteram sobre ela); os índices ficam ao lado e
+# são mantidos pelos métodos de escrita, que devem ser usados em vez de
+# alterar a lista ou os campos indexados diretamente. Toda escrita também é
+# repassada ao armazenamento persistente configurado; o que outros processos
+# gravaram chega por aplicar()/descartar() (ver estado_compartilhado.py).
+
+# ===== BASE =====
+
+def _remover_ordenado(lista, chave):
+    posicao = bisect.bisect_left(lista, chave)
+    if posicao < len(lista) and lista[posicao] == chave:
+        del lista[posicao]
+
+class Repositorio:
+    colecao = None
+
+    def __init__(self, itens, armazenamento):
+        self.itens = itens
+        self.armazenamento = armazenamento
+        self._lock = threading.RLock()
+        self._por_id = {}
+        self._proximo_id = 1
+        self.versao = 0
+        self._versoes = defaultdict(int)
+        for item in itens:
+            self._indexar(item)
+
+    def _indexar(self, item):
+        self._por_id[item['id']] = item
+        self._proximo_id = max(self._proximo_id, item['id'] + 1)
+
+    def _desindexar(self, item):
+        self._por_id.pop(item['id'], None)
+
+    def marcar_alterado(self, item=None):
+        self.versao += 1
+        if item is not None:
+            self._versoes[item['id']] += 1
+
+    def versao_item(self, item_id):
+        return self._versoes[item_id]
+
+    def salvar(self, item):
+        # Para alterações em campos não indexados feitas diretamente no dict
+        self.armazenamento.salvar_item(self.colecao, item)
+        self.marcar_alterado(item)
+
+    def obter(self, item_id):
+        return self._por_id.get(item_id)
+
+    def todos(self):
+        return self.itens
+
+    def novo_id(self):
+        with self._lock:
+            # Com armazenamento compartilhado o id vem da sequência do banco,
+            # única entre processos; senão, do contador local
+            novo_id = self.armazenamento.proximo_id(self.colecao, self._proximo_id)
+            if novo_id is None:
+                novo_id = self._proximo_id
+            self._proximo_id = max(self._proximo_id, novo_id + 1)
+            return novo_id
+
+    def adicionar(self, item):
+        with self._lock:
+            if item.get('id') is None:
+                item['id'] = self.novo_id()
+            self.itens.append(item)
+            self._indexar(item)
+            self.salvar(item)
+        return item
+
+    def remover(self, item):
+        with self._lock:
+            self.itens.remove(item)
+            self._desindexar(item)
+            self.armazenamento.excluir_item(self.colecao, item['id'])
+            self.marcar_alterado(item)
+
+    def aplicar(self, item):
+        # Item já gravado (por outro processo ou numa transação própria):
+        # atualiza só a memória, mantendo o mesmo dict para quem o referencia
+        with self._lock:
+            atual = self._por_id.get(item['id'])
+            if atual is None:
+                self.itens.append(item)
+                self._indexar(item)
+                self.marcar_alterado(item)
+                return item
+            self.marcar_alterado(atual)
+            self._desindexar(atual)
+            atual.clear()
+            atual.update(item)
+            self._indexar(atual)
+            self.marcar_alterado(atual)
+            return atual
+
+    def descartar(self, item_id):
+        with self._lock:
+            item = self._por_id.get(item_id)
+            if item is not None:
+                self.itens.remove(item)
+                self._desindexar(item)
+                self.marcar_alterado(item)
+
+    def __len__(self):
+        return len(self.itens)
+
+# ===== EQUIPAMENTOS =====
+
+class RepositorioEquipamentos(Repositorio):
+    colecao = 'equipamentos'
+
+    def __init__(self, itens, armazenamento):
+        self._por_sensor = defaultdict(dict)
+        self._por_status = defaultdict(dict)
+        super().__init__(itens, armazenamento)
+
+    def _indexar(self, item):
+        super()._indexar(item)
+        self._por_status[item['status']][item['id']] = item
+        if item.get('sensor_id') is not None:
+            self._por_sensor[item['sensor_id']][item['id']] = item
+
+    def _desindexar(self, item):
+        super()._desindexar(item)
+        self._por_status[item['status']].pop(item['id'], None)
+        if item.get('sensor_id') is not None:
+            self._por_sensor[item['sensor_id']].pop(item['id'], None)
+
+    def atualizar(self, equip, campos, versao=None, novos=()):
+        # Controle otimista: 'versao' é a versão que o usuário viu (padrão: a
+        # atual em memória). Se outro processo ou requisição gravou antes,
+        # levanta ConflitoVersao sem alterar nada. 'novos' são pares
+        # (repositório, item) gravados na mesma transação.
+        with self._lock:
+            atual = equip.get('versao', 0)
+            if versao is None:
+                versao = atual
+            if versao != atual:
+                raise ConflitoVersao(f'{self.colecao} {equip["id"]} foi alterado por outro usuário')
+            novo = dict(equip, **campos)
+            novo['versao'] = versao + 1
+            self.armazenamento.salvar_versionado(self.colecao, novo, versao, [(repo.colecao, item) for repo, item in novos])
+            self.aplicar(novo)
+        for repo, item in novos:
+            repo.aplicar(item)
+        return equip
+
+    def alterar_status(self, equip, status, versao=None):
+        return self.atualizar(equip, {'status': status}, versao)
+
+    def alterar_sensor(self, equip, sensor_id, versao=None):
+        return self.atualizar(equip, {'sensor_id': sensor_id}, versao)
+
+    def por_status(self, status):
+        return list(self._por_status[status].values())
+
+    def contar_status(self, status):
+        return len(self._por_status[status])
+
+    def contagem_status(self):
+        return {status: len(itens) for status, itens in self._por_status.items()}
+
+    def por_sensor(self, sensor_id):
+        return list(self._por_sensor[sensor_id].values())
+
+    def sensor_em_uso(self, sensor_id):
+        return bool(self._por_sensor[sensor_id])
+
+# ===== SENSORES =====
+
+class RepositorioSensores(Repositorio):
+    colecao = 'sensores'
+
+# ===== PROCESSOS FINALIZADOS =====
+
+# Impressões digitais dos processos somadas módulo 2^64
+MODULO_IMPRESSAO = 2 ** 64
+# Itens recusados pelo filtro que uma chamada de paginação examina antes de
+# devolver a página parcial com o cursor de onde parou
+MAX_VARRIDOS = 2000
+
+class RepositorioProcessos(Repositorio):
+    colecao = 'processos_finalizados'
+
+    def __init__(self, itens, armazenamento):
+        # Ids ordenados por status de qualidade, para paginação por cursor
+        self._por_status_qualidade = defaultdict(list)
+        self._por_equipamento_status = defaultdict(list)
+        # Chaves (data_finalizacao, id) ordenadas, geral e por equipamento,
+        # para consultas por período com bisect
+        self._por_data = []
+        self._por_equipamento = defaultdict(list)
+        self._chave_data = {}
+        # Impressão digital por dia de finalização: soma dos hashes do
+        # conteúdo de cada processo do dia. Vem só dos dados, então é a mesma
+        # em todos os workers e depois de reiniciar, e muda quando algum
+        # processo do dia muda. id → (dia, hash) da última contagem.
+        self._impressao_por_dia = defaultdict(int)
+        self._impressao_item = {}
+        super().__init__(itens, armazenamento)
+
+    def _contar_impressao(self, item):
+        self._descontar_impressao(item)
+        texto = json.dumps(item, sort_keys=True, ensure_ascii=False, default=str)
+        valor = int.from_bytes(hashlib.blake2b(texto.encode('utf-8'), digest_size=8).digest(), 'big')
+        dia = (item.get('data_finalizacao') or '')[:10]
+        self._impressao_item[item['id']] = (dia, valor)
+        self._impressao_por_dia[dia] = (self._impressao_por_dia[dia] + valor) % MODULO_IMPRESSAO
+
+    def _descontar_impressao(self, item):
+        dia, valor = self._impressao_item.pop(item['id'], ('', 0))
+        self._impressao_por_dia[dia] = (self._impressao_por_dia[dia] - valor) % MODULO_IMPRESSAO
+
+    def _indexar(self, item):
+        super()._indexar(item)
+        bisect.insort(self._por_status_qualidade[item['status_qualidade']], item['id'])
+        bisect.insort(self._por_equipamento_status[(item.get('equipamento_id'), item['status_qualidade'])], item['id'])
+        chave = (item.get('data_finalizacao') or '', item['id'])
+        self._chave_data[item['id']] = chave
+        bisect.insort(self._por_data, chave)
+        bisect.insort(self._por_equipamento[item.get('equipamento_id')], chave)
+        self._contar_impressao(item)
+
+    def _desindexar(self, item):
+        super()._desindexar(item)
+        _remover_ordenado(self._por_status_qualidade[item['status_qualidade']], item['id'])
+        _remover_ordenado(self._por_equipamento_status[(item.get('equipamento_id'), item['status_qualidade'])], item['id'])
+        chave = self._chave_data.pop(item['id'], None)
+        if chave is not None:
+            _remover_ordenado(self._por_data, chave)
+            _remover_ordenado(self._por_equipamento[item.get('equipamento_id')], chave)
+        self._descontar_impressao(item)
+
+    def marcar_alterado(self, item=None):
+        super().marcar_alterado(item)
+        # Campos alterados direto no dict: refaz o hash do processo
+        if item is not None and item['id'] in self._impressao_item:
+            self._contar_impressao(item)
+
+    def versao_periodo(self, data_inicio=None, data_fim=None):
+        soma = sum(
+            impressao for dia, impressao in self._impressao_por_dia.items()
+            if (not data_inicio or dia >= data_inicio) and (not data_fim or dia <= data_fim)
+        )
+        return f'{soma % MODULO_IMPRESSAO:016x}'
+
+    def consultar(self, data_inicio=None, data_fim=None, equip_id=None):
+        # Processos finalizados no período (datas AAAA-MM-DD, inclusivas), em
+        # ordem de finalização: O(log N + k)
+        chaves = self._por_data if equip_id is None else self._por_equipamento.get(equip_id, [])
+        inicio = bisect.bisect_left(chaves, (data_inicio,)) if data_inicio else 0
+        fim = bisect.bisect_right(chaves, (data_fim + '\uffff',)) if data_fim else len(chaves)
+        return [self._por_id[item_id] for _, item_id in chaves[inicio:fim]]
+
+    def alterar_status_qualidade(self, processo, status):
+        with self._lock:
+            _remover_ordenado(self._por_status_qualidade[processo['status_qualidade']], processo['id'])
+            _remover_ordenado(self._por_equipamento_status[(processo.get('equipamento_id'), processo['status_qualidade'])], processo['id'])
+            processo['status_qualidade'] = status
+            bisect.insort(self._por_status_qualidade[status], processo['id'])
+            bisect.insort(self._por_equipamento_status[(processo.get('equipamento_id'), status)], processo['id'])
+            self.salvar(processo)
+
+    def por_status_qualidade(self, status):
+        return [self._por_id[item_id] for item_id in self._por_status_qualidade[status]]
+
+    def pagina_status_qualidade(self, status, cursor=None, limite=20, recentes_primeiro=False, filtro=None, equip_id=None):
+        # Paginação por cursor (id do último item entregue): o custo depende
+        # do tamanho da página, não do histórico. Retorna (itens, próximo cursor).
+        # Com equip_id a página sai do índice do equipamento; o filtro livre
+        # examina no máximo MAX_VARRIDOS itens recusados por chamada.
+        with self._lock:
+            if equip_id is None:
+                ids = self._por_status_qualidade[status]
+            else:
+                ids = self._por_equipamento_status.get((equip_id, status), [])
+            if recentes_primeiro:
+                fim = bisect.bisect_left(ids, cursor) if cursor is not None else len(ids)
+                posicoes = range(fim - 1, -1, -1)
+            else:
+                inicio = bisect.bisect_right(ids, cursor) if cursor is not None else 0
+                posicoes = range(inicio, len(ids))
+            itens = []
+            recusados = 0
+            for posicao in posicoes:
+                item = self._por_id[ids[posicao]]
+                if filtro and not filtro(item):
+                    recusados += 1
+                    if recusados == MAX_VARRIDOS:
+                        return itens, item['id']
+                    continue
+                if len(itens) == limite:
+                    return itens, itens[-1]['id']
+                itens.append(item)
+            return itens, None
+
+    def contar_status_qualidade(self, status):
+        return len(self._por_status_qualidade[status])
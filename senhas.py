@@ -0,0 +1,262 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Senhas guardadas como 'scrypt$n$r$p$sal$hash'. O cálculo (caro de
+# propósito) roda num pool limitado de threads, fora da thread da requisição
+# que ainda atende outras páginas; o scrypt libera o GIL enquanto calcula.
+# Senhas antigas em texto puro e hashes mais fracos que o custo atual são
+# regravados no formato atual no primeiro login bem-sucedido.
+
+# Meta de latência do login (p99, em ms). O custo do scrypt é calibrado para
+# uma fração dela, e pedidos que não caberiam na meta por causa da fila são
+# recusados na hora em vez de esperar.
+ALVO_P99_MS = float(os.environ.get('MONITORAMENTO_LOGIN_P99_MS', 500))
+FRACAO_DO_ALVO = 0.25
+# Fila aceita enquanto a espera estimada couber nesta fração da meta; a folga
+# cobre a imprecisão da estimativa quando a CPU está disputada
+FRACAO_ADMISSAO = 0.5
+# Custo fixo (potência de 2); sem ele, calibrado uma vez e guardado no
+# armazenamento, para que todos os workers usem o mesmo
+SCRYPT_N = int(os.environ['MONITORAMENTO_SCRYPT_N']) if os.environ.get('MONITORAMENTO_SCRYPT_N') else None
+# Piso de segurança: vale mesmo que a máquina não atinja a meta de latência
+SCRYPT_N_MIN = 2 ** 14
+SCRYPT_N_MAX = 2 ** 17
+SCRYPT_R = 8
+SCRYPT_P = 1
+TAMANHO_SAL = 16
+MAX_THREADS_HASH = int(os.environ.get('MONITORAMENTO_THREADS_HASH', max(os.cpu_count() or 1, 2)))
+# Onde o custo calibrado fica guardado (registro de configuração)
+COLECAO_CONFIGURACAO = 'configuracao'
+CHAVE_SCRYPT_N = 'scrypt_n'
+
+# Tentativas com falha por janela deslizante
+JANELA_TENTATIVAS = 300
+LIMITE_POR_USUARIO = 5
+LIMITE_POR_IP = 30
+
+class SobrecargaLogin(Exception):
+    # A fila de verificação não comporta mais um pedido dentro da meta
+    pass
+
+def _b64(dados):
+    return base64.b64encode(dados).decode('ascii')
+
+def _scrypt(senha, sal, n, r, p):
+    return hashlib.scrypt(senha.encode('utf-8'), salt=sal, n=n, r=r, p=p, maxmem=256 * r * n + 2 ** 20, dklen=32)
+
+def _cronometrar(n):
+    inicio = time.perf_counter()
+    _scrypt('calibracao', b'\0' * TAMANHO_SAL, n, SCRYPT_R, SCRYPT_P)
+    return time.perf_counter() - inicio
+
+def calibrar(alvo_ms=ALVO_P99_MS, fracao=FRACAO_DO_ALVO):
+    # Maior n cujo hash leva no máximo 'fracao' da meta nesta máquina.
+    # Retorna (n, segundos por hash).
+    limite = alvo_ms * fracao / 1000
+    n, custo = SCRYPT_N_MIN, _cronometrar(SCRYPT_N_MIN)
+    while n < SCRYPT_N_MAX:
+        custo_dobro = _cronometrar(n * 2)
+        if custo_dobro > limite:
+            break
+        n, custo = n * 2, custo_dobro
+    return n, custo
+
+# ===== LIMITE DE TENTATIVAS =====
+
+class LimitadorTentativas:
+    # Instantes das falhas recentes de cada chave (usuário ou IP), só em memória
+
+    def __init__(self, limite, janela=JANELA_TENTATIVAS):
+        self.limite = limite
+        self.janela = janela
+        self._lock = threading.Lock()
+        self._falhas = defaultdict(deque)
+
+    def _recentes(self, chave, agora):
+        falhas = self._falhas.get(chave)
+        if falhas is None:
+            return None
+        while falhas and falhas[0] <= agora - self.janela:
+            falhas.popleft()
+        if not falhas:
+            del self._falhas[chave]
+            return None
+        return falhas
+
+    def bloqueado(self, chave, agora=None):
+        agora = time.monotonic() if agora is None else agora
+        with self._lock:
+            falhas = self._recentes(chave, agora)
+            return falhas is not None and len(falhas) >= self.limite
+
+    def registrar_falha(self, chave, agora=None):
+        agora = time.monotonic() if agora is None else agora
+        with self._lock:
+            self._recentes(chave, agora)
+            self._falhas[chave].append(agora)
+            # Descarta chaves vencidas para a memória não crescer com IPs avulsos
+            if len(self._falhas) > 10000:
+                for antiga in list(self._falhas):
+                    self._recentes(antiga, agora)
+
+    def limpar(self, chave):
+        with self._lock:
+            self._falhas.pop(chave, None)
+
+# ===== HASH E VERIFICAÇÃO =====
+
+class ServicoSenhas:
+
+    def __init__(self, max_threads=MAX_THREADS_HASH, alvo_ms=ALVO_P99_MS, n=SCRYPT_N, armazenamento=None):
+        self.max_threads = max_threads
+        self.alvo_ms = alvo_ms
+        self.n = n
+        self.armazenamento = armazenamento
+        self._executor = None
+        self._lock = threading.Lock()
+        self._lock_inicio = threading.Lock()
+        self._pendentes = 0
+        self._custo_medio = None
+        self._hash_ficticio = None
+        # Duração (ms) dos últimos logins, incluindo a espera na fila
+        self.latencias = deque(maxlen=1000)
+        self.recusados = 0
+
+    def iniciar(self):
+        # Calibra e cria o pool em segundo plano, antes do primeiro login
+        threading.Thread(target=self._pool, name='calibracao-senhas', daemon=True).start()
+
+    def _pool(self):
+        # A calibração não segura _lock: hashes em andamento continuam medindo
+        if self._executor is not None:
+            return self._executor
+        with self._lock_inicio:
+            if self._executor is None:
+                custo = None
+                if self.n is None:
+                    self.n, custo = self._n_compartilhado()
+                if custo is None and self._custo_medio is None:
+                    custo = _cronometrar(self.n)
+                with self._lock:
+                    if self._custo_medio is None:
+                        self._custo_medio = custo
+                self._executor = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix='hash-senha')
+            return self._executor
+
+    def _n_compartilhado(self):
+        # (n, custo medido ou None). Calibrações simultâneas disputariam a CPU
+        # e dariam um n baixo: só quem tem o arrendamento calibra, os demais
+        # esperam o valor gravado.
+        if self.armazenamento is None:
+            return calibrar(self.alvo_ms)
+        while True:
+            n = self.armazenamento.carregar_registros(COLECAO_CONFIGURACAO).get(CHAVE_SCRYPT_N)
+            if n:
+                return n, None
+            if self.armazenamento.arrendar('calibracao_senhas', 120):
+                n, custo = calibrar(self.alvo_ms)
+                gravado = self.armazenamento.definir_se_ausente(COLECAO_CONFIGURACAO, CHAVE_SCRYPT_N, n)
+                return gravado, (custo if gravado == n else None)
+            time.sleep(0.5)
+
+    def _executar(self, funcao, *args, limitar=True):
+        # Recusa se a espera estimada na fila já estourar a meta
+        executor = self._pool()
+        with self._lock:
+            if limitar and self._custo_medio is not None:
+                espera = (self._pendentes + 1) * self._custo_medio / self.max_threads
+                if espera > self.alvo_ms * FRACAO_ADMISSAO / 1000:
+                    self.recusados += 1
+                    raise SobrecargaLogin('Muitos logins simultâneos. Tente novamente em instantes.')
+            self._pendentes += 1
+        try:
+            return executor.submit(self._medir, funcao, *args).result()
+        finally:
+            with self._lock:
+                self._pendentes -= 1
+
+    def _medir(self, funcao, *args):
+        inicio = time.perf_counter()
+        resultado = funcao(*args)
+        custo = time.perf_counter() - inicio
+        with self._lock:
+            self._custo_medio = custo if self._custo_medio is None else self._custo_medio * 0.8 + custo * 0.2
+        return resultado
+
+    def _gerar(self, senha):
+        sal = os.urandom(TAMANHO_SAL)
+        return f'scrypt${self.n}${SCRYPT_R}${SCRYPT_P}${_b64(sal)}${_b64(_scrypt(senha, sal, self.n, SCRYPT_R, SCRYPT_P))}'
+
+    def _conferir(self, senha, armazenado):
+        # (confere, precisa_regravar)
+        if not armazenado.startswith('scrypt$'):
+            # Legado em texto puro
+            return hmac.compare_digest(senha.encode('utf-8'), armazenado.encode('utf-8')), True
+        _, n, r, p, sal, esperado = armazenado.split('$')
+        calculado = _scrypt(senha, base64.b64decode(sal), int(n), int(r), int(p))
+        # Só regrava para subir o custo, nunca para baixá-lo
+        fraco = int(n) < self.n or (int(r), int(p)) != (SCRYPT_R, SCRYPT_P)
+        return hmac.compare_digest(calculado, base64.b64decode(esperado)), fraco
+
+    def _verificar(self, senha, armazenado):
+        if armazenado is None:
+            # Usuário inexistente custa o mesmo que um existente
+            if self._hash_ficticio is None:
+                self._hash_ficticio = self._gerar('')
+            self._conferir(senha, self._hash_ficticio)
+            return False, None
+        confere, regravar = self._conferir(senha, armazenado)
+        return confere, (self._gerar(senha) if confere and regravar else None)
+
+    def gerar_hash(self, senha):
+        # Cadastro e troca de senha não disputam a meta do login
+        return self._executar(self._gerar, senha or '', limitar=False)
+
+    def verificar(self, senha, armazenado):
+        # (confere, novo hash para gravar ou None). Levanta SobrecargaLogin.
+        inicio = time.perf_counter()
+        resultado = self._executar(self._verificar, senha or '', armazenado)
+        self.latencias.append((time.perf_counter() - inicio) * 1000)
+        return resultado
+
+    def percentis(self):
+        amostras = sorted(self.latencias)
+        if not amostras:
+            return {}
+        def percentil(p):
+            return round(amostras[min(int(len(amostras) * p), len(amostras) - 1)], 1)
+        return {'p50': percentil(0.5), 'p99': percentil(0.99), 'amostras': len(amostras), 'alvo': self.alvo_ms, 'recusados': self.recusados, 'scrypt_n': self.n}
+
+# ===== BENCHMARK =====
+
+def benchmark(logins=200, duracao=120, alvo_ms=ALVO_P99_MS):
+    # Simula a troca de turno: 'logins' verificações distribuídas ao longo de
+    # 'duracao' segundos, cada uma num cliente próprio
+    servico = ServicoSenhas(alvo_ms=alvo_ms)
+    hashes = [servico.gerar_hash(f'senha{i}') for i in range(min(logins, 20))]
+    servico.latencias.clear()
+    inicio = time.monotonic()
+
+    def logar(i):
+        time.sleep(max(inicio + duracao * i / logins - time.monotonic(), 0))
+        try:
+            servico.verificar(f'senha{i % len(hashes)}', hashes[i % len(hashes)])
+        except SobrecargaLogin:
+            pass
+
+    with ThreadPoolExecutor(max_workers=logins) as clientes:
+        list(clientes.map(logar, range(logins)))
+    return servico.percentis()
+
+if __name__ == '__main__':
+    # python senhas.py [logins] [duração em s] [meta p99 em ms]
+    import sys
+    resultado = benchmark(*(float(arg) if i == 2 else int(arg) for i, arg in enumerate(sys.argv[1:4])))
+    print(resultado)
+    print('OK' if resultado['p99'] <= resultado['alvo'] else 'ACIMA DA META')
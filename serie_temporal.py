@@ -0,0 +1,379 @@
+import atexit
+import math
+import os
+import struct
+import threading
+import time
+from array import array
+
+import numpy as np
+
+DIRETORIO_PADRAO = os.environ.get('MONITORAMENTO_SERIES', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados', 'series'))
+
+# Resoluções de agregação (segundos) e retenção de cada nível (dias).
+# A chave 0 é o dado bruto.
+RESOLUCOES = (60, 900, 3600)
+RETENCAO_PADRAO = {0: 30, 60: 180, 900: 730, 3600: 3650}
+
+# Nomes aceitos na API de histórico e intervalo nominal dos dados brutos
+NOMES_RESOLUCAO = {'bruto': 0, '1min': 60, '15min': 900, '1h': 3600}
+INTERVALO_BRUTO = 1
+PONTOS_PADRAO = 500
+PONTOS_MAXIMO = 5000
+
+# Buffer em memória por sensor antes de anexar ao segmento em disco
+PONTOS_POR_DESCARGA = 512
+SEGUNDOS_POR_DESCARGA = 60
+
+# Formatos em disco (little-endian, largura fixa para leitura direta com NumPy):
+#   bruto:  deslocamento em segundos desde o início do dia UTC (f4), valor (f4)
+#   rollup: início do intervalo (f8), mínimo, máximo, média (f4), contagem (u4)
+DTYPE_BRUTO = np.dtype([('t', '<f4'), ('v', '<f4')])
+DTYPE_ROLLUP = np.dtype([('t', '<f8'), ('min', '<f4'), ('max', '<f4'), ('avg', '<f4'), ('count', '<u4')])
+_ROLLUP = struct.Struct('<dfffI')
+
+# ===== SEGMENTOS =====
+
+def _dia(timestamp):
+    return int(timestamp // 86400)
+
+def _mes(timestamp):
+    return time.strftime('%Y%m', time.gmtime(timestamp))
+
+def _arquivo_bruto(diretorio, dia):
+    return os.path.join(diretorio, f'bruto_{dia}.bin')
+
+def _arquivo_rollup(diretorio, resolucao, mes):
+    return os.path.join(diretorio, f'r{resolucao}_{mes}.bin')
+
+def _ler_segmento(caminho, dtype):
+    # Segmento ausente ou removido pela retenção entre a listagem e a
+    # leitura conta como vazio
+    try:
+        return np.fromfile(caminho, dtype=dtype)
+    except FileNotFoundError:
+        return None
+
+def _meses_entre(inicio, fim):
+    meses = []
+    ano, mes = time.gmtime(inicio)[:2]
+    ano_fim, mes_fim = time.gmtime(fim)[:2]
+    while (ano, mes) <= (ano_fim, mes_fim):
+        meses.append(f'{ano:04d}{mes:02d}')
+        mes += 1
+        if mes > 12:
+            ano, mes = ano + 1, 1
+    return meses
+
+# ===== SÉRIE DE UM SENSOR =====
+
+class _Balde:
+    __slots__ = ('inicio', 'minimo', 'maximo', 'soma', 'contagem')
+
+    def __init__(self, inicio):
+        self.inicio = inicio
+        self.minimo = math.inf
+        self.maximo = -math.inf
+        self.soma = 0.0
+        self.contagem = 0
+
+    def adicionar(self, valor):
+        self.minimo = min(self.minimo, valor)
+        self.maximo = max(self.maximo, valor)
+        self.soma += valor
+        self.contagem += 1
+
+    def registro(self):
+        return (self.inicio, self.minimo, self.maximo, self.soma / self.contagem, self.contagem)
+
+class _SerieSensor:
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+        self.dia = None
+        self.tempos = array('f')
+        self.valores = array('f')
+        self.ultima_descarga = time.time()
+        self.baldes = {}
+        self.rollups_pendentes = {resolucao: [] for resolucao in RESOLUCOES}
+
+    def adicionar(self, timestamp, valor):
+        dia = _dia(timestamp)
+        if self.dia is not None and dia != self.dia:
+            self.descarregar()
+        self.dia = dia
+        self.tempos.append(timestamp - dia * 86400)
+        self.valores.append(valor)
+
+        if not math.isnan(valor):
+            for resolucao in RESOLUCOES:
+                inicio = timestamp - timestamp % resolucao
+                balde = self.baldes.get(resolucao)
+                if balde is not None and balde.inicio != inicio:
+                    if balde.contagem:
+                        self.rollups_pendentes[resolucao].append(balde.registro())
+                    balde = None
+                if balde is None:
+                    balde = self.baldes[resolucao] = _Balde(inicio)
+                balde.adicionar(valor)
+
+        if len(self.tempos) >= PONTOS_POR_DESCARGA or timestamp - self.ultima_descarga >= SEGUNDOS_POR_DESCARGA:
+            self.descarregar()
+
+    def descarregar(self, fechar=False):
+        if fechar:
+            # Parada do processo: os intervalos em aberto vão para o disco
+            # como estão; se a série continuar depois (neste ou em outro
+            # processo), a leitura junta os pedaços com o mesmo início
+            for resolucao, balde in self.baldes.items():
+                if balde.contagem:
+                    self.rollups_pendentes[resolucao].append(balde.registro())
+            self.baldes = {}
+
+        if self.tempos:
+            dados, dia = self.bruto_em_memoria()
+            with open(_arquivo_bruto(self.diretorio, dia), 'ab') as arquivo:
+                dados.tofile(arquivo)
+            self.tempos = array('f')
+            self.valores = array('f')
+
+        for resolucao, registros in self.rollups_pendentes.items():
+            por_mes = {}
+            for registro in registros:
+                por_mes.setdefault(_mes(registro[0]), []).append(_ROLLUP.pack(*registro))
+            for mes, blocos in por_mes.items():
+                with open(_arquivo_rollup(self.diretorio, resolucao, mes), 'ab') as arquivo:
+                    arquivo.write(b''.join(blocos))
+            registros.clear()
+
+        self.ultima_descarga = time.time()
+
+    def bruto_em_memoria(self):
+        if not self.tempos:
+            return np.empty(0, dtype=DTYPE_BRUTO), self.dia
+        dados = np.empty(len(self.tempos), dtype=DTYPE_BRUTO)
+        dados['t'] = np.frombuffer(self.tempos, dtype='<f4')
+        dados['v'] = np.frombuffer(self.valores, dtype='<f4')
+        return dados, self.dia
+
+    def rollup_em_memoria(self, resolucao):
+        registros = list(self.rollups_pendentes[resolucao])
+        balde = self.baldes.get(resolucao)
+        if balde is not None and balde.contagem:
+            registros.append(balde.registro())
+        return np.array(registros, dtype=DTYPE_ROLLUP)
+
+# ===== ARMAZENAMENTO DE SÉRIES =====
+
+class SerieTemporal:
+    # Histórico de leituras por sensor em segmentos append-only: um arquivo de
+    # dados brutos por dia e um arquivo por mês para cada resolução agregada.
+    # A memória usada é só o buffer de escrita e o intervalo aberto de cada
+    # resolução, independente de quanto histórico existe em disco.
+
+    def __init__(self, diretorio=DIRETORIO_PADRAO, retencao=None):
+        self.diretorio = diretorio
+        self.retencao = dict(RETENCAO_PADRAO, **(retencao or {}))
+        self._lock = threading.Lock()
+        self._series = {}
+        self._ultima_limpeza = 0
+        os.makedirs(diretorio, exist_ok=True)
+        atexit.register(self.fechar)
+
+    def _serie(self, sensor_id):
+        serie = self._series.get(sensor_id)
+        if serie is None:
+            serie = self._series[sensor_id] = _SerieSensor(self._diretorio_sensor(sensor_id))
+        return serie
+
+    def _diretorio_sensor(self, sensor_id):
+        return os.path.join(self.diretorio, f'sensor_{sensor_id}')
+
+    def registrar_lote(self, leituras):
+        with self._lock:
+            for leitura in leituras:
+                valor = leitura.get('temperatura')
+                self._serie(leitura['sensor_id']).adicionar(
+                    leitura['timestamp'], math.nan if valor is None else float(valor)
+                )
+        if time.time() - self._ultima_limpeza > 3600:
+            self.aplicar_retencao()
+
+    def descarregar(self):
+        with self._lock:
+            for serie in self._series.values():
+                serie.descarregar()
+
+    def fechar(self):
+        # Grava também os intervalos ainda abertos de cada resolução
+        with self._lock:
+            for serie in self._series.values():
+                serie.descarregar(fechar=True)
+
+    # ----- consultas -----
+
+    def ler_bruto(self, sensor_id, inicio, fim):
+        # Retorna (timestamps, valores) como arrays NumPy
+        diretorio = self._diretorio_sensor(sensor_id)
+        partes_t, partes_v = [], []
+        for dia in range(_dia(inicio), _dia(fim) + 1):
+            dados = _ler_segmento(_arquivo_bruto(diretorio, dia), DTYPE_BRUTO)
+            if dados is not None:
+                partes_t.append(dados['t'].astype('f8') + dia * 86400)
+                partes_v.append(dados['v'])
+        with self._lock:
+            serie = self._series.get(sensor_id)
+            if serie is not None:
+                dados, dia = serie.bruto_em_memoria()
+                if len(dados):
+                    partes_t.append(dados['t'].astype('f8') + dia * 86400)
+                    partes_v.append(dados['v'])
+        if not partes_t:
+            return np.empty(0, dtype='f8'), np.empty(0, dtype='f4')
+        tempos = np.concatenate(partes_t)
+        valores = np.concatenate(partes_v)
+        mascara = (tempos >= inicio) & (tempos <= fim)
+        return tempos[mascara], valores[mascara]
+
+    def ler_rollup(self, sensor_id, resolucao, inicio, fim):
+        # Retorna um array estruturado com campos t, min, max, avg, count
+        diretorio = self._diretorio_sensor(sensor_id)
+        partes = []
+        for mes in _meses_entre(inicio, fim):
+            dados = _ler_segmento(_arquivo_rollup(diretorio, resolucao, mes), DTYPE_ROLLUP)
+            if dados is not None:
+                partes.append(dados)
+        with self._lock:
+            serie = self._series.get(sensor_id)
+            if serie is not None:
+                partes.append(serie.rollup_em_memoria(resolucao))
+        if not partes:
+            return np.empty(0, dtype=DTYPE_ROLLUP)
+        dados = _juntar_intervalos(np.concatenate(partes))
+        return dados[(dados['t'] >= inicio - resolucao) & (dados['t'] <= fim)]
+
+    def consultar(self, sensor_id, inicio, fim, resolucao=None, pontos=PONTOS_PADRAO):
+        # Escolhe o nível mais detalhado que cabe no orçamento de pontos (ou o
+        # pedido explicitamente) e reagrupa em faixas min/max/média.
+        pontos = max(1, min(int(pontos), PONTOS_MAXIMO))
+        duracao = max(fim - inicio, 1)
+        if resolucao is None:
+            resolucao = self._escolher_resolucao(inicio, duracao, pontos)
+
+        if resolucao == 0:
+            tempos, valores = self.ler_bruto(sensor_id, inicio, fim)
+            validos = ~np.isnan(valores)
+            tempos = tempos[validos]
+            valores = valores[validos].astype('f8')
+            minimos, maximos, somas = valores, valores, valores
+            contagens = np.ones(len(valores), dtype='u8')
+        else:
+            dados = self.ler_rollup(sensor_id, resolucao, inicio, fim)
+            tempos = dados['t']
+            minimos = dados['min'].astype('f8')
+            maximos = dados['max'].astype('f8')
+            contagens = dados['count'].astype('u8')
+            somas = dados['avg'].astype('f8') * contagens
+
+        passo = max(resolucao or INTERVALO_BRUTO, math.ceil(duracao / pontos))
+        faixas = _reagrupar(tempos, minimos, maximos, somas, contagens, inicio, passo)
+        return {
+            'resolucao': resolucao,
+            'passo': passo,
+            'faixas': faixas,
+            'estatisticas': _estatisticas(minimos, maximos, somas, contagens),
+        }
+
+    def _escolher_resolucao(self, inicio, duracao, pontos):
+        idade = time.time() - inicio
+        for resolucao in (0,) + RESOLUCOES:
+            if idade > self.retencao[resolucao] * 86400:
+                continue
+            if duracao / (resolucao or INTERVALO_BRUTO) <= pontos:
+                return resolucao
+        return RESOLUCOES[-1]
+
+    # ----- retenção -----
+
+    def aplicar_retencao(self, agora=None):
+        agora = agora or time.time()
+        self._ultima_limpeza = agora
+        if not os.path.isdir(self.diretorio):
+            return
+        limite_dia = _dia(agora - self.retencao[0] * 86400)
+        limites_mes = {
+            resolucao: _mes(agora - self.retencao[resolucao] * 86400) for resolucao in RESOLUCOES
+        }
+        for nome_sensor in os.listdir(self.diretorio):
+            diretorio = os.path.join(self.diretorio, nome_sensor)
+            if not os.path.isdir(diretorio):
+                continue
+            for nome in os.listdir(diretorio):
+                base = nome[:-len('.bin')]
+                if nome.startswith('bruto_'):
+                    expirado = int(base[len('bruto_'):]) < limite_dia
+                elif nome.startswith('r'):
+                    resolucao, mes = base[1:].split('_')
+                    expirado = mes < limites_mes.get(int(resolucao), '')
+                else:
+                    continue
+                if expirado:
+                    # Sob o lock para não remover um segmento no meio de uma
+                    # descarga; outro worker pode já tê-lo removido
+                    with self._lock:
+                        try:
+                            os.remove(os.path.join(diretorio, nome))
+                        except FileNotFoundError:
+                            pass
+
+# ===== AGREGAÇÃO =====
+
+def _juntar_intervalos(dados):
+    # Um intervalo gravado antes de fechar (parada do processo ou troca do
+    # worker que faz a aquisição) continua em outro registro com o mesmo
+    # início; os pedaços viram um registro só
+    if len(dados) < 2:
+        return dados
+    dados = dados[np.argsort(dados['t'], kind='stable')]
+    inicios = np.flatnonzero(np.r_[True, dados['t'][1:] != dados['t'][:-1]])
+    if len(inicios) == len(dados):
+        return dados
+    contagem = np.add.reduceat(dados['count'].astype('u8'), inicios)
+    soma = np.add.reduceat(dados['avg'].astype('f8') * dados['count'], inicios)
+    juntos = np.empty(len(inicios), dtype=DTYPE_ROLLUP)
+    juntos['t'] = dados['t'][inicios]
+    juntos['min'] = np.minimum.reduceat(dados['min'], inicios)
+    juntos['max'] = np.maximum.reduceat(dados['max'], inicios)
+    juntos['avg'] = soma / contagem
+    juntos['count'] = contagem
+    return juntos
+
+def _reagrupar(tempos, minimos, maximos, somas, contagens, inicio, passo):
+    # Agrupa amostras (ou baldes) consecutivos em janelas de 'passo' segundos
+    # usando reduceat, sem laços em Python.
+    if len(tempos) == 0:
+        return {'t': [], 'min': [], 'max': [], 'avg': [], 'count': []}
+    ordem = np.argsort(tempos, kind='stable')
+    indices = np.floor((tempos[ordem] - inicio) / passo).astype(np.int64)
+    inicios = np.flatnonzero(np.r_[True, indices[1:] != indices[:-1]])
+    contagem = np.add.reduceat(contagens[ordem], inicios)
+    soma = np.add.reduceat(somas[ordem], inicios)
+    return {
+        't': (inicio + indices[inicios] * passo).tolist(),
+        'min': np.round(np.minimum.reduceat(minimos[ordem], inicios), 2).tolist(),
+        'max': np.round(np.maximum.reduceat(maximos[ordem], inicios), 2).tolist(),
+        'avg': np.round(soma / contagem, 2).tolist(),
+        'count': contagem.tolist(),
+    }
+
+def _estatisticas(minimos, maximos, somas, contagens):
+    total = int(contagens.sum()) if len(contagens) else 0
+    if not total:
+        return {'min': None, 'max': None, 'media': None, 'amostras': 0}
+    return {
+        'min': round(float(minimos.min()), 2),
+        'max': round(float(maximos.max()), 2),
+        'media': round(float(somas.sum() / total), 2),
+        'amostras': total,
+    }
@@ -0,0 +1,268 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from armazenamento import BACKEND_PADRAO, CAMINHO_PADRAO
+
+# Sessões guardadas no servidor: o cookie leva só um id aleatório, e o
+# conteúdo (usuário, perfil, permissões resolvidas, mensagens) fica no
+# armazém. Com isso o cookie tem tamanho fixo e encerrar as sessões de um
+# usuário vale na hora, sem esperar o cookie expirar.
+
+BACKEND_SESSOES = os.environ.get('MONITORAMENTO_SESSOES', BACKEND_PADRAO)
+# Sessão sem uso por mais que isso (segundos) expira
+DURACAO_SESSAO = int(os.environ.get('MONITORAMENTO_DURACAO_SESSAO', 12 * 3600))
+# A validade só é regravada quando o último acesso registrado tem mais que isso
+INTERVALO_RENOVACAO = 300
+LIMITE_SESSOES_MEMORIA = 10000
+# Por quanto tempo a contagem de usuários ativos é reaproveitada
+VALIDADE_CONTAGEM = 10
+
+# ===== MEMÓRIA =====
+
+class ArmazemSessoesMemoria:
+    # LRU no próprio processo: com muitas sessões, as menos usadas saem primeiro
+
+    def __init__(self, limite=LIMITE_SESSOES_MEMORIA):
+        self.limite = limite
+        self._lock = threading.Lock()
+        self._sessoes = OrderedDict()
+        self._por_usuario = defaultdict(set)
+
+    def obter(self, sid):
+        with self._lock:
+            registro = self._sessoes.get(sid)
+            if registro is None:
+                return None
+            if registro['expira'] < time.time():
+                self._descartar(sid)
+                return None
+            self._sessoes.move_to_end(sid)
+            return registro['dados'], registro['expira']
+
+    def gravar(self, sid, usuario, dados, expira):
+        with self._lock:
+            self._descartar(sid)
+            self._sessoes[sid] = {'usuario': usuario, 'dados': dados, 'expira': expira}
+            if usuario:
+                self._por_usuario[usuario].add(sid)
+            while len(self._sessoes) > self.limite:
+                self._descartar(next(iter(self._sessoes)))
+
+    def atualizar(self, sid, usuario, dados, expira):
+        # Só sessões que ainda existem: uma encerrada não volta
+        with self._lock:
+            registro = self._sessoes.get(sid)
+            if registro is None:
+                return False
+            if registro['usuario'] != usuario:
+                self._descartar(sid)
+                self._sessoes[sid] = registro
+                if usuario:
+                    self._por_usuario[usuario].add(sid)
+            registro.update(usuario=usuario, dados=dados, expira=expira)
+            return True
+
+    def renovar(self, sid, expira):
+        with self._lock:
+            if sid in self._sessoes:
+                self._sessoes[sid]['expira'] = expira
+
+    def remover(self, sid):
+        with self._lock:
+            self._descartar(sid)
+
+    def _descartar(self, sid):
+        registro = self._sessoes.pop(sid, None)
+        if registro and registro['usuario']:
+            self._por_usuario[registro['usuario']].discard(sid)
+            if not self._por_usuario[registro['usuario']]:
+                del self._por_usuario[registro['usuario']]
+
+    def encerrar_usuario(self, usuario):
+        with self._lock:
+            sids = list(self._por_usuario.get(usuario, ()))
+            for sid in sids:
+                self._descartar(sid)
+            return len(sids)
+
+    def contar_usuarios(self):
+        agora = time.time()
+        with self._lock:
+            return sum(
+                1 for sids in self._por_usuario.values()
+                if any(self._sessoes[sid]['expira'] >= agora for sid in sids)
+            )
+
+# ===== SQLITE =====
+
+ESQUEMA_SESSOES = """
+CREATE TABLE IF NOT EXISTS sessoes (
+    sid TEXT PRIMARY KEY,
+    usuario TEXT,
+    dados TEXT NOT NULL,
+    expira REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessoes_usuario ON sessoes (usuario);
+CREATE INDEX IF NOT EXISTS idx_sessoes_expira ON sessoes (expira);
+"""
+
+class ArmazemSessoesSQLite:
+    # Compartilhado entre workers: qualquer um lê a sessão criada por outro e
+    # o encerramento de um usuário vale para todos
+
+    def __init__(self, caminho=CAMINHO_PADRAO):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._gravacoes = 0
+        conexao = self._conexao()
+        conexao.execute('PRAGMA journal_mode=WAL')
+        conexao.executescript(ESQUEMA_SESSOES)
+
+    def _conexao(self):
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=10)
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            conexao.execute('PRAGMA busy_timeout=10000')
+            self._local.conexao = conexao
+        return conexao
+
+    def obter(self, sid):
+        linha = self._conexao().execute('SELECT dados, expira FROM sessoes WHERE sid = ? AND expira >= ?', (sid, time.time())).fetchone()
+        return (linha[0], linha[1]) if linha else None
+
+    def gravar(self, sid, usuario, dados, expira):
+        with self._conexao() as conexao:
+            conexao.execute('INSERT OR REPLACE INTO sessoes (sid, usuario, dados, expira) VALUES (?, ?, ?, ?)', (sid, usuario, dados, expira))
+            # Limpeza das expiradas de tempos em tempos
+            self._gravacoes += 1
+            if self._gravacoes % 500 == 0:
+                conexao.execute('DELETE FROM sessoes WHERE expira < ?', (time.time(),))
+
+    def atualizar(self, sid, usuario, dados, expira):
+        # UPDATE e não INSERT OR REPLACE: uma sessão apagada por
+        # encerrar_usuario enquanto a requisição corria não é recriada
+        with self._conexao() as conexao:
+            return conexao.execute('UPDATE sessoes SET usuario = ?, dados = ?, expira = ? WHERE sid = ?', (usuario, dados, expira, sid)).rowcount > 0
+
+    def renovar(self, sid, expira):
+        with self._conexao() as conexao:
+            conexao.execute('UPDATE sessoes SET expira = ? WHERE sid = ?', (expira, sid))
+
+    def remover(self, sid):
+        with self._conexao() as conexao:
+            conexao.execute('DELETE FROM sessoes WHERE sid = ?', (sid,))
+
+    def encerrar_usuario(self, usuario):
+        with self._conexao() as conexao:
+            return conexao.execute('DELETE FROM sessoes WHERE usuario = ?', (usuario,)).rowcount
+
+    def contar_usuarios(self):
+        return self._conexao().execute(
+            'SELECT COUNT(DISTINCT usuario) FROM sessoes WHERE usuario IS NOT NULL AND expira >= ?', (time.time(),)
+        ).fetchone()[0]
+
+ARMAZENS_SESSOES = {
+    'memoria': ArmazemSessoesMemoria,
+    'sqlite': ArmazemSessoesSQLite,
+}
+
+def criar_armazem_sessoes(backend=BACKEND_SESSOES):
+    if backend not in ARMAZENS_SESSOES:
+        raise ValueError(f'Backend de sessões desconhecido: {backend}')
+    return ARMAZENS_SESSOES[backend]()
+
+# ===== INTERFACE COM O FLASK =====
+
+class SessaoServidor(CallbackDict, SessionMixin):
+
+    def __init__(self, dados=None, sid=None, novo=False, expira=0):
+        def ao_alterar(sessao):
+            sessao.modified = True
+        CallbackDict.__init__(self, dados, ao_alterar)
+        self.sid = sid
+        self.new = novo
+        self.expira = expira
+        self.modified = False
+        self.sid_anterior = None
+
+    def renovar_id(self):
+        # Novo id no login, para que um id conhecido antes não vire sessão autenticada
+        if not self.new:
+            self.sid_anterior = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.new = True
+        self.modified = True
+
+class InterfaceSessoes(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, armazem, duracao=DURACAO_SESSAO):
+        self.armazem = armazem
+        self.duracao = duracao
+        self._contagem = None
+        self._contagem_em = 0
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            registro = self.armazem.obter(sid)
+            if registro is not None:
+                dados, expira = registro
+                return SessaoServidor(self.serializer.loads(dados), sid=sid, expira=expira)
+        return SessaoServidor(sid=secrets.token_urlsafe(32), novo=True)
+
+    def save_session(self, app, session, response):
+        nome = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        caminho = self.get_cookie_path(app)
+        if session.sid_anterior:
+            self.armazem.remover(session.sid_anterior)
+
+        if not session:
+            # Sessão esvaziada (logout) ou que nunca teve conteúdo
+            if not session.new:
+                self.armazem.remover(session.sid)
+            if not session.new or session.sid_anterior:
+                response.delete_cookie(nome, domain=dominio, path=caminho)
+            return
+
+        agora = time.time()
+        expira = agora + self.duracao
+        if session.new:
+            self.armazem.gravar(session.sid, session.get('usuario'), self.serializer.dumps(dict(session)), expira)
+        elif session.modified:
+            self.armazem.atualizar(session.sid, session.get('usuario'), self.serializer.dumps(dict(session)), expira)
+        elif session.expira - agora < self.duracao - INTERVALO_RENOVACAO:
+            self.armazem.renovar(session.sid, expira)
+
+        if session.new:
+            response.set_cookie(
+                nome, session.sid,
+                max_age=self.duracao,
+                domain=dominio,
+                path=caminho,
+                httponly=self.get_cookie_httponly(app),
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+
+    def encerrar_usuario(self, usuario):
+        self._contagem = None
+        return self.armazem.encerrar_usuario(usuario)
+
+    def usuarios_ativos(self):
+        # Usuários distintos com sessão válida, recontados a cada poucos segundos
+        agora = time.monotonic()
+        if self._contagem is None or agora - self._contagem_em > VALIDADE_CONTAGEM:
+            self._contagem = self.armazem.contar_usuarios()
+            self._contagem_em = agora
+        return self._contagem
@@ -0,0 +1,218 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from trabalhador_relatorios import renderizar
+
+DIRETORIO_PADRAO = os.environ.get('MONITORAMENTO_RELATORIOS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados', 'relatorios'))
+DIRETORIO_MODULOS = os.path.dirname(os.path.abspath(__file__))
+
+# Limites para que uma rajada de relatórios não tire CPU do dashboard
+MAX_PROCESSOS = int(os.environ.get('MONITORAMENTO_RELATORIOS_PROCESSOS', 2))
+MAX_PENDENTES = 20
+MAX_POR_USUARIO = 3
+VALIDADE_ARQUIVOS = 24 * 3600
+# Tempo máximo de um processo de relatório (segundos)
+TEMPO_MAXIMO = int(os.environ.get('MONITORAMENTO_RELATORIOS_TEMPO_MAXIMO', 600))
+
+# ===== FILA =====
+
+def _vincular(origem, destino):
+    # Outro nome para o mesmo arquivo (ou uma cópia, se o link não for
+    # possível). False se a origem já não existe.
+    try:
+        os.link(origem, destino)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        try:
+            shutil.copyfile(origem, destino)
+        except FileNotFoundError:
+            return False
+    return True
+
+class LimiteExcedido(Exception):
+    pass
+
+class FilaRelatorios:
+    # Cada tarefa tem um arquivo <id>.json com seus metadados e um
+    # <id>.progresso atualizado pelo processo filho; assim qualquer worker
+    # web consegue responder o status e servir o arquivo pronto.
+    # O processo filho recebe só o pedido (plano e filtros) e consulta o
+    # banco por conta própria; 'banco' é o caminho do SQLite.
+
+    def __init__(self, diretorio=DIRETORIO_PADRAO, max_processos=MAX_PROCESSOS, cache=None, banco=None, tempo_maximo=TEMPO_MAXIMO):
+        self.diretorio = diretorio
+        self.max_processos = max_processos
+        self.tempo_maximo = tempo_maximo
+        self.cache = cache
+        self.banco = os.path.abspath(banco) if banco else None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._ativas = {}
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _obter_executor(self):
+        if self._executor is None:
+            # Cada thread só espera o seu processo filho, então o número de
+            # threads limita quantos relatórios renderizam ao mesmo tempo
+            self._executor = ThreadPoolExecutor(max_workers=self.max_processos, thread_name_prefix='relatorios')
+        return self._executor
+
+    def _executar(self, pedido, processos):
+        try:
+            return self._renderizar(pedido, processos)
+        except BaseException:
+            # Arquivo pela metade não fica para trás
+            try:
+                os.remove(pedido['caminho'])
+            except OSError:
+                pass
+            raise
+
+    def _renderizar(self, pedido, processos):
+        if not self.banco:
+            # Armazenamento em memória: o filho não enxergaria os dados, então
+            # a renderização fica nesta thread
+            return renderizar(pedido, processos)
+        # O filho parte de um interpretador novo com um módulo mínimo, sem
+        # herdar (por fork) nem reimportar (__main__) nada do processo web
+        caminho_pedido = self._caminho(pedido['id'], 'pedido')
+        with open(caminho_pedido, 'w', encoding='utf-8') as arquivo:
+            json.dump(pedido, arquivo, ensure_ascii=False)
+        try:
+            resultado = subprocess.run(
+                [sys.executable, '-m', 'trabalhador_relatorios', caminho_pedido],
+                cwd=DIRETORIO_MODULOS, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                timeout=self.tempo_maximo
+            )
+        except subprocess.TimeoutExpired:
+            # O run() já matou o filho; a vaga do executor volta para a fila
+            raise RuntimeError(f'Relatório não terminou em {self.tempo_maximo:.0f}s') from None
+        finally:
+            os.remove(caminho_pedido)
+        if resultado.returncode:
+            erro = resultado.stderr.decode('utf-8', 'replace').strip().splitlines()
+            raise RuntimeError(erro[-1] if erro else f'Processo de relatório terminou com código {resultado.returncode}')
+        return os.path.getsize(pedido['caminho'])
+
+    def _caminho(self, tarefa_id, extensao):
+        return os.path.join(self.diretorio, f'{tarefa_id}.{extensao}')
+
+    def _gravar_meta(self, tarefa):
+        temporario = self._caminho(tarefa['id'], 'json.tmp')
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump(tarefa, arquivo, ensure_ascii=False)
+        os.replace(temporario, self._caminho(tarefa['id'], 'json'))
+
+    def _nova_tarefa(self, usuario, titulo, nome_arquivo, formato, total):
+        return {
+            'id': uuid.uuid4().hex,
+            'usuario': usuario,
+            'titulo': titulo,
+            'formato': formato,
+            'nome_arquivo': nome_arquivo,
+            'arquivo': None,
+            'estado': 'processando',
+            'total': total,
+            'criado_em': time.time(),
+            'concluido_em': None,
+            'erro': None
+        }
+
+    def submeter(self, usuario, titulo, nome_arquivo, formato, extensao, plano, processos, chave=None, nome_usuario=None):
+        # usuario: dono da tarefa (login); nome_usuario: o que sai no arquivo
+        if chave and self.cache:
+            em_cache = self.cache.obter(chave, extensao)
+            tarefa = self._nova_tarefa(usuario, titulo, nome_arquivo, formato, None)
+            caminho = self._caminho(tarefa['id'], extensao)
+            # A tarefa fica com o próprio link para o arquivo: se o LRU do
+            # cache removê-lo, o download continua valendo até a tarefa expirar
+            if em_cache and _vincular(em_cache, caminho):
+                tarefa.update(estado='concluido', arquivo=caminho, concluido_em=time.time())
+                self._gravar_meta(tarefa)
+                return tarefa['id']
+
+        # Só a contagem do período, para o progresso: as linhas são lidas e
+        # formatadas pelo processo filho
+        total = len(processos.consultar(**plano.filtros))
+        with self._lock:
+            if len(self._ativas) >= MAX_PENDENTES:
+                raise LimiteExcedido('Muitos relatórios em processamento. Tente novamente em instantes.')
+            if sum(1 for t in self._ativas.values() if t['usuario'] == usuario) >= MAX_POR_USUARIO:
+                raise LimiteExcedido(f'Limite de {MAX_POR_USUARIO} relatórios simultâneos por usuário atingido.')
+
+            tarefa = self._nova_tarefa(usuario, titulo, nome_arquivo, formato, total)
+            self._gravar_meta(tarefa)
+            self._ativas[tarefa['id']] = tarefa
+
+        caminho = self._caminho(tarefa['id'], extensao)
+        pedido = {
+            'id': tarefa['id'],
+            'caminho': caminho,
+            'progresso': self._caminho(tarefa['id'], 'progresso'),
+            'formato': formato,
+            'titulo': titulo,
+            'usuario': nome_usuario or usuario,
+            'campos': plano.campos,
+            'filtros': plano.filtros,
+            'banco': self.banco,
+        }
+        futuro = self._obter_executor().submit(self._executar, pedido, processos)
+        futuro.add_done_callback(lambda f: self._concluir(tarefa, caminho, f, chave, extensao))
+        self.limpar_antigos()
+        return tarefa['id']
+
+    def _concluir(self, tarefa, caminho, futuro, chave, extensao):
+        erro = futuro.exception()
+        if erro is None:
+            if chave and self.cache:
+                # O cache recebe um segundo link; o arquivo da tarefa fica
+                copia = caminho + '.cache'
+                if _vincular(caminho, copia):
+                    self.cache.guardar(chave, extensao, copia)
+            tarefa.update(estado='concluido', arquivo=caminho)
+        else:
+            tarefa.update(estado='erro', erro=str(erro))
+        tarefa['concluido_em'] = time.time()
+        self._gravar_meta(tarefa)
+        with self._lock:
+            self._ativas.pop(tarefa['id'], None)
+
+    def obter(self, tarefa_id):
+        if not tarefa_id.isalnum():
+            return None
+        try:
+            with open(self._caminho(tarefa_id, 'json'), encoding='utf-8') as arquivo:
+                tarefa = json.load(arquivo)
+        except (OSError, ValueError):
+            return None
+
+        if tarefa['estado'] == 'concluido':
+            tarefa['progresso'] = 100
+        elif tarefa['estado'] == 'processando' and tarefa['total']:
+            try:
+                with open(self._caminho(tarefa_id, 'progresso')) as arquivo:
+                    processadas = int(arquivo.read() or 0)
+            except (OSError, ValueError):
+                processadas = 0
+            tarefa['progresso'] = min(99, int(processadas * 100 / tarefa['total']))
+        else:
+            tarefa['progresso'] = 0
+        return tarefa
+
+    def limpar_antigos(self):
+        limite = time.time() - VALIDADE_ARQUIVOS
+        for nome in os.listdir(self.diretorio):
+            caminho = os.path.join(self.diretorio, nome)
+            try:
+                if os.path.getmtime(caminho) < limite:
+                    os.remove(caminho)
+            except OSError:
+                pass
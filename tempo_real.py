@@ -0,0 +1,103 @@
+import json
+import threading
+from collections import OrderedDict
+
+# Intervalo para comentários de keep-alive no fluxo SSE (segundos)
+INTERVALO_KEEPALIVE = 15
+
+# ===== ASSINANTES =====
+
+class Assinante:
+    # Cada cliente conectado tem uma caixa de entrada que guarda apenas o
+    # estado mais recente por chave. Um cliente lento recebe o último valor,
+    # nunca uma fila crescente de atualizações antigas.
+
+    def __init__(self, filtro=None):
+        self.filtro = filtro
+        self._cond = threading.Condition()
+        self._pendentes = OrderedDict()
+        self._encerrado = False
+
+    def aceita(self, chave):
+        return self.filtro is None or chave in self.filtro
+
+    def entregar(self, chave, evento, dados):
+        with self._cond:
+            self._pendentes.pop(chave, None)
+            self._pendentes[chave] = (evento, dados)
+            self._cond.notify()
+
+    def encerrar(self):
+        with self._cond:
+            self._encerrado = True
+            self._cond.notify()
+
+    def aguardar(self, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: self._pendentes or self._encerrado, timeout)
+            eventos = list(self._pendentes.values())
+            self._pendentes.clear()
+            return eventos
+
+    @property
+    def encerrado(self):
+        return self._encerrado
+
+# ===== DIFUSOR =====
+
+class Difusor:
+    # Um único produtor (aquisição e transições de status) distribui para
+    # todos os assinantes. O último estado de cada chave fica guardado para
+    # que um novo assinante comece com a foto atual.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._assinantes = set()
+        self._estado = {}
+
+    def publicar(self, chave, evento, dados):
+        with self._lock:
+            self._estado[chave] = (evento, dados)
+            assinantes = [a for a in self._assinantes if a.aceita(chave)]
+        for assinante in assinantes:
+            assinante.entregar(chave, evento, dados)
+
+    def descartar(self, chave):
+        with self._lock:
+            self._estado.pop(chave, None)
+
+    def assinar(self, filtro=None):
+        assinante = Assinante(filtro)
+        with self._lock:
+            for chave, (evento, dados) in self._estado.items():
+                if assinante.aceita(chave):
+                    assinante.entregar(chave, evento, dados)
+            self._assinantes.add(assinante)
+        return assinante
+
+    def cancelar(self, assinante):
+        with self._lock:
+            self._assinantes.discard(assinante)
+        assinante.encerrar()
+
+    @property
+    def total_assinantes(self):
+        with self._lock:
+            return len(self._assinantes)
+
+# ===== SERVER-SENT EVENTS =====
+
+def formatar_evento(evento, dados):
+    return 'event: {}\ndata: {}\n\n'.format(evento, json.dumps(dados, ensure_ascii=False))
+
+def fluxo_sse(difusor, assinante):
+    try:
+        yield 'retry: 3000\n\n'
+        while not assinante.encerrado:
+            eventos = assinante.aguardar(INTERVALO_KEEPALIVE)
+            if not eventos:
+                yield ': keepalive\n\n'
+                continue
+            yield ''.join(formatar_evento(evento, dados) for evento, dados in eventos)
+    finally:
+        difusor.cancelar(assinante)
@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Tudo que a aplicação grava vai para um diretório temporário, definido
+# antes do primeiro import de app
+DIRETORIO = tempfile.mkdtemp(prefix='monitoramento-testes-')
+os.environ.setdefault('MONITORAMENTO_DB', os.path.join(DIRETORIO, 'monitoramento.db'))
+os.environ.setdefault('MONITORAMENTO_SERIES', os.path.join(DIRETORIO, 'series'))
+os.environ.setdefault('MONITORAMENTO_ALARMES', os.path.join(DIRETORIO, 'alarmes', 'eventos.jsonl'))
+os.environ.setdefault('MONITORAMENTO_EVENTOS_PROCESSO', os.path.join(DIRETORIO, 'eventos', 'processos.jsonl'))
+os.environ.setdefault('MONITORAMENTO_CACHE_RELATORIOS', os.path.join(DIRETORIO, 'cache_relatorios'))
+os.environ.setdefault('MONITORAMENTO_RELATORIOS', os.path.join(DIRETORIO, 'relatorios'))
+os.environ.setdefault('MONITORAMENTO_NOTIFICACOES_LOG', os.path.join(DIRETORIO, 'notificacoes.log'))
+os.environ.setdefault('MONITORAMENTO_SCRYPT_N', str(2 ** 14))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope='session')
+def aplicacao():
+    import app
+    app.app.config['TESTING'] = True
+    return app
+
+@pytest.fixture
+def logar(aplicacao):
+    def logar(usuario, senha='123'):
+        cliente = aplicacao.app.test_client()
+        resposta = cliente.post('/login', data={'usuario': usuario, 'senha': senha})
+        assert resposta.status_code == 302
+        return cliente
+    return logar
@@ -0,0 +1,21 @@
+from alarmes import RegistroEventos
+
+def _evento(indice):
+    return {'sensor_id': indice % 2, 'indice': indice}
+
+def test_ultimos_ignora_linha_cortada(tmp_path):
+    registro = RegistroEventos(str(tmp_path / 'eventos.jsonl'))
+    registro.anexar([_evento(1), _evento(2)])
+    with open(registro.caminho, 'a', encoding='utf-8') as arquivo:
+        arquivo.write('{"sensor_id": 1, "ind')
+
+    assert [evento['indice'] for evento in registro.ultimos()] == [2, 1]
+
+def test_rotacao_limita_o_tamanho_e_mantem_os_mais_recentes(tmp_path):
+    registro = RegistroEventos(str(tmp_path / 'eventos.jsonl'), tamanho_maximo=200, rotacionados=2)
+    for indice in range(100):
+        registro.anexar([_evento(indice)])
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['eventos.jsonl', 'eventos.jsonl.1', 'eventos.jsonl.2']
+    assert all(p.stat().st_size <= 200 + 40 for p in tmp_path.iterdir())
+    assert [evento['indice'] for evento in registro.ultimos(5, sensor_id=1)] == [99, 97, 95, 93, 91]
@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import pytest
+
+from analitico import AgregadosDiarios
+
+def _ts(dia, hora, minuto=0):
+    return datetime(2025, 1, dia, hora, minuto).timestamp()
+
+def _evento(equip_id, instante, tipo, status=None, **dados):
+    return {'equipamento_id': equip_id, 'ts': instante, 'tipo': tipo, 'status': status, 'dados': dados}
+
+def _agregados():
+    agregados = AgregadosDiarios()
+    for evento in [
+        _evento(1, _ts(10, 8), 'equipamento_criado', 'livre'),
+        _evento(2, _ts(10, 8), 'equipamento_criado', 'livre'),
+        _evento(1, _ts(10, 9), 'processo_iniciado', 'ocupada', produto='P1'),
+        _evento(1, _ts(10, 11), 'processo_finalizado', 'aguardando_qualidade', processo_id=7),
+        _evento(1, _ts(10, 11, 30), 'qualidade_rejeitado', 'livre', processo_id=7),
+    ]:
+        agregados.aplicar(evento)
+    return agregados
+
+def test_indicadores_por_equipamento_e_produto():
+    resultado = _agregados().consultar('2025-01-10', '2025-01-10', agora=_ts(10, 12))
+    primeiro, segundo = resultado['grupos']
+
+    assert primeiro['equipamento'] == 1
+    assert primeiro['horas']['livre'] == 1.5 and primeiro['horas']['ocupada'] == 2.0
+    assert primeiro['horas']['aguardando_qualidade'] == 0.5
+    assert (primeiro['ocupacao'], primeiro['ciclos'], primeiro['ciclo_medio_min']) == (0.5, 1, 120.0)
+    assert (primeiro['rejeitados'], primeiro['taxa_rejeicao']) == (1, 1.0)
+    # Sem ciclo nem análise no período: razões ficam vazias, não zero
+    assert (segundo['ocupacao'], segundo['ciclo_medio_min'], segundo['taxa_rejeicao']) == (0.0, None, None)
+    assert resultado['produtos'] == [
+        {'produto': 'P1', 'ciclos': 1, 'ciclo_medio_min': 120.0, 'aprovados': 0, 'rejeitados': 1, 'taxa_rejeicao': 1.0}
+    ]
+
+def test_agrupamento_por_localizacao_e_filtro_de_equipamentos():
+    agregados = _agregados()
+    por_local = agregados.consultar('2025-01-10', '2025-01-10', agrupar='localizacao', localizacoes={1: 'Sala A'}, agora=_ts(10, 12))
+    assert [grupo['localizacao'] for grupo in por_local['grupos']] == ['Sala A', 'Sem localização']
+
+    so_o_segundo = agregados.consultar('2025-01-10', '2025-01-10', equipamentos=[2], agora=_ts(10, 12))
+    assert [grupo['equipamento'] for grupo in so_o_segundo['grupos']] == [2]
+    assert so_o_segundo['produtos'] == []
+
+    with pytest.raises(ValueError):
+        agregados.consultar('2025-01-10', '2025-01-10', agrupar='turno')
+
+def test_intervalo_que_atravessa_a_meia_noite_divide_entre_os_dias():
+    agregados = AgregadosDiarios()
+    agregados.aplicar(_evento(1, _ts(10, 22), 'processo_iniciado', 'ocupada', produto='P1'))
+    agregados.aplicar(_evento(1, _ts(11, 2), 'processo_finalizado', 'aguardando_qualidade', processo_id=1))
+
+    por_dia = agregados.consultar('2025-01-10', '2025-01-11', agrupar='dia', agora=_ts(11, 2))
+    assert [(grupo['dia'], grupo['horas']['ocupada'], grupo['ciclos']) for grupo in por_dia['grupos']] == [
+        ('2025-01-10', 2.0, 0), ('2025-01-11', 2.0, 1)
+    ]
+
+    # O snapshot exportado reconstrói os mesmos indicadores
+    copia = AgregadosDiarios()
+    copia.importar(agregados.exportar())
+    assert copia.consultar('2025-01-10', '2025-01-11', agrupar='dia', agora=_ts(11, 2)) == por_dia
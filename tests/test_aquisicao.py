@@ -0,0 +1,139 @@
+import threading
+import time
+
+import drivers
+import aquisicao
+from aquisicao import CacheLeituras, PoolConexoes, ServicoAquisicao
+
+class _DriverFalso:
+    def __init__(self, endpoint, liberar):
+        self.endpoint = endpoint
+        self.liberar = liberar
+
+    def ler_lote(self, sensores):
+        if self.endpoint[0] == 'i2c':
+            self.liberar.wait(5)
+        return {sensor['id']: 25.0 for sensor in sensores}
+
+    def fechar(self):
+        pass
+
+def test_endpoint_travado_nao_atrasa_os_demais():
+    liberar = threading.Event()
+    aberturas = []
+
+    def abrir(endpoint):
+        aberturas.append(endpoint)
+        return _DriverFalso(endpoint, liberar)
+
+    sensores = [
+        {'id': 1, 'tipo_comunicacao': 'i2c', 'intervalo_leitura': 0.01},
+        {'id': 2, 'tipo_comunicacao': 'usb_com', 'intervalo_leitura': 0.01},
+    ]
+    cache = CacheLeituras()
+    servico = ServicoAquisicao(lambda: sensores, cache, PoolConexoes(abrir))
+    try:
+        inicio = time.monotonic()
+        servico.ciclo()
+        assert time.monotonic() - inicio < drivers.DriverI2C.timeout + 0.5
+        assert cache.obter(1)['status'] == 'erro'
+        assert cache.obter(2)['status'] == 'ok'
+
+        # Enquanto a leitura antiga não volta, o endpoint fica fora do ciclo
+        time.sleep(0.02)
+        servico.ciclo()
+        assert [e[0] for e in aberturas].count('i2c') == 1
+    finally:
+        liberar.set()
+        servico.parar()
+
+def test_teste_de_comunicacao_nao_consome_o_simulador_da_aquisicao():
+    sensor = {'id': 987, 'tipo_comunicacao': 'usb_com'}
+    aquisicao.testar_sensores([sensor])
+    assert 987 not in drivers.simulador._estado
+
+def test_conexao_lenta_nao_bloqueia_outros_endpoints():
+    liberar = threading.Event()
+
+    def abrir(endpoint):
+        if endpoint[0] == 'i2c':
+            liberar.wait(5)
+        return _DriverFalso(endpoint, liberar)
+
+    pool = PoolConexoes(abrir)
+    travada = threading.Thread(target=pool.obter, args=(('i2c', 'sensor', 1),))
+    travada.start()
+    try:
+        time.sleep(0.05)
+        inicio = time.monotonic()
+        pool.obter(('usb_com', 'sensor', 2))
+        assert time.monotonic() - inicio < 0.5
+    finally:
+        liberar.set()
+        travada.join()
+    assert len(pool) == 2
+
+def test_cache_so_avanca_a_versao_quando_o_valor_muda():
+    cache = CacheLeituras()
+    avisos = []
+    cache.ouvintes.append(lambda sensor_id, leitura: avisos.append(sensor_id))
+
+    cache.gravar(1, {'status': 'ok', 'temperatura': 25.0, 'timestamp': 1.0})
+    versoes = cache.versoes([1, 2])
+    cache.gravar(1, {'status': 'ok', 'temperatura': 25.0, 'timestamp': 2.0})
+    assert cache.versoes([1, 2]) == versoes
+    assert cache.obter(1)['timestamp'] == 2.0
+
+    cache.gravar(1, {'status': 'erro', 'temperatura': None, 'erro': 'Canal sem resposta', 'timestamp': 3.0})
+    assert cache.versoes([1, 2]) != versoes
+    assert avisos == [1, 1]
+
+def test_ciclo_respeita_o_intervalo_de_cada_sensor():
+    sensores = [
+        {'id': 1, 'tipo_comunicacao': 'usb_com', 'intervalo_leitura': 0.01},
+        {'id': 2, 'tipo_comunicacao': 'usb_com', 'intervalo_leitura': 60},
+        {'id': 3, 'tipo_comunicacao': 'usb_com', 'ativo': False},
+    ]
+    lotes = []
+    cache = CacheLeituras()
+    servico = ServicoAquisicao(lambda: sensores, cache, PoolConexoes(lambda endpoint: _DriverFalso(endpoint, None)))
+    servico.destinos.append(lambda lote: lotes.append(sorted(leitura['sensor_id'] for leitura in lote)))
+    try:
+        servico.ciclo()
+        time.sleep(0.02)
+        servico.ciclo()
+        assert lotes == [[1, 2], [1]]
+        assert cache.obter(3) is None
+
+        # Sensor desativado sai do cache no ciclo seguinte
+        sensores[1]['ativo'] = False
+        time.sleep(0.02)
+        servico.ciclo()
+        assert cache.obter(2) is None and cache.obter(1)['status'] == 'ok'
+    finally:
+        servico.parar()
+
+def test_varredura_em_paralelo_com_timeout_por_protocolo(monkeypatch):
+    liberar = threading.Event()
+
+    def ler_sensor(sensor):
+        if sensor['tipo_comunicacao'] == 'i2c':
+            liberar.wait(5)
+        else:
+            time.sleep(0.2)
+        return aquisicao._leitura_ok(sensor['id'], 25.0, time.time())
+
+    monkeypatch.setattr(aquisicao, 'ler_sensor', ler_sensor)
+    sensores = [{'id': indice, 'tipo_comunicacao': 'usb_com'} for indice in range(1, 9)]
+    sensores.insert(3, {'id': 99, 'tipo_comunicacao': 'i2c'})
+    try:
+        inicio = time.monotonic()
+        resultados = aquisicao.testar_sensores(sensores)
+        assert time.monotonic() - inicio < drivers.DriverI2C.timeout + 0.5
+    finally:
+        liberar.set()
+
+    assert [leitura['sensor_id'] for leitura in resultados] == [sensor['id'] for sensor in sensores]
+    assert resultados[3]['status'] == 'erro' and 'Sem resposta' in resultados[3]['erro']
+    assert all(leitura['status'] == 'ok' and leitura['latencia_ms'] >= 200 for leitura in resultados if leitura['sensor_id'] != 99)
+    assert aquisicao.testar_sensores([]) == []
@@ -0,0 +1,36 @@
+import pytest
+
+from armazenamento import ArmazenamentoSQLite, criar_armazenamento, ler_processos, sincronizar_lista, sincronizar_registros
+from repositorio import RepositorioProcessos
+
+def test_dados_sobrevivem_ao_reinicio_sem_ressemear(tmp_path):
+    caminho = str(tmp_path / 'dados.db')
+    sensores = [{'id': 1, 'nome': 'S1'}]
+    usuarios = {'ti': {'nome': 'TI'}}
+    armazenamento = ArmazenamentoSQLite(caminho)
+    sincronizar_lista(armazenamento, 'sensores', sensores)
+    sincronizar_registros(armazenamento, 'usuarios', usuarios)
+    armazenamento.salvar_item('sensores', {'id': 2, 'nome': 'S2'})
+    armazenamento.excluir_registro('usuarios', 'ti')
+    armazenamento.salvar_registro('usuarios', 'op', {'nome': 'Operador'})
+
+    # Os dados iniciais do código não sobrescrevem o que já foi gravado
+    sensores, usuarios = [{'id': 1, 'nome': 'S1'}], {'ti': {'nome': 'TI'}}
+    reaberto = ArmazenamentoSQLite(caminho)
+    sincronizar_lista(reaberto, 'sensores', sensores)
+    sincronizar_registros(reaberto, 'usuarios', usuarios)
+    assert sensores == [{'id': 1, 'nome': 'S1'}, {'id': 2, 'nome': 'S2'}]
+    assert usuarios == {'op': {'nome': 'Operador'}}
+
+def test_consulta_de_processos_no_banco_igual_a_da_memoria(tmp_path):
+    caminho = str(tmp_path / 'dados.db')
+    repo = RepositorioProcessos([], ArmazenamentoSQLite(caminho))
+    for indice, (equip_id, data) in enumerate([(1, '2025-01-03 08:00'), (2, '2025-01-01 09:00'), (1, '2025-01-01 10:00')], 1):
+        repo.adicionar({'id': indice, 'equipamento_id': equip_id, 'data_finalizacao': data, 'status_qualidade': 'pendente'})
+
+    for filtros in ({}, {'data_inicio': '2025-01-01', 'data_fim': '2025-01-01'}, {'equip_id': 1}, {'data_inicio': '2025-01-02', 'equip_id': 2}):
+        assert list(ler_processos(caminho, **filtros)) == repo.consultar(**filtros)
+
+def test_backend_desconhecido():
+    with pytest.raises(ValueError):
+        criar_armazenamento('postgres')
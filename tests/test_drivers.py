@@ -0,0 +1,42 @@
+import pytest
+
+import drivers
+from drivers import Simulador, abrir_driver, chave_endpoint, config_sensor, driver_para
+
+def test_simulador_repete_a_mesma_sequencia():
+    sensores = [{'id': 1}, {'id': 2}]
+    primeiro, segundo = Simulador(taxa_falha=0.3), Simulador(taxa_falha=0.3)
+    leituras = [primeiro.ler_lote(sensores) for _ in range(20)]
+    repetidas = [segundo.ler_lote(sensores) for _ in range(20)]
+    assert [{k: str(v) for k, v in lote.items()} for lote in leituras] == [{k: str(v) for k, v in lote.items()} for lote in repetidas]
+    assert any(isinstance(valor, IOError) for lote in leituras for valor in lote.values())
+
+    sem_falhas = Simulador(taxa_falha=0, ruido=0, temp_min=25.0, temp_max=25.0)
+    assert sem_falhas.ler_lote(sensores) == {1: 25.0, 2: 25.0}
+
+def test_sensores_do_mesmo_barramento_dividem_o_endpoint():
+    escravo = {'tipo_comunicacao': 'modbus', 'config': {'porta': 'COM3', 'baud_rate': '9600'}}
+    assert chave_endpoint(dict(escravo, id=1)) == chave_endpoint(dict(escravo, id=2)) == ('modbus', 'COM3', '9600')
+    rede = {'tipo_comunicacao': 'rede', 'config': {'ip': '10.0.0.5', 'porta': 502}}
+    assert chave_endpoint(dict(rede, id=1)) == ('rede', '10.0.0.5', '502')
+    assert chave_endpoint({'id': 3, 'tipo_comunicacao': 'modbus', 'config': {}}) == ('modbus', 'sensor', 3)
+    assert chave_endpoint({'id': 4, 'tipo_comunicacao': 'desconhecido'}) == (None, 'sensor', 4)
+
+def test_modbus_le_em_ordem_de_endereco():
+    lidos = []
+
+    class Fonte:
+        def ler_lote(self, sensores):
+            lidos.extend(sensor['id'] for sensor in sensores)
+            return {}
+
+    driver = abrir_driver(('modbus', 'COM3', '9600'), Fonte())
+    driver.ler_lote([{'id': 1, 'config': {'endereco_escravo': '7'}}, {'id': 2, 'config': {'endereco_escravo': '2'}}, {'id': 3}])
+    assert lidos == [3, 2, 1] and driver.transacoes == 1
+
+@pytest.mark.parametrize('protocolo', sorted(drivers.DRIVERS))
+def test_driver_registrado_monta_a_config_pelo_formulario(protocolo):
+    classe = driver_para(protocolo)
+    assert classe.protocolo == protocolo
+    formulario = {campo: f'valor-{campo}' for _, campo in classe.campos}
+    assert config_sensor(protocolo, formulario) == {chave: f'valor-{campo}' for chave, campo in classe.campos}
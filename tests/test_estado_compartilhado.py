@@ -0,0 +1,112 @@
+import pytest
+
+from armazenamento import ArmazenamentoSQLite, ConflitoVersao, sincronizar_lista
+from repositorio import RepositorioEquipamentos, RepositorioProcessos
+
+def _worker(caminho):
+    armazenamento = ArmazenamentoSQLite(caminho)
+    equipamentos = [{'id': 1, 'nome': 'Estufa', 'status': 'livre', 'processo': None, 'sensor_id': None}]
+    processos = []
+    sincronizar_lista(armazenamento, 'equipamentos', equipamentos)
+    sincronizar_lista(armazenamento, 'processos_finalizados', processos)
+    return armazenamento, RepositorioEquipamentos(equipamentos, armazenamento), RepositorioProcessos(processos, armazenamento)
+
+def test_conflito_de_versao_nao_grava_nenhuma_linha(tmp_path):
+    caminho = str(tmp_path / 'compartilhado.db')
+    _, equipamentos_a, _ = _worker(caminho)
+    armazenamento_b, equipamentos_b, processos_b = _worker(caminho)
+
+    versao_lida = equipamentos_b.obter(1).get('versao', 0)
+    equipamentos_a.alterar_status(equipamentos_a.obter(1), 'ocupada')
+
+    processo = {'id': 10, 'equipamento_id': 1, 'data_finalizacao': '2025-01-01 10:00', 'status_qualidade': 'pendente'}
+    with pytest.raises(ConflitoVersao):
+        equipamentos_b.atualizar(equipamentos_b.obter(1), {'status': 'aguardando_qualidade'}, versao_lida, [(processos_b, processo)])
+
+    assert armazenamento_b.carregar_lista('processos_finalizados') == []
+    assert armazenamento_b.carregar_item('equipamentos', 1)['status'] == 'ocupada'
+    assert processos_b.obter(10) is None
+
+def test_analise_atrasada_nao_libera_equipamento_ocupado(aplicacao, logar):
+    cliente = logar('ti')
+    equip = aplicacao.get_equipamento_por_id(1)
+    cliente.post('/gerenciar/1', data={'acao': 'iniciar', 'produto': 'P1', 'ordem_producao': 'OP', 'versao': equip.get('versao', 0)})
+    cliente.post('/gerenciar/1', data={'acao': 'finalizar', 'versao': equip.get('versao', 0)})
+    processo_id = max(p['id'] for p in aplicacao.processos_finalizados)
+    versao_antiga = equip.get('versao', 0)
+
+    cliente.post('/qualidade', data={'processo_id': processo_id, 'resultado': 'aprovado', 'versao': versao_antiga})
+    cliente.post('/gerenciar/1', data={'acao': 'iniciar', 'produto': 'P2', 'ordem_producao': 'OP', 'versao': equip.get('versao', 0)})
+    cliente.post('/qualidade', data={'processo_id': processo_id, 'resultado': 'rejeitado', 'versao': versao_antiga})
+
+    assert equip['status'] == 'ocupada'
+    assert equip['processo']['produto'] == 'P2'
+    assert aplicacao.repo_processos.obter(processo_id)['status_qualidade'] == 'aprovado'
+
+def test_servicos_exclusivos_rodam_em_um_worker_por_vez(tmp_path):
+    import time
+    from estado_compartilhado import ServicosExclusivos
+
+    caminho = str(tmp_path / 'compartilhado.db')
+    chamadas = []
+
+    def worker(nome):
+        return ServicosExclusivos(
+            ArmazenamentoSQLite(caminho),
+            lambda: chamadas.append((nome, 'iniciar')),
+            lambda: chamadas.append((nome, 'parar')),
+            lambda: chamadas.append((nome, 'acompanhar')),
+            duracao=0.3
+        )
+
+    a, b = worker('a'), worker('b')
+    assert a.renovar() and not b.renovar()
+    assert a.renovar() and not b.renovar()
+    assert chamadas == [('a', 'iniciar')]
+
+    # O dono para de renovar: outro assume quando o arrendamento vence
+    time.sleep(0.4)
+    assert b.renovar() and not a.renovar()
+    assert chamadas == [('a', 'iniciar'), ('b', 'iniciar'), ('a', 'parar')]
+
+def test_falha_do_banco_nao_derruba_o_dono_antes_do_prazo(tmp_path):
+    import time
+    from estado_compartilhado import ServicosExclusivos
+
+    chamadas = []
+    servicos = ServicosExclusivos(
+        ArmazenamentoSQLite(str(tmp_path / 'compartilhado.db')),
+        lambda: chamadas.append('iniciar'),
+        lambda: chamadas.append('parar'),
+        lambda: None,
+        duracao=0.3
+    )
+    assert servicos.renovar()
+
+    def falhar(nome, duracao):
+        raise OSError('database is locked')
+
+    servicos.armazenamento.arrendar = falhar
+    assert servicos.renovar()
+    assert chamadas == ['iniciar']
+
+    # Só deixa de ser dono quando o próprio arrendamento vence
+    time.sleep(0.4)
+    assert not servicos.renovar()
+    assert chamadas == ['iniciar', 'parar']
+
+def test_leituras_publicadas_pelo_dono_chegam_aos_demais(tmp_path):
+    caminho = str(tmp_path / 'compartilhado.db')
+    dono, outro = ArmazenamentoSQLite(caminho), ArmazenamentoSQLite(caminho)
+    leitura = {'sensor_id': 1, 'status': 'ok', 'temperatura': 25.0, 'timestamp': 1.0, 'data_leitura': ''}
+    dono.publicar_leituras([(1, leitura, {'limite': 'alta', 'taxa': False}), (2, dict(leitura, sensor_id=2), None)])
+    assert sorted(outro.carregar_leituras()) == sorted([(1, leitura, {'limite': 'alta', 'taxa': False}), (2, dict(leitura, sensor_id=2), None)])
+
+def test_equipamento_novo_gravado_uma_unica_vez(aplicacao, logar):
+    cliente = logar('ti')
+    antes = aplicacao.armazenamento.ultima_alteracao()
+    cliente.post('/ti/equipamentos', data={'acao': 'adicionar', 'nome': 'Estufa Nova', 'tipo': 'estufa'})
+    novo = aplicacao.equipamentos[-1]
+    assert novo['nome'] == 'Estufa Nova' and novo.get('versao', 0) == 0
+    assert aplicacao.armazenamento.ultima_alteracao() - antes == 1
+    assert aplicacao.eventos_processo.ultimos(1, novo['id'])[0]['tipo'] == 'equipamento_criado'
@@ -0,0 +1,35 @@
+import os
+
+from analitico import AgregadosDiarios
+from eventos_processo import LogEventosProcesso
+
+def _abrir(caminho):
+    return LogEventosProcesso(caminho, snapshot_a_cada=3, extras={'analitico': AgregadosDiarios()})
+
+def _registrar(log, tipos):
+    for tipo, status, anterior in tipos:
+        log.registrar(tipo, 1, status, anterior, 'ti', produto='P1')
+
+def test_snapshot_mais_trecho_final_reproduz_o_log_inteiro(tmp_path):
+    caminho = str(tmp_path / 'processos.jsonl')
+    log = _abrir(caminho)
+    _registrar(log, [
+        ('equipamento_criado', 'livre', None),
+        ('processo_iniciado', 'ocupada', 'livre'),
+        ('processo_finalizado', 'aguardando_qualidade', 'ocupada'),
+        ('qualidade_aprovado', 'livre', 'aguardando_qualidade'),
+        ('processo_iniciado', 'ocupada', 'livre'),
+    ])
+
+    reaberto = _abrir(caminho)
+    assert reaberto.carga['snapshot']
+    assert reaberto.carga['eventos_reaplicados'] == 2
+    assert reaberto.projecoes.exportar() == log.projecoes.exportar()
+    assert reaberto.extras['analitico'].exportar() == log.extras['analitico'].exportar()
+
+    os.remove(caminho + '.snapshot')
+    do_zero = _abrir(caminho)
+    assert not do_zero.carga['snapshot']
+    assert do_zero.carga['eventos_reaplicados'] == 5
+    assert do_zero.projecoes.exportar() == reaberto.projecoes.exportar()
+    assert do_zero.extras['analitico'].exportar() == reaberto.extras['analitico'].exportar()
@@ -0,0 +1,42 @@
+from fragmentos import CacheFragmentos
+
+def test_fragmento_refeito_so_quando_a_versao_muda():
+    cache = CacheFragmentos()
+    geracoes = []
+
+    def gerar(html):
+        def gerar():
+            geracoes.append(html)
+            return html
+        return gerar
+
+    assert cache.obter(('cartao', 1), 1, gerar('<v1>')) == '<v1>'
+    assert cache.obter(('cartao', 1), 1, gerar('<outro>')) == '<v1>'
+    assert cache.obter(('cartao', 1), 2, gerar('<v2>')) == '<v2>'
+    cache.descartar(('cartao', 1))
+    assert cache.obter(('cartao', 1), 2, gerar('<v2 de novo>')) == '<v2 de novo>'
+    assert geracoes == ['<v1>', '<v2>', '<v2 de novo>']
+
+def test_limite_descarta_o_menos_usado():
+    cache = CacheFragmentos(limite=2)
+    cache.obter('a', 1, lambda: 'a')
+    cache.obter('b', 1, lambda: 'b')
+    cache.obter('a', 1, lambda: 'não usado')
+    cache.obter('c', 1, lambda: 'c')
+
+    assert cache.obter('a', 1, lambda: 'refeito') == 'a'
+    assert cache.obter('b', 1, lambda: 'refeito') == 'refeito'
+
+def test_cartao_do_dashboard_acompanha_a_versao_do_equipamento(aplicacao):
+    equip = aplicacao.equipamentos[0]
+    with aplicacao.app.test_request_context():
+        antes = aplicacao.renderizar_cartoes('operador_cartao.html', [equip])
+        assert aplicacao.renderizar_cartoes('operador_cartao.html', [equip]) == antes
+        nome = equip['nome']
+        try:
+            equip['nome'] = 'Estufa renomeada no teste'
+            aplicacao.repo_equipamentos.marcar_alterado(equip)
+            assert 'Estufa renomeada no teste' in aplicacao.renderizar_cartoes('operador_cartao.html', [equip])[0]
+        finally:
+            equip['nome'] = nome
+            aplicacao.repo_equipamentos.marcar_alterado(equip)
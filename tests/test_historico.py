@@ -0,0 +1,26 @@
+import time
+
+def _equipamento_em_processo(aplicacao):
+    return next(e for e in aplicacao.equipamentos if e.get('sensor_id') and e.get('processo'))
+
+def test_pontos_invalidos_retornam_400(aplicacao, logar):
+    cliente = logar('ti')
+    equip = _equipamento_em_processo(aplicacao)
+    for url in (f'/api/equipamento/{equip["id"]}/historico_processo', f'/api/sensor/{equip["sensor_id"]}/historico'):
+        assert cliente.get(url, query_string={'pontos': 'abc'}).status_code == 400
+        assert cliente.get(url, query_string={'pontos': '999999'}).status_code == 200
+
+def test_historico_agrega_leituras_gravadas(aplicacao, logar):
+    cliente = logar('ti')
+    sensor_id = aplicacao.sensores[0]['id']
+    agora = int(time.time()) - 120
+    aplicacao.serie_temporal.registrar_lote([
+        {'sensor_id': sensor_id, 'timestamp': agora + indice, 'temperatura': 20.0 + indice} for indice in range(10)
+    ])
+    dados = cliente.get(f'/api/sensor/{sensor_id}/historico', query_string={
+        'inicio': agora, 'fim': agora + 9, 'resolucao': 'bruto', 'pontos': 999999
+    }).get_json()
+
+    assert dados['estatisticas']['amostras'] == 10
+    assert dados['estatisticas']['max'] >= 29.0
+    assert len(dados['faixas']['t']) <= 10
@@ -0,0 +1,58 @@
+from notificacoes import LimiteEnvio, Notificador
+
+class _SinkMemoria:
+    def __init__(self):
+        self.envios = []
+
+    def enviar(self, notificacao, destinatarios):
+        self.envios.append(destinatarios)
+
+def _evento(indice):
+    return {'equipamento_id': 1, 'sensor_id': 1, 'tipo': 'alta', 'evento': 'inicio', 'valor': 90 + indice, 'data': '2025-01-01 10:00:00'}
+
+def test_sink_nao_recebe_envio_sem_destinatarios():
+    sink = _SinkMemoria()
+    notificador = Notificador(
+        lambda evento: (evento['equipamento_id'], 'Estufa'),
+        lambda: [{'usuario': 'qualidade', 'nome': 'Pedro', 'email': 'q@empresa.com'}],
+        sinks=[sink], janela=0, limite=LimiteEnvio(limite=1, periodo=3600)
+    )
+    for indice in range(3):
+        notificador.enfileirar([_evento(indice)])
+        notificador.descarregar(forcar=True)
+
+    assert [[d['usuario'] for d in envio] for envio in sink.envios] == [['qualidade']]
+    assert notificador.suprimidos == 2
+    assert notificador.enviados == 1
+
+def test_erro_ao_agrupar_ou_obter_destinatarios_nao_para_o_despacho():
+    import time
+    sink = _SinkMemoria()
+    falhas = {'agrupar': 1, 'destinatarios': 1}
+
+    def agrupar(evento):
+        if falhas['agrupar']:
+            falhas['agrupar'] -= 1
+            raise KeyError('sensor removido')
+        return evento['equipamento_id'], 'Estufa'
+
+    def destinatarios():
+        if falhas['destinatarios']:
+            falhas['destinatarios'] -= 1
+            raise RuntimeError('dictionary changed size during iteration')
+        return [{'usuario': 'qualidade', 'nome': 'Pedro', 'email': None}]
+
+    notificador = Notificador(agrupar, destinatarios, sinks=[sink], janela=0)
+    notificador.iniciar()
+    try:
+        for indice in range(3):
+            notificador.enfileirar([_evento(indice)])
+            time.sleep(0.1)
+        for _ in range(50):
+            if sink.envios:
+                break
+            time.sleep(0.05)
+    finally:
+        notificador.parar()
+    assert notificador.descartados == 1
+    assert len(sink.envios) == 1
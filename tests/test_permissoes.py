@@ -0,0 +1,56 @@
+from permissoes import ResolvedorPermissoes, permissoes_do_formulario, tipo_por_permissoes
+
+def _resolvedor():
+    usuarios = {
+        'ana': {'grupo': 'turno', 'permissoes': {'dashboard': True}},
+        'bia': {'grupo': 'turno', 'permissoes': {}},
+        'caio': {'permissoes': {'ti': True}},
+        'davi': {'grupo': 'turno', 'ativo': False},
+    }
+    grupos = {'turno': {'permissoes': {'operador': True, 'relatorio_2': True}}}
+    relatorios = {1: {}, 2: {}}
+    return ResolvedorPermissoes(usuarios, grupos, lambda: relatorios), usuarios, grupos, relatorios
+
+def test_permissoes_efetivas_somam_usuario_e_grupo():
+    resolvedor, _, _, _ = _resolvedor()
+    assert resolvedor.efetivas('ana') == {'dashboard': True, 'operador': True, 'relatorio_2': True}
+    assert resolvedor.compilar('davi') == 0 and resolvedor.compilar('ninguem') == 0
+
+    bits = resolvedor.compilar('bia')
+    assert resolvedor.permite(bits, ['operador']) and resolvedor.permite(bits, ['qualidade', 'relatorio_2'])
+    assert not resolvedor.permite(bits, ['dashboard', 'relatorio_1'])
+    # Quem tem 'ti' passa em qualquer checagem
+    assert resolvedor.permite(resolvedor.compilar('caio'), ['relatorio_1'])
+
+def test_sessao_recompila_so_quando_o_carimbo_muda():
+    resolvedor, usuarios, grupos, _ = _resolvedor()
+    sessao = {'usuario': 'bia'}
+    bits, recompilado = resolvedor.resolver(sessao)
+    assert recompilado and resolvedor.resolver(sessao) == (bits, False)
+
+    # Mudança no grupo alcança os membros pelo índice, sem varrer usuários
+    grupos['turno']['permissoes']['qualidade'] = True
+    assert resolvedor.membros('turno') == ['ana', 'bia', 'davi']
+    for username in resolvedor.membros('turno'):
+        resolvedor.invalidar(username)
+    bits, recompilado = resolvedor.resolver(sessao)
+    assert recompilado and resolvedor.permite(bits, ['qualidade'])
+    assert usuarios['bia']['tipo'] == 'qualidade'
+
+    usuarios['bia']['grupo'] = None
+    resolvedor.indexar_usuario('bia')
+    assert resolvedor.membros('turno') == ['ana', 'davi']
+
+def test_relatorio_novo_muda_o_catalogo():
+    resolvedor, _, _, relatorios = _resolvedor()
+    sessao = {'usuario': 'ana'}
+    resolvedor.resolver(sessao)
+    relatorios[0] = {}
+    resolvedor.atualizar_catalogo()
+    bits, recompilado = resolvedor.resolver(sessao)
+    assert recompilado and resolvedor.permite(bits, ['relatorio_2']) and not resolvedor.permite(bits, ['relatorio_0'])
+
+def test_tipo_e_formulario():
+    assert tipo_por_permissoes({'manutencao': True, 'qualidade': True}) == 'qualidade'
+    assert tipo_por_permissoes({'dashboard': True}) == 'operador'
+    assert permissoes_do_formulario({'perm_ti': 'on', 'nome': 'x'}) == {'ti': True}
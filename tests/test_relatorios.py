@@ -0,0 +1,150 @@
+import time
+
+from armazenamento import ArmazenamentoSQLite
+from relatorios import CacheRelatorios, compilar_plano
+from repositorio import RepositorioProcessos
+from tarefas_relatorio import FilaRelatorios
+
+def _processos(caminho):
+    armazenamento = ArmazenamentoSQLite(caminho)
+    repo = RepositorioProcessos([], armazenamento)
+    for indice, dia in enumerate(['2025-01-01', '2025-01-02', '2025-01-03'], 1):
+        repo.adicionar({'id': indice, 'equipamento_id': 1, 'produto': f'P{indice}', 'data_finalizacao': f'{dia} 10:00', 'status_qualidade': 'pendente'})
+    return repo
+
+def _aguardar(fila, tarefa_id):
+    for _ in range(300):
+        tarefa = fila.obter(tarefa_id)
+        if tarefa['estado'] != 'processando':
+            return tarefa
+        time.sleep(0.1)
+    raise AssertionError('relatório não terminou')
+
+def test_filho_consulta_o_banco_pelo_plano(tmp_path):
+    caminho = str(tmp_path / 'relatorios.db')
+    repo = _processos(caminho)
+    fila = FilaRelatorios(str(tmp_path / 'tarefas'), cache=CacheRelatorios(str(tmp_path / 'cache')), banco=caminho)
+    plano = compilar_plano(['produto', 'data_finalizacao'], data_inicio='2025-01-02')
+
+    tarefa = _aguardar(fila, fila.submeter('ti', 'Teste', 'teste.csv', 'csv', 'csv', plano, repo, chave='k1'))
+
+    assert tarefa['estado'] == 'concluido', tarefa['erro']
+    assert tarefa['total'] == 2
+    with open(tarefa['arquivo'], encoding='utf-8-sig') as arquivo:
+        assert arquivo.read().splitlines() == ['Produto;Data Finalização', 'P2;2025-01-02 10:00', 'P3;2025-01-03 10:00']
+
+def test_arquivo_da_tarefa_sobrevive_a_remocao_do_cache(tmp_path):
+    caminho = str(tmp_path / 'relatorios.db')
+    repo = _processos(caminho)
+    cache = CacheRelatorios(str(tmp_path / 'cache'), max_arquivos=1)
+    fila = FilaRelatorios(str(tmp_path / 'tarefas'), cache=cache, banco=caminho)
+    plano = compilar_plano(['produto'])
+
+    gerada = _aguardar(fila, fila.submeter('ti', 'Teste', 'a.csv', 'csv', 'csv', plano, repo, chave='k1'))
+    do_cache = fila.obter(fila.submeter('ti', 'Teste', 'a.csv', 'csv', 'csv', plano, repo, chave='k1'))
+    # Outra entrada empurra 'k1' para fora do cache
+    _aguardar(fila, fila.submeter('ti', 'Teste', 'b.csv', 'csv', 'csv', plano, repo, chave='k2'))
+
+    assert cache.obter('k1', 'csv') is None
+    for tarefa in (gerada, do_cache):
+        with open(tarefa['arquivo'], encoding='utf-8-sig') as arquivo:
+            assert arquivo.read().splitlines() == ['Produto', 'P1', 'P2', 'P3']
+
+def test_versao_do_periodo_igual_entre_workers_e_reinicios(tmp_path):
+    caminho = str(tmp_path / 'relatorios.db')
+    repo = _processos(caminho)
+    outro = RepositorioProcessos(ArmazenamentoSQLite(caminho).carregar_lista('processos_finalizados'), ArmazenamentoSQLite(caminho))
+    assert repo.versao_periodo('2025-01-01', '2025-01-02') == outro.versao_periodo('2025-01-01', '2025-01-02')
+
+    antes = repo.versao_periodo('2025-01-02', '2025-01-02')
+    repo.alterar_status_qualidade(repo.obter(2), 'aprovado')
+    assert repo.versao_periodo('2025-01-02', '2025-01-02') != antes
+    assert repo.versao_periodo('2025-01-03', '2025-01-03') == outro.versao_periodo('2025-01-03', '2025-01-03')
+    outro.aplicar(dict(repo.obter(2)))
+    assert outro.versao_periodo() == repo.versao_periodo()
+
+def test_chave_muda_com_o_nome_do_relatorio():
+    from relatorios import chave_relatorio
+    relatorio = {'id': 'r1', 'nome': 'Produção', 'campos': ['produto']}
+    chave = chave_relatorio(relatorio, 'pdf', None, {}, 'v', 'ti')
+    assert chave_relatorio(dict(relatorio, nome='Produção diária'), 'pdf', None, {}, 'v', 'ti') != chave
+
+def test_arquivo_leva_o_nome_de_exibicao_e_a_tarefa_o_login(tmp_path, monkeypatch):
+    import tarefas_relatorio
+    pedidos = []
+
+    def renderizar(pedido, processos):
+        pedidos.append(pedido)
+        with open(pedido['caminho'], 'w') as arquivo:
+            arquivo.write('pdf')
+
+    monkeypatch.setattr(tarefas_relatorio, 'renderizar', renderizar)
+    repo = _processos(str(tmp_path / 'relatorios.db'))
+    fila = FilaRelatorios(str(tmp_path / 'tarefas'))
+    tarefa_id = fila.submeter('ti', 'Teste', 'a.pdf', 'pdf', 'pdf', compilar_plano(['produto']), repo, nome_usuario='Maria TI')
+
+    assert _aguardar(fila, tarefa_id)['usuario'] == 'ti'
+    assert pedidos[0]['usuario'] == 'Maria TI'
+
+def test_falha_ou_estouro_de_tempo_nao_deixa_arquivo_parcial(tmp_path):
+    import os
+    repo = _processos(str(tmp_path / 'relatorios.db'))
+    plano = compilar_plano(['produto'])
+
+    sem_tabela = FilaRelatorios(str(tmp_path / 'a'), banco=str(tmp_path / 'vazio.db'))
+    lenta = FilaRelatorios(str(tmp_path / 'b'), banco=str(tmp_path / 'relatorios.db'), tempo_maximo=0.01)
+    for fila in (sem_tabela, lenta):
+        tarefa = _aguardar(fila, fila.submeter('ti', 'Teste', 'a.csv', 'csv', 'csv', plano, repo))
+        assert tarefa['estado'] == 'erro'
+        assert not any(nome.endswith('.csv') for nome in os.listdir(fila.diretorio))
+    assert 'não terminou' in tarefa['erro']
+
+def test_csv_sai_em_blocos_sem_montar_o_arquivo_inteiro(monkeypatch):
+    import relatorios
+    monkeypatch.setattr(relatorios, 'LINHAS_POR_BLOCO_CSV', 2)
+    lidas = []
+
+    def linhas():
+        for indice in range(5):
+            lidas.append(indice)
+            yield (f'P{indice}', 'ção')
+
+    fluxo = relatorios.gerar_csv(['Produto', 'Obs'], linhas())
+    primeiro = next(fluxo)
+    # O primeiro bloco sai antes de o gerador de linhas ser consumido
+    assert lidas == [0, 1]
+    texto = (primeiro + b''.join(fluxo)).decode('utf-8')
+    assert texto.splitlines() == ['\ufeffProduto;Obs'] + [f'P{indice};ção' for indice in range(5)]
+
+def test_arquivo_transmitido_e_removido_no_fim(tmp_path, monkeypatch):
+    import os
+    import relatorios
+    monkeypatch.setattr(relatorios, 'TAMANHO_BLOCO', 4)
+    caminho = tmp_path / 'r.csv'
+    caminho.write_bytes(b'0123456789')
+
+    assert list(relatorios.transmitir_arquivo(str(caminho))) == [b'0123', b'4567', b'89']
+    assert not os.path.exists(caminho)
+    assert relatorios.cabecalho_download('Relatório.csv') == "attachment; filename=\"Relatorio.csv\"; filename*=UTF-8''Relat%C3%B3rio.csv"
+
+def test_excel_grava_linhas_de_um_gerador(tmp_path):
+    from openpyxl import load_workbook
+    from relatorios import gravar_excel
+    caminho = str(tmp_path / 'r.xlsx')
+    gravar_excel(caminho, ['Produto'], ((f'P{indice}',) for indice in range(3)))
+    planilha = load_workbook(caminho).active
+    assert [linha[0] for linha in planilha.iter_rows(values_only=True)] == ['Produto', 'P0', 'P1', 'P2']
+
+def test_plano_projeta_so_os_campos_conhecidos_em_lotes():
+    plano = compilar_plano(['produto', 'inexistente', 'status_qualidade'], data_inicio='2025-01-02', equip_id=1)
+    assert plano is compilar_plano(['produto', 'inexistente', 'status_qualidade'], data_inicio='2025-01-02', equip_id=1)
+    assert plano.cabecalho == ['Produto', 'Status Qualidade']
+
+    processos = [
+        {'equipamento_id': 1, 'produto': 'A', 'data_finalizacao': '2025-01-01 10:00', 'status_qualidade': 'aprovado'},
+        {'equipamento_id': 1, 'produto': None, 'data_finalizacao': '2025-01-02 10:00', 'status_qualidade': 'pendente'},
+        {'equipamento_id': 2, 'produto': 'C', 'data_finalizacao': '2025-01-03 10:00', 'status_qualidade': 'rejeitado'},
+        {'equipamento_id': 1, 'produto': 'D', 'data_finalizacao': '2025-01-04 10:00'},
+    ]
+    assert list(plano.linhas(processos)) == [('', 'PENDENTE'), ('D', '')]
+    assert list(plano.lotes(processos, tamanho=1)) == [[[''], ['PENDENTE']], [['D'], ['']]]
@@ -0,0 +1,88 @@
+import repositorio
+from armazenamento import ArmazenamentoMemoria
+from repositorio import RepositorioEquipamentos, RepositorioProcessos, RepositorioSensores
+
+def _repo(quantidade):
+    repo = RepositorioProcessos([], ArmazenamentoMemoria())
+    for indice in range(1, quantidade + 1):
+        repo.adicionar({
+            'id': indice, 'equipamento_id': indice % 3, 'produto': f'P{indice}',
+            'data_finalizacao': f'2025-01-{indice % 28 + 1:02d} 10:00', 'status_qualidade': 'pendente'
+        })
+    return repo
+
+def _todas_as_paginas(repo, **kwargs):
+    ids, cursor = [], None
+    while True:
+        itens, cursor = repo.pagina_status_qualidade('pendente', cursor=cursor, limite=4, **kwargs)
+        ids.extend(item['id'] for item in itens)
+        if cursor is None:
+            return ids
+
+def test_paginas_por_cursor_cobrem_a_fila_sem_repetir():
+    repo = _repo(30)
+    assert _todas_as_paginas(repo) == list(range(1, 31))
+    assert _todas_as_paginas(repo, recentes_primeiro=True) == list(range(30, 0, -1))
+
+    repo.alterar_status_qualidade(repo.obter(5), 'aprovado')
+    assert 5 not in _todas_as_paginas(repo)
+    assert repo.pagina_status_qualidade('aprovado')[0] == [repo.obter(5)]
+
+def test_filtro_por_equipamento_usa_o_indice():
+    repo = _repo(30)
+    assert _todas_as_paginas(repo, equip_id=1) == [indice for indice in range(1, 31) if indice % 3 == 1]
+
+    repo.alterar_status_qualidade(repo.obter(4), 'rejeitado')
+    assert 4 not in _todas_as_paginas(repo, equip_id=1)
+    assert repo.pagina_status_qualidade('rejeitado', equip_id=1)[0] == [repo.obter(4)]
+    assert repo.pagina_status_qualidade('rejeitado', equip_id=2) == ([], None)
+
+def test_busca_rara_devolve_pagina_parcial_com_cursor(monkeypatch):
+    monkeypatch.setattr(repositorio, 'MAX_VARRIDOS', 5)
+    repo = _repo(30)
+
+    def filtro(item):
+        return item['produto'] == 'P27'
+
+    itens, cursor = repo.pagina_status_qualidade('pendente', limite=4, filtro=filtro)
+    assert itens == [] and cursor == 5
+    assert _todas_as_paginas(repo, filtro=filtro) == [27]
+
+def test_indices_de_equipamentos_acompanham_as_escritas():
+    equipamentos = [
+        {'id': 1, 'nome': 'Estufa 1', 'status': 'livre', 'sensor_id': 10},
+        {'id': 2, 'nome': 'Estufa 2', 'status': 'ocupada', 'sensor_id': None},
+    ]
+    repo = RepositorioEquipamentos(equipamentos, ArmazenamentoMemoria())
+    assert repo.por_status('livre') == [equipamentos[0]]
+    assert repo.sensor_em_uso(10) and not repo.sensor_em_uso(20)
+
+    versao = repo.versao
+    repo.alterar_status(repo.obter(1), 'ocupada')
+    repo.alterar_sensor(repo.obter(2), 20)
+    assert repo.versao > versao
+    assert repo.contagem_status() == {'livre': 0, 'ocupada': 2}
+    assert repo.por_sensor(20) == [equipamentos[1]] and repo.por_sensor(10) == [equipamentos[0]]
+
+    # Mesmo dict na lista e nos índices: os templates continuam iterando a lista
+    assert repo.obter(1) is equipamentos[0] and equipamentos[0]['status'] == 'ocupada'
+    repo.remover(repo.obter(1))
+    assert not repo.sensor_em_uso(10) and repo.contar_status('ocupada') == 1
+
+def test_ids_novos_continuam_depois_do_maior_existente():
+    repo = RepositorioSensores([{'id': 7, 'nome': 'S7'}], ArmazenamentoMemoria())
+    assert repo.adicionar({'nome': 'S8'})['id'] == 8
+    repo.descartar(7)
+    assert repo.obter(7) is None and len(repo) == 1
+
+def test_consulta_por_periodo_e_equipamento_pelos_indices():
+    repo = _repo(30)
+    assert [item['id'] for item in repo.consultar('2025-01-05', '2025-01-05')] == [4]
+    assert [item['id'] for item in repo.consultar('2025-01-27', equip_id=2)] == [26]
+    assert [item['id'] for item in repo.consultar(data_fim='2025-01-02')] == [28, 1, 29]
+    assert repo.consultar(equip_id=99) == []
+
+    # Processo reaplicado com outra data sai do dia antigo e entra no novo
+    repo.aplicar(dict(repo.obter(4), data_finalizacao='2025-02-01 08:00'))
+    assert repo.consultar('2025-01-05', '2025-01-05') == []
+    assert [item['id'] for item in repo.consultar('2025-02-01', equip_id=1)] == [4]
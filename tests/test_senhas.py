@@ -0,0 +1,47 @@
+import threading
+
+import senhas
+from armazenamento import ArmazenamentoSQLite
+from senhas import ServicoSenhas
+
+def _parametros(hash_senha):
+    return int(hash_senha.split('$')[1])
+
+def test_regrava_somente_hash_mais_fraco():
+    servico = ServicoSenhas(n=2 ** 14)
+
+    forte = ServicoSenhas(n=2 ** 15).gerar_hash('segredo')
+    assert servico.verificar('segredo', forte) == (True, None)
+
+    confere, novo = servico.verificar('segredo', ServicoSenhas(n=2 ** 13).gerar_hash('segredo'))
+    assert confere and _parametros(novo) == 2 ** 14
+
+    confere, novo = servico.verificar('segredo', 'segredo')
+    assert confere and novo.startswith('scrypt$')
+
+    assert servico.verificar('errada', forte) == (False, None)
+
+def test_custo_calibrado_uma_vez_para_todos_os_workers(tmp_path, monkeypatch):
+    calibracoes = []
+
+    def calibrar(alvo_ms):
+        calibracoes.append(threading.get_ident())
+        return 2 ** 14 * (len(calibracoes) + 1), 0.01
+
+    monkeypatch.setattr(senhas, 'calibrar', calibrar)
+    caminho = str(tmp_path / 'compartilhado.db')
+    servicos = [ServicoSenhas(n=None, armazenamento=ArmazenamentoSQLite(caminho)) for _ in range(4)]
+    threads = [threading.Thread(target=servico._pool) for servico in servicos]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calibracoes) == 1
+    assert {servico.n for servico in servicos} == {2 ** 15}
+
+def test_login_bloqueado_apos_falhas_seguidas(aplicacao):
+    cliente = aplicacao.app.test_client()
+    for _ in range(senhas.LIMITE_POR_USUARIO):
+        assert cliente.post('/login', data={'usuario': 'higienizacao', 'senha': 'errada'}).status_code == 200
+    assert cliente.post('/login', data={'usuario': 'higienizacao', 'senha': '123'}).status_code == 429
@@ -0,0 +1,48 @@
+from serie_temporal import SerieTemporal
+
+INICIO = 1700000000 - 1700000000 % 3600
+
+def _leituras(inicio, valores):
+    return [{'sensor_id': 1, 'timestamp': inicio + indice * 10, 'temperatura': valor} for indice, valor in enumerate(valores)]
+
+def test_intervalo_aberto_sobrevive_ao_reinicio(tmp_path):
+    series = SerieTemporal(str(tmp_path))
+    series.registrar_lote(_leituras(INICIO, [10.0, 20.0]))
+    series.fechar()
+
+    reiniciada = SerieTemporal(str(tmp_path))
+    reiniciada.registrar_lote(_leituras(INICIO + 100, [30.0, 40.0]))
+    reiniciada.fechar()
+
+    dados = SerieTemporal(str(tmp_path)).ler_rollup(1, 3600, INICIO, INICIO + 3599)
+    assert len(dados) == 1
+    assert dados['count'][0] == 4
+    assert (dados['min'][0], dados['max'][0], dados['avg'][0]) == (10.0, 40.0, 25.0)
+
+def test_segmento_removido_pela_retencao_durante_a_leitura(tmp_path, monkeypatch):
+    import os
+    import serie_temporal
+
+    series = SerieTemporal(str(tmp_path))
+    series.registrar_lote(_leituras(INICIO, [10.0, 20.0]))
+    series.fechar()
+    series = SerieTemporal(str(tmp_path))
+    fromfile = serie_temporal.np.fromfile
+
+    def remover_antes(caminho, dtype):
+        # A retenção de outro worker apaga o arquivo entre a busca e a leitura
+        os.remove(caminho)
+        return fromfile(caminho, dtype=dtype)
+
+    monkeypatch.setattr(serie_temporal.np, 'fromfile', remover_antes)
+    assert len(series.ler_bruto(1, INICIO, INICIO + 60)[0]) == 0
+    assert len(series.ler_rollup(1, 3600, INICIO, INICIO + 3599)) == 0
+
+def test_retencao_remove_segmentos_vencidos(tmp_path):
+    series = SerieTemporal(str(tmp_path))
+    series.registrar_lote(_leituras(INICIO, [10.0, 20.0]))
+    series.fechar()
+
+    series.aplicar_retencao(agora=INICIO + 400 * 86400)
+    assert len(series.ler_bruto(1, INICIO, INICIO + 60)[0]) == 0
+    assert series.consultar(1, INICIO, INICIO + 60, resolucao=0)['estatisticas']['amostras'] == 0
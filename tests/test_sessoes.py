@@ -0,0 +1,35 @@
+def test_desativar_usuario_encerra_todas_as_sessoes(aplicacao, logar):
+    celular, computador = logar('manutencao'), logar('manutencao')
+    assert celular.get('/dashboard').status_code == 200
+
+    ti = logar('ti')
+    ti.post('/gerenciar_usuarios', data={'acao': 'ativar_desativar', 'username': 'manutencao'})
+    try:
+        for cliente in (celular, computador):
+            resposta = cliente.get('/dashboard')
+            assert resposta.status_code == 302
+            assert resposta.headers['Location'].endswith('/login')
+    finally:
+        ti.post('/gerenciar_usuarios', data={'acao': 'ativar_desativar', 'username': 'manutencao'})
+    assert aplicacao.usuarios['manutencao']['ativo']
+
+def test_sessao_encerrada_nao_e_regravada_pela_requisicao_em_andamento(tmp_path):
+    from sessoes import ArmazemSessoesMemoria, ArmazemSessoesSQLite
+    for armazem in (ArmazemSessoesMemoria(), ArmazemSessoesSQLite(str(tmp_path / 'sessoes.db'))):
+        armazem.gravar('s1', 'manutencao', '{}', 9e9)
+        armazem.encerrar_usuario('manutencao')
+        # save_session da requisição que começou antes do encerramento
+        assert not armazem.atualizar('s1', 'manutencao', '{"x": 1}', 9e9)
+        assert armazem.obter('s1') is None
+
+def test_sessao_de_usuario_inativo_e_recusada(aplicacao, logar):
+    cliente = logar('operador')
+    # Desativado sem passar pela rota (ex.: outro worker, sessão ainda no armazém)
+    aplicacao.usuarios['operador']['ativo'] = False
+    try:
+        resposta = cliente.get('/dashboard')
+        assert resposta.status_code == 302
+        assert resposta.headers['Location'].endswith('/login')
+    finally:
+        aplicacao.usuarios['operador']['ativo'] = True
+    assert cliente.get('/dashboard').status_code == 302
@@ -0,0 +1,27 @@
+import time
+
+from aquisicao import _leitura_erro
+
+def test_lote_de_temperaturas_responde_304_sem_mudanca(aplicacao, logar):
+    cliente = logar('ti')
+    sem_sensor = next(e for e in aplicacao.equipamentos if not e.get('sensor_id'))
+
+    resposta = cliente.get('/api/temperaturas', query_string={'ids': f'{sem_sensor["id"]},999999,x'})
+    assert resposta.status_code == 200
+    assert list(resposta.get_json()['equipamentos']) == [str(sem_sensor['id'])]
+    etag = resposta.headers['ETag']
+
+    # Nenhum sensor envolvido: a versão só muda se os repositórios mudarem
+    repetida = cliente.get('/api/temperaturas', query_string={'ids': str(sem_sensor['id'])}, headers={'If-None-Match': etag})
+    assert repetida.status_code == 304
+    assert repetida.headers['ETag'] == etag
+
+def test_lote_de_temperaturas_le_do_cache(aplicacao, logar):
+    cliente = logar('ti')
+    equip = next(e for e in aplicacao.equipamentos if e.get('sensor_id') and e.get('ativo', True))
+    aplicacao.cache_leituras.gravar(equip['sensor_id'], _leitura_erro(equip['sensor_id'], 'Canal sem resposta', time.time()))
+
+    dados = cliente.get('/api/temperaturas').get_json()['equipamentos'][str(equip['id'])]
+    assert dados['sensor_id'] == equip['sensor_id']
+    # A aquisição pode ter gravado uma leitura nova entre as duas chamadas
+    assert dados.get('erro') == 'Canal sem resposta' or 'temperatura' in dados
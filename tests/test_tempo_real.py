@@ -0,0 +1,33 @@
+from tempo_real import Difusor, fluxo_sse
+
+def test_novo_assinante_recebe_a_foto_atual_filtrada():
+    difusor = Difusor()
+    difusor.publicar(('temperatura', 1), 'temperatura', {'id': 1, 'valor': 20.0})
+    difusor.publicar(('temperatura', 2), 'temperatura', {'id': 2, 'valor': 30.0})
+    difusor.descartar(('temperatura', 2))
+
+    assinante = difusor.assinar(filtro={('temperatura', 1), ('temperatura', 2)})
+    assert assinante.aguardar(0) == [('temperatura', {'id': 1, 'valor': 20.0})]
+
+    difusor.publicar(('status', 1), 'status', {'id': 1})
+    difusor.publicar(('temperatura', 2), 'temperatura', {'id': 2, 'valor': 31.0})
+    assert assinante.aguardar(0) == [('temperatura', {'id': 2, 'valor': 31.0})]
+
+def test_assinante_lento_recebe_so_o_ultimo_valor_de_cada_chave():
+    difusor = Difusor()
+    assinante = difusor.assinar()
+    for valor in (20.0, 21.0, 22.0):
+        difusor.publicar('a', 'temperatura', {'valor': valor})
+    difusor.publicar('b', 'status', {'status': 'livre'})
+    assert assinante.aguardar(0) == [('temperatura', {'valor': 22.0}), ('status', {'status': 'livre'})]
+
+def test_fluxo_encerrado_cancela_a_assinatura():
+    difusor = Difusor()
+    assinante = difusor.assinar()
+    difusor.publicar('a', 'temperatura', {'valor': 20.0})
+    fluxo = fluxo_sse(difusor, assinante)
+
+    assert next(fluxo).startswith('retry:')
+    assert next(fluxo) == 'event: temperatura\ndata: {"valor": 20.0}\n\n'
+    fluxo.close()
+    assert difusor.total_assinantes == 0 and assinante.encerrado
@@ -0,0 +1,59 @@
+import csv
+import json
+import os
+import sys
+
+from armazenamento import ler_processos
+from relatorios import compilar_plano, gravar_excel, gravar_pdf
+
+# Ponto de entrada dos processos que renderizam relatórios:
+#   python -m trabalhador_relatorios <pedido.json>
+# O pedido traz só o plano (campos e filtros) e o caminho do banco; o filho
+# faz a consulta e escreve as linhas no arquivo à medida que as lê. Nada do
+# app.py (coleções, threads de aquisição, log de eventos) é carregado aqui.
+
+LINHAS_POR_PROGRESSO = 1000
+
+class FonteSQLite:
+    # Mesma interface de consulta do RepositorioProcessos, lendo do banco
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+    def consultar(self, data_inicio=None, data_fim=None, equip_id=None):
+        return ler_processos(self.caminho, data_inicio, data_fim, equip_id)
+
+def _com_progresso(linhas, caminho_progresso):
+    for indice, linha in enumerate(linhas, 1):
+        if indice % LINHAS_POR_PROGRESSO == 0:
+            with open(caminho_progresso, 'w') as arquivo:
+                arquivo.write(str(indice))
+        yield linha
+
+def renderizar(pedido, processos):
+    plano = compilar_plano(pedido['campos'], **pedido['filtros'])
+    linhas = _com_progresso(plano.linhas(processos), pedido['progresso'])
+    caminho = pedido['caminho']
+    if pedido['formato'] == 'excel':
+        gravar_excel(caminho, plano.cabecalho, linhas)
+    elif pedido['formato'] == 'pdf':
+        gravar_pdf(caminho, pedido['titulo'], pedido['usuario'], plano.cabecalho, linhas)
+    else:
+        with open(caminho, 'w', newline='', encoding='utf-8-sig') as arquivo:
+            escritor = csv.writer(arquivo, delimiter=';')
+            escritor.writerow(plano.cabecalho)
+            escritor.writerows(linhas)
+    return os.path.getsize(caminho)
+
+def main(caminho_pedido):
+    # Prioridade menor que a dos workers web
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+    with open(caminho_pedido, encoding='utf-8') as arquivo:
+        pedido = json.load(arquivo)
+    renderizar(pedido, FonteSQLite(pedido['banco']))
+
+if __name__ == '__main__':
+    main(sys.argv[1])